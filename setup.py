@@ -37,6 +37,10 @@ from setup_app.utils import base
 # we will access args via base module
 base.argsp = argsp
 
+from setup_app.utils.profiler import profiler
+if argsp.profile_trace is not None:
+    profiler.enable(argsp.profile_trace or os.path.join(paths.LOG_DIR, 'setup_trace.json'))
+
 from setup_app.utils.package_utils import packageUtils
 packageUtils.check_and_install_packages()
 
@@ -56,29 +60,17 @@ from setup_app.utils.progress import gluuProgress
 from setup_app.setup_options import get_setup_options
 from setup_app.utils import printVersion
 
-from setup_app.test_data_loader import TestDataLoader
 from setup_app.utils.properties_utils import propertiesUtils
 from setup_app.utils.setup_utils import SetupUtils
 from setup_app.utils.collect_properties import CollectProperties
+from setup_app.utils.installer_scheduler import InstallerScheduler
+from setup_app.utils.db_metrics import dbMetrics
+from setup_app.utils.resource_planner import resourcePlanner
 
-from setup_app.installers.gluu import GluuInstaller
-from setup_app.installers.httpd import HttpdInstaller
-from setup_app.installers.opendj import OpenDjInstaller
-from setup_app.installers.couchbase import CouchbaseInstaller
-from setup_app.installers.jre import JreInstaller
-from setup_app.installers.jetty import JettyInstaller
-from setup_app.installers.jython import JythonInstaller
-from setup_app.installers.node import NodeInstaller
-from setup_app.installers.oxauth import OxauthInstaller
-from setup_app.installers.oxtrust import OxtrustInstaller
-from setup_app.installers.scim import ScimInstaller
-from setup_app.installers.passport import PassportInstaller
-from setup_app.installers.fido import FidoInstaller
-from setup_app.installers.saml import SamlInstaller
-from setup_app.installers.radius import RadiusInstaller
-from setup_app.installers.oxd import OxdInstaller
-from setup_app.installers.casa import CasaInstaller
-from setup_app.installers.rdbm import RDBMInstaller
+# installer modules are imported when installers are initialized, so that
+# maintenance commands exiting early don't import them. Installers which were
+# not initialized can be accessed through base.current_app
+from setup_app.installers import get_installer_class
 
 
 # initialize config object
@@ -105,7 +97,10 @@ except Exception:
 queue = Queue()
 GSA = None
 
-if (not argsp.c) and sys.stdout.isatty() and (int(tty_rows) > 24) and (int(tty_columns) > 79):
+# maintenance commands exit before TUI would start
+maintenance_command = argsp.x or argsp.shell or argsp.plan_only
+
+if (not argsp.c) and (not maintenance_command) and sys.stdout.isatty() and (int(tty_rows) > 24) and (int(tty_columns) > 79):
     try:
         import npyscreen
     except Exception:
@@ -126,10 +121,7 @@ for key in setupOptions:
     setattr(Config, key, setupOptions[key])
 
 
-gluuInstaller = GluuInstaller()
-
-
-if not GSA and not os.path.exists(Config.gluu_properties_fn):
+if not (GSA or maintenance_command) and not os.path.exists(Config.gluu_properties_fn):
     print()
     print("Installing Gluu Server...\n\nFor more info see:\n  {}  \n  {}\n".format(paths.LOG_FILE, paths.LOG_ERROR_FILE))
     print("Detected OS     :  {}".format(base.get_os_description()))
@@ -169,6 +161,13 @@ if os.path.exists(Config.gluu_properties_fn):
         sys.exit()
 
 
+# plan is made of loaded properties, without prompts
+if argsp.plan_only:
+    base.current_app.JettyInstaller.calculate_selected_aplications_memory()
+    print(resourcePlanner.report())
+    sys.exit()
+
+
 if not Config.noPrompt and not GSA and not Config.installed_instance and not setup_loaded:
     propertiesUtils.promptForProperties()
 
@@ -176,28 +175,6 @@ if not Config.noPrompt and not GSA and not Config.installed_instance and not set
 if not (GSA or base.argsp.dummy):
     propertiesUtils.check_properties()
 
-# initialize installers, order is important!
-jreInstaller = JreInstaller()
-jettyInstaller = JettyInstaller()
-jythonInstaller = JythonInstaller()
-nodeInstaller = NodeInstaller()
-openDjInstaller = OpenDjInstaller()
-couchbaseInstaller = CouchbaseInstaller()
-rdbmInstaller = RDBMInstaller()
-httpdinstaller = HttpdInstaller()
-oxauthInstaller = OxauthInstaller()
-oxtrustInstaller = OxtrustInstaller()
-oxdInstaller = OxdInstaller()
-fidoInstaller = FidoInstaller()
-scimInstaller = ScimInstaller()
-samlInstaller = SamlInstaller()
-casaInstaller = CasaInstaller()
-passportInstaller = PassportInstaller()
-radiusInstaller = RadiusInstaller()
-
-rdbmInstaller.packageUtils = packageUtils
-
-
 
 if Config.installed_instance:
 
@@ -205,18 +182,60 @@ if Config.installed_instance:
 
     if argsp.enable_script:
         print("Enabling scripts {}".format(', '.join(argsp.enable_script)))
-        gluuInstaller.enable_scripts(argsp.enable_script)
+        base.current_app.GluuInstaller.enable_scripts(argsp.enable_script)
         exit_after_me = True
 
     if argsp.ox_authentication_mode or argsp.ox_trust_authentication_mode:
         print("Setting Authentication Modes")
-        gluuInstaller.set_auth_modes()
+        base.current_app.GluuInstaller.set_auth_modes()
         exit_after_me = True
 
     if exit_after_me:
         sys.exit()
 
 
+if argsp.x:
+    from setup_app.test_data_loader import TestDataLoader
+    testDataLoader = TestDataLoader()
+    print("Loading test data")
+    testDataLoader.dbUtils.bind()
+    testDataLoader.createLdapPw()
+    testDataLoader.load_test_data()
+    testDataLoader.deleteLdapPw()
+    dbMetrics.dump(paths.LOG_DIR)
+    print("Test data loaded. Exiting ...")
+    sys.exit()
+
+if argsp.shell:
+    code.interact(local=locals())
+    sys.exit()
+
+
+# initialize installers, order is important!
+gluuInstaller = get_installer_class('GluuInstaller')()
+jreInstaller = get_installer_class('JreInstaller')()
+jettyInstaller = get_installer_class('JettyInstaller')()
+jythonInstaller = get_installer_class('JythonInstaller')()
+nodeInstaller = get_installer_class('NodeInstaller')()
+openDjInstaller = get_installer_class('OpenDjInstaller')()
+couchbaseInstaller = get_installer_class('CouchbaseInstaller')()
+rdbmInstaller = get_installer_class('RDBMInstaller')()
+httpdinstaller = get_installer_class('HttpdInstaller')()
+oxauthInstaller = get_installer_class('OxauthInstaller')()
+oxtrustInstaller = get_installer_class('OxtrustInstaller')()
+oxdInstaller = get_installer_class('OxdInstaller')()
+fidoInstaller = get_installer_class('FidoInstaller')()
+scimInstaller = get_installer_class('ScimInstaller')()
+samlInstaller = get_installer_class('SamlInstaller')()
+casaInstaller = get_installer_class('CasaInstaller')()
+passportInstaller = get_installer_class('PassportInstaller')()
+radiusInstaller = get_installer_class('RadiusInstaller')()
+
+rdbmInstaller.packageUtils = packageUtils
+
+
+if Config.installed_instance:
+
     for installer in (openDjInstaller, couchbaseInstaller, httpdinstaller, 
                         oxauthInstaller, passportInstaller, scimInstaller, 
                         fidoInstaller, samlInstaller, oxdInstaller, 
@@ -255,20 +274,11 @@ if Config.installed_instance:
             print("No service was selected to install. Exiting ...")
             sys.exit()
 
-if argsp.t or argsp.x:
+if argsp.t:
+    from setup_app.test_data_loader import TestDataLoader
     testDataLoader = TestDataLoader()
 
 
-if argsp.x:
-    print("Loading test data")
-    testDataLoader.dbUtils.bind()
-    testDataLoader.createLdapPw()
-    testDataLoader.load_test_data()
-    testDataLoader.deleteLdapPw()
-    print("Test data loaded. Exiting ...")
-    sys.exit()
-
-
 if not GSA:
 
     if Config.ldap_install == static.InstallTypes.LOCAL and not Config.installed_instance:
@@ -304,11 +314,6 @@ gluuProgress.register(PostSetup)
 if not argsp.no_progress:
     gluuProgress.queue = queue
 
-if argsp.shell:
-    code.interact(local=locals())
-    sys.exit()
-
-
 def prepare_for_installation():
 
     gluuInstaller.initialize()
@@ -347,12 +352,21 @@ def prepare_for_installation():
 
 def install_services():
 
+    service_installers = []
     for instance in (httpdinstaller, oxauthInstaller, oxtrustInstaller,
                     fidoInstaller, scimInstaller, samlInstaller,
                     oxdInstaller, casaInstaller, passportInstaller):
 
         if (Config.installed_instance and instance.install_var in Config.addPostSetupService) or (not Config.installed_instance and getattr(Config, instance.install_var)):
-            instance.start_installation()
+            service_installers.append(instance)
+
+    serviceScheduler = InstallerScheduler(service_installers)
+
+    # downloads of services are independent of each other
+    serviceScheduler.run('check_for_download', max_workers=Config.installer_workers, respect_dependencies=False)
+
+    # services share backend connection and rendering dictionary, install them one by one
+    serviceScheduler.run()
 
     if not Config.installed_instance and Config.profile != static.SetupProfiles.DISA_STIG:
         # this will install only base
@@ -393,11 +407,11 @@ def post_install():
 
 def app_installations():
 
-    jreInstaller.start_installation()
-    jettyInstaller.start_installation()
-    jythonInstaller.start_installation()
+    app_installers = [jreInstaller, jettyInstaller, jythonInstaller]
     if Config.profile == static.SetupProfiles.CE:
-        nodeInstaller.start_installation()
+        app_installers.append(nodeInstaller)
+
+    InstallerScheduler(app_installers).run(max_workers=Config.installer_workers)
 
 
 def do_installation():
@@ -414,15 +428,28 @@ def do_installation():
             if not base.argsp.dummy:
                 gluuInstaller.make_salt()
                 oxauthInstaller.make_salt()
-                app_installations()
-                prepare_for_installation()
+                with profiler.span('app_installations'):
+                    app_installations()
+                with profiler.span('prepare_for_installation'):
+                    prepare_for_installation()
         else:
             gluuInstaller.determine_key_gen_path()
 
-        install_services()
+        with profiler.span('install_services'):
+            install_services()
 
         if not base.argsp.dummy:
-            post_install()
+            with profiler.span('post_install'):
+                post_install()
+
+        dbMetrics.dump(paths.LOG_DIR)
+        base.logIt("Backend operation metrics:\n" + dbMetrics.to_json())
+
+        if profiler.enabled:
+            trace_fn = profiler.write_trace()
+            summary = profiler.summary()
+            base.logIt("Setup profile summary:\n" + summary)
+            Config.post_messages.append("Setup trace was written to {}, top phases:\n{}".format(trace_fn, summary))
 
         gluuProgress.progress(static.COMPLETED)
 
@@ -14,7 +14,20 @@ from setup_app.static import InstallTypes, SetupProfiles
 from setup_app.utils.printVersion import get_war_info
 from setup_app.utils import base
 
-class Config:
+class ConfigMeta(type):
+    # counts attribute assignments, cached template rendering contexts are rebuilt on change
+    changes = 0
+
+    def __setattr__(cls, name, value):
+        type.__setattr__(cls, name, value)
+        ConfigMeta.changes += 1
+
+    def __delattr__(cls, name):
+        type.__delattr__(cls, name)
+        ConfigMeta.changes += 1
+
+
+class Config(metaclass=ConfigMeta):
 
     # we define statics here so that is is acessible without construction
     gluuOptFolder = '/opt/gluu'
@@ -95,6 +108,8 @@ class Config:
         self.distAppFolder = os.path.join(self.distFolder, 'app')
         self.distGluuFolder = os.path.join(self.distFolder, 'gluu')
         self.distTmpFolder = os.path.join(self.distFolder, 'tmp')
+        self.download_cache_dir = os.path.join(self.distFolder, 'cache')
+        self.download_cache_size = 2048 # MB, least recently used artifacts are removed from cache above this size
         self.ldapBinFolder = os.path.join(self.ldapBaseFolder, 'bin')
 
         if self.profile == SetupProfiles.DISA_STIG:
@@ -180,18 +195,26 @@ class Config:
         self.rdbm_user = None
         self.rdbm_password = None
         self.static_rdbm_dir = os.path.join(self.install_dir, 'static/rdbm')
+        self.rdbm_batch_size = 1000 # number of rows inserted per transaction while importing ldif
+        self.rdbm_index_workers = 4 # maximum number of PostgreSQL tables indexed concurrently
 
         #spanner
         self.spanner_project = 'gluu-project'
         self.spanner_instance = 'gluu-instance'
         self.spanner_database = 'gluudb' 
         self.spanner_emulator_host = None
+        self.spanner_column_indexes = False # create indexes of columns listed in static/rdbm/spanner_index.json, setup did not create them so far
         self.google_application_credentials = None
 
         #couchbase
         self.couchbaseBuckets = []
+        self.couchbase_batch_size = 100 # number of documents upserted with a single N1QL statement
+        self.search_page_size = 1000 # number of entries fetched per round trip by DBUtils.iter_search
 
         # Gluu components installation status
+        self.installer_workers = 4 # maximum number of installers running concurrently
+        self.permission_workers = 8 # threads walking directory trees while applying ownership and permissions
+        self.cert_workers = 4 # maximum number of certificates generated concurrently
         self.loadData = True
         self.installGluu = True
         self.installJre = True
@@ -270,6 +293,8 @@ class Config:
         self.ldap_port = '1389'
         self.ldaps_port = '1636'
         self.ldap_admin_port = '4444'
+        self.ldap_import_connections = 4 # number of asynchronous connections used by LDAPWriter while importing ldif
+        self.ldap_import_in_flight = 64 # maximum number of LDAP operations waiting for response while importing ldif
 
         self.ldap_user_home = self.ldapBaseFolder
         self.ldapPassFn = os.path.join(self.ldap_user_home, '.pw')
@@ -365,17 +390,23 @@ class Config:
             self.opendj_ram = 1500 #MB
 
         self.app_mem_weigths = {
-                'opendj':    {'weigth' : 75, "min" : 512},
-                'oxauth':    {'weigth' : 50, "min" : 128},
-                'identity':  {'weigth' : 75, "min" : 128},
-                'idp':       {'weigth' : 25, "min" : 128},
+                'opendj':    {'weigth' : 75, "min" : 512, "metaspace": 128},
+                'oxauth':    {'weigth' : 50, "min" : 128, "metaspace": 192},
+                'identity':  {'weigth' : 75, "min" : 128, "metaspace": 256},
+                'idp':       {'weigth' : 25, "min" : 128, "metaspace": 192, "gc": "ParallelGC", "jvm_opts": ["-XX:MaxGCPauseMillis=400"]},
                 'passport':  {'weigth' : 10, "min" : 128},
-                'casa':      {'weigth' : 15, "min" : 128},
-                'fido2':     {'weigth' : 10, "min" : 128},
-                'scim':      {'weigth' : 10, "min" : 128},
-                'oxd':       {'weigth' : 10, "min" : 128},
+                'casa':      {'weigth' : 15, "min" : 128, "metaspace": 128},
+                'fido2':     {'weigth' : 10, "min" : 128, "metaspace": 96},
+                'scim':      {'weigth' : 10, "min" : 128, "metaspace": 96},
+                'oxd':       {'weigth' : 10, "min" : 128, "metaspace": 256},
             }
 
+        self.httpd_ram = 128 # MB reserved for Apache
+        self.node_overhead_ram = 64 # MB reserved for node process of passport besides its heap
+        self.jvm_max_direct_memory = 64 # MB, MaxDirectMemorySize of each JVM
+        self.jvm_overhead_ram = 48 # MB reserved for code cache, thread stacks and GC structures of each JVM
+        self.g1gc_min_heap = 1024 # MB, JVMs with smaller heaps use ParallelGC
+
         self.couchbaseBucketDict = OrderedDict((
                         ('default', { 'ldif':[
                                             self.ldif_base, 
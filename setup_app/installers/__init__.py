@@ -0,0 +1,29 @@
+import importlib
+
+# installer classes and their modules, a module is imported when its
+# installer is requested first
+installer_modules = {
+    'GluuInstaller': 'gluu',
+    'HttpdInstaller': 'httpd',
+    'OpenDjInstaller': 'opendj',
+    'CouchbaseInstaller': 'couchbase',
+    'JreInstaller': 'jre',
+    'JettyInstaller': 'jetty',
+    'JythonInstaller': 'jython',
+    'NodeInstaller': 'node',
+    'OxauthInstaller': 'oxauth',
+    'OxtrustInstaller': 'oxtrust',
+    'ScimInstaller': 'scim',
+    'PassportInstaller': 'passport',
+    'FidoInstaller': 'fido',
+    'SamlInstaller': 'saml',
+    'RadiusInstaller': 'radius',
+    'OxdInstaller': 'oxd',
+    'CasaInstaller': 'casa',
+    'RDBMInstaller': 'rdbm',
+}
+
+
+def get_installer_class(class_name):
+    module = importlib.import_module('setup_app.installers.' + installer_modules[class_name])
+    return getattr(module, class_name)
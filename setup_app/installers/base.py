@@ -3,6 +3,7 @@ import uuid
 import inspect
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from distutils.version import LooseVersion
 
 from setup_app import paths
@@ -11,12 +12,15 @@ from setup_app.utils import base
 from setup_app.config import Config
 from setup_app.utils.db_utils import dbUtils
 from setup_app.utils.progress import gluuProgress
+from setup_app.utils.profiler import profiler
 from setup_app.utils.printVersion import get_war_info
 
 
 class BaseInstaller:
     needdb = True
     dbUtils = dbUtils
+    dependencies = () # service names of installers that should be installed before this one
+    downloads_checked = False
 
     def register_progess(self):
         gluuProgress.register(self)
@@ -31,11 +35,11 @@ class BaseInstaller:
         if self.needdb and not base.argsp.dummy:
             self.dbUtils.bind()
 
-        self.pre_install()
+        self.run_phase('pre_install')
 
-        self.check_for_download()
+        self.run_phase('check_for_download')
 
-        self.create_user()
+        self.run_phase('create_user')
 
         if not hasattr(self, 'service_user'):
             if Config.profile == static.SetupProfiles.DISA_STIG:
@@ -43,25 +47,29 @@ class BaseInstaller:
             else:
                 self.service_user = Config.jetty_user
 
-        self.profile_templates()
+        self.run_phase('profile_templates')
 
-        self.create_folders()
+        self.run_phase('create_folders')
 
-        self.install()
+        self.run_phase('install')
         if not base.argsp.dummy:
-            self.copy_static()
-            self.generate_configuration()
+            self.run_phase('copy_static')
+            self.run_phase('generate_configuration')
 
             # before rendering templates, let's push variables of this class to Config.templateRenderingDict
-            self.update_rendering_dict()
+            self.run_phase('update_rendering_dict')
 
-            self.render_import_templates()
-            self.update_backend()
+            self.run_phase('render_import_templates')
+            self.run_phase('update_backend')
 
         if Config.profile == static.SetupProfiles.DISA_STIG and self.service_name != 'jetty' and hasattr(self, 'jetty_home'):
             self.run([paths.cmd_chown, '-R', '{}:{}'.format(self.service_user, Config.gluu_group), os.path.join(self.jetty_base, self.service_user)])
 
 
+    def run_phase(self, phase):
+        with profiler.span(phase, 'installer', installer=self.service_name):
+            getattr(self, phase)()
+
     def profile_templates(self, temp_dir=None, recursive=False):
         if not temp_dir:
             if not hasattr(self, 'templates_folder'):
@@ -158,22 +166,29 @@ class BaseInstaller:
 
 
     def check_for_download(self):
-        # execute for each installer
+        # execute for each installer, downloads may be checked in advance
+        if self.downloads_checked:
+            return
+        self.downloads_checked = True
+
         if Config.downloadWars:
             self.download_files(force=True)
             
         elif Config.installed_instance:
             self.download_files()
 
-    def download_file(self, url, src):
+    def download_file(self, url, src, checksum=None):
         Config.pbar.progress(self.service_name, "Downloading {}".format(os.path.basename(src)))
-        base.download(url, src)
+        base.download(url, src, checksum)
 
     def download_files(self, force=False, downloads=[]):
         if hasattr(self, 'source_files'):
+            download_list = []
             for i, item in enumerate(self.source_files[:]):
                 src = item[0]
                 url = item[1]
+                # optional checksum in form algorithm:hexdigest
+                checksum = item[2] if len(item) > 2 else None
                 src_name = os.path.basename(src)
 
                 if downloads and src_name not in downloads:
@@ -181,8 +196,12 @@ class BaseInstaller:
 
                 if force or self.check_download_needed(src):
                     src = os.path.join(Config.distGluuFolder, src_name)
-                    self.source_files[i] = (src, url)
-                    self.download_file(url, src)
+                    self.source_files[i] = (src, url) + tuple(item[2:])
+                    download_list.append((url, src, checksum))
+
+            if download_list:
+                with ThreadPoolExecutor(max_workers=Config.installer_workers) as pool:
+                    list(pool.map(lambda download: self.download_file(*download), download_list))
 
     def check_download_needed(self, src):
         froot, fext = os.path.splitext(src)
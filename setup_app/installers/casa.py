@@ -22,6 +22,7 @@ class CasaInstaller(JettyInstaller):
         self.app_type = AppType.SERVICE
         self.install_type = InstallOption.OPTONAL
         self.install_var = 'installCasa'
+        self.dependencies = ('oxauth', 'oxd-server')
         self.register_progess()
 
         self.source_files = [
@@ -12,6 +12,7 @@ from setup_app.config import Config
 from setup_app.utils import base
 from setup_app.utils.cbm import CBM
 from setup_app.utils.package_utils import PackageUtils
+from setup_app.utils.index_scheduler import IndexScheduler
 from setup_app.installers.base import BaseInstaller
 
 
@@ -208,7 +209,7 @@ class CouchbaseInstaller(PackageUtils, BaseInstaller):
             attrquoteds = ', '.join(attrquoted)
 
             index_name = '{0}_static_{1}'.format(bucket, str(uuid.uuid4()).split('-')[1])
-            cmd = 'CREATE INDEX `{0}` ON `{1}`({2}) WHERE ({3})'.format(index_name, bucket, attrquoteds, wherec)
+            cmd = 'CREATE INDEX `{0}` ON `{1}`({2}) WHERE ({3}) USING GSI WITH {{"defer_build":true}}'.format(index_name, bucket, attrquoteds, wherec)
 
         else:
             if '(' in ''.join(ind):
@@ -237,19 +238,25 @@ class CouchbaseInstaller(PackageUtils, BaseInstaller):
 
         index_list = couchbase_index.get(bucket,{})
 
+        # all indexes are created deferred and built with a single BUILD INDEX statement
+        index_scheduler = IndexScheduler('couchbase')
         index_names = []
-        for ind in index_list['attributes']:
+        for ind in index_list['attributes'] + index_list['static']:
             n1ql, index_name = self.couchbaseMakeIndex(bucket, ind)
-            self.exec_n1ql_query(n1ql)
-            index_names.append(index_name)
-
-        for ind in index_list['static']:
-            n1ql, index_name = self.couchbaseMakeIndex(bucket, ind)
-            self.exec_n1ql_query(n1ql)
+            index_scheduler.add(bucket, n1ql)
+            index_names.append('`{}`'.format(index_name))
 
         if index_names:
             n1ql = 'BUILD INDEX ON `%s` (%s) USING GSI' % (bucket, ', '.join(index_names))
-            self.exec_n1ql_query(n1ql)
+            index_scheduler.add(bucket, n1ql)
+
+        index_scheduler.report()
+
+        def exec_bucket_queries(bucket, queries):
+            for n1ql in queries:
+                self.exec_n1ql_query(n1ql)
+
+        index_scheduler.run(exec_bucket_queries)
 
 
     def checkIfGluuBucketReady(self):
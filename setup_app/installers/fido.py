@@ -17,6 +17,7 @@ class FidoInstaller(JettyInstaller):
         self.app_type = AppType.SERVICE
         self.install_type = InstallOption.OPTONAL
         self.install_var = 'installFido2'
+        self.dependencies = ('oxauth',)
         self.register_progess()
 
         self.source_files = [
@@ -15,7 +15,9 @@ from setup_app.utils import base
 from setup_app.static import InstallTypes, AppType, InstallOption, SetupProfiles
 from setup_app.config import Config
 from setup_app.utils.setup_utils import SetupUtils
+from setup_app.utils.template_engine import templateEngine
 from setup_app.utils.progress import gluuProgress
+from setup_app.utils.permissions import permissionPlanner
 from setup_app.installers.base import BaseInstaller
 
 class GluuInstaller(BaseInstaller, SetupUtils):
@@ -166,8 +168,8 @@ class GluuInstaller(BaseInstaller, SetupUtils):
                 self.run([paths.cmd_mkdir, '-p', folder])
 
 
-        self.run([paths.cmd_chown, '-R', '{}:{}'.format(Config.root_user, Config.gluu_user), Config.certFolder])
-        self.run([paths.cmd_chmod, '551', Config.certFolder])
+        permissionPlanner.change(Config.certFolder, Config.root_user, Config.gluu_user, recursive=True)
+        permissionPlanner.change(Config.certFolder, mode='551')
         self.run([paths.cmd_chmod, 'ga+w', "/tmp"]) # Allow write to /tmp
 
     def customiseSystem(self):
@@ -216,12 +218,14 @@ class GluuInstaller(BaseInstaller, SetupUtils):
         if Config.persistence_type in ('couchbase', 'sql', 'spanner'):
             Config.ce_templates[Config.ox_ldap_properties] = False
 
-        for fullPath in templates:
+        def render_template(fullPath):
             try:
                 self.renderTemplate(fullPath)
             except:
                 self.logIt("Error writing template %s" % fullPath, True)
 
+        templateEngine.map(render_template, templates)
+
 
     def render_configuration_template(self):
         self.logIt("Rendering configuration templates")
@@ -389,15 +393,16 @@ class GluuInstaller(BaseInstaller, SetupUtils):
         output_dir_p = Path(ldif_dir + '.output')
         self.logIt("Rendering custom templates from {} to {}".format(ldif_dir, output_dir_p))
 
-        for p in Path(ldif_dir).rglob('*'):
-            if p.is_file():
-                out_file_p = output_dir_p.joinpath(p.relative_to(ldif_dir))
-                if not out_file_p.parent.exists():
-                    out_file_p.parent.mkdir(parents=True)
-                try:
-                    self.renderTemplateInOut(p.as_posix(), p.parent.as_posix(), out_file_p.parent.as_posix())
-                except Exception:
-                    self.logIt("Error writing template {}".format(out_file_p), True)
+        def render_template(p):
+            out_file_p = output_dir_p.joinpath(p.relative_to(ldif_dir))
+            if not out_file_p.parent.exists():
+                out_file_p.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                self.renderTemplateInOut(p.as_posix(), p.parent.as_posix(), out_file_p.parent.as_posix())
+            except Exception:
+                self.logIt("Error writing template {}".format(out_file_p), True)
+
+        templateEngine.map(render_template, [p for p in Path(ldif_dir).rglob('*') if p.is_file()])
 
 
     def import_custom_ldif_dir(self, ldif_dir):
@@ -426,24 +431,27 @@ class GluuInstaller(BaseInstaller, SetupUtils):
 
         self.deleteLdapPw()
 
+        # ownership and permissions are collected and applied with a single walk
         for f in os.listdir(Config.certFolder):
             if not f.startswith('passport-'):
                 fpath = os.path.join(Config.certFolder, f)
-                self.chown(fpath, Config.root_user, Config.gluu_group)
-                self.run([paths.cmd_chmod, '660', fpath])
-                self.run([paths.cmd_chmod, 'u+X', fpath])
-        self.chown(Config.gluuOptPythonFolder, Config.root_user, Config.gluu_user, recursive=True)
+                permissionPlanner.add(fpath, Config.root_user, Config.gluu_group, mode='660')
+                permissionPlanner.add(fpath, mode='u+X')
+        permissionPlanner.add(Config.gluuOptPythonFolder, Config.root_user, Config.gluu_user, recursive=True)
 
         if Config.profile != static.SetupProfiles.DISA_STIG:
-            self.run([paths.cmd_chown, Config.user_group, Config.jetty_base])
+            permissionPlanner.add(Config.jetty_base, *Config.user_group.split(':'))
             for p in glob.glob(os.path.join(Config.gluuOptFolder, '*')):
                 if 'node' in p:
                     continue
-                self.chown(p, Config.jetty_user, Config.gluu_user, recursive=True)
-            self.chown(Config.gluuOptFolder, Config.jetty_user, Config.gluu_user)
+                permissionPlanner.add(p, Config.jetty_user, Config.gluu_user, recursive=True)
+            permissionPlanner.add(Config.gluuOptFolder, Config.jetty_user, Config.gluu_user)
+
+        permissionPlanner.add(Config.gluuBaseFolder, Config.root_user, Config.gluu_group, recursive=True)
+        permissionPlanner.add(Config.oxBaseDataFolder, Config.root_user, Config.gluu_group, recursive=True)
 
-        self.chown(Config.gluuBaseFolder, Config.root_user, Config.gluu_group, recursive=True)
-        self.chown(Config.oxBaseDataFolder, Config.root_user, Config.gluu_group, recursive=True)
+        for sys_path in (Config.gluuOptFolder, Config.gluuBaseFolder, Config.oxBaseDataFolder):
+            permissionPlanner.add(sys_path, mode='u+rwX,g+rwX,o-rwX', recursive=True)
 
         #enable scripts
         self.enable_scripts(base.argsp.enable_script)
@@ -451,8 +459,7 @@ class GluuInstaller(BaseInstaller, SetupUtils):
         #set auth modes
         self.set_auth_modes()
 
-        for sys_path in (Config.gluuOptFolder, Config.gluuBaseFolder, Config.oxBaseDataFolder):
-            self.run([paths.cmd_chmod, '-R', 'u+rwX,g+rwX,o-rwX', sys_path])
+        permissionPlanner.apply()
 
         if not Config.installed_instance:
             cron_service = 'crond' if base.clone_type == 'rpm' else 'cron'
@@ -466,7 +473,7 @@ class GluuInstaller(BaseInstaller, SetupUtils):
 
     def disa_stig_post_install_tasks(self):
 
-        self.chown(Config.gluuOptFolder, Config.jetty_user, Config.gluu_group)
+        permissionPlanner.add(Config.gluuOptFolder, Config.jetty_user, Config.gluu_group)
 
         jetty_absolute_dir = Path(Config.jetty_home).resolve()
 
@@ -480,9 +487,10 @@ class GluuInstaller(BaseInstaller, SetupUtils):
                             jetty_absolute_dir.as_posix(),
                             Config.gluuBaseFolder,
                             os.path.join(Config.distFolder,'scripts')):
-            self.run([paths.cmd_chmod, 'g+rwX', '-R', sys_path])
+            permissionPlanner.add(sys_path, mode='g+rwX', recursive=True)
 
-        self.chown(jetty_absolute_dir.parent.as_posix(), Config.user_group, recursive=True)
+        permissionPlanner.add(jetty_absolute_dir.parent.as_posix(), *Config.user_group.split(':'), recursive=True)
+        permissionPlanner.apply()
 
 
     def generate_gluu_passwurd_api_keystore(self):
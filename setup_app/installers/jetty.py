@@ -10,6 +10,7 @@ from setup_app.utils import base
 from setup_app.static import AppType, InstallOption, InstallTypes, SetupProfiles, fapolicyd_rule_tmp
 from setup_app.config import Config
 from setup_app.utils.setup_utils import SetupUtils
+from setup_app.utils.resource_planner import resourcePlanner
 from setup_app.installers.base import BaseInstaller
 
 class JettyInstaller(BaseInstaller, SetupUtils):
@@ -284,44 +285,11 @@ class JettyInstaller(BaseInstaller, SetupUtils):
     def calculate_aplications_memory(self, application_max_ram, installedComponents):
         self.logIt("Calculating memory setting for applications")
 
-        application_max_ram = float(application_max_ram)
-
-        #prepare default mem needed for proper rendering
-        for app in Config.app_mem_weigths:
-            Config.templateRenderingDict['{}_max_mem'.format(app)] = Config.app_mem_weigths[app]['min']
-            Config.templateRenderingDict['{}_min_mem'.format(app)] = Config.app_mem_weigths[app]['min']
-
-
-        def calulate_total_weigth(withopendj=True):
-            total_weigth = 0
-
-            if Config.ldap_install == InstallTypes.LOCAL and withopendj:
-                total_weigth += Config.app_mem_weigths['opendj']['weigth']
-
-            for app in installedComponents:
-                total_weigth += Config.app_mem_weigths[app]['weigth']
-
-            return total_weigth
-
-        total_weigth = calulate_total_weigth()
-
-        if Config.ldap_install == InstallTypes.LOCAL:
-            opendj_max_ram = round(Config.app_mem_weigths['opendj']['weigth'] * application_max_ram /total_weigth)
-
-            if opendj_max_ram < Config.opendj_ram:
-                total_weigth = calulate_total_weigth(withopendj=False)
-                opendj_max_ram = Config.opendj_ram
-                application_max_ram -= Config.opendj_ram
-
-            os.environ['ce_ldap_xms'] = str(Config.app_mem_weigths['opendj']['min'])
-            os.environ['ce_ldap_xmx'] = str(opendj_max_ram)
-
-        for app in installedComponents:
-            app_max_mem = round(Config.app_mem_weigths[app]['weigth'] * application_max_ram /total_weigth)
-            Config.templateRenderingDict['{}_max_mem'.format(app)] = app_max_mem
-            Config.templateRenderingDict['{}_min_mem'.format(app)] = Config.app_mem_weigths[app]['min']
-
-        return True
+        return resourcePlanner.calculate(
+                    application_max_ram,
+                    installedComponents,
+                    with_opendj=Config.ldap_install == InstallTypes.LOCAL
+                    )
 
     def calculate_selected_aplications_memory(self):
         Config.pbar.progress("gluu", "Calculating application memory")
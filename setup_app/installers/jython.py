@@ -15,6 +15,7 @@ class JythonInstaller(BaseInstaller, SetupUtils):
         setattr(base.current_app, self.__class__.__name__, self)
         self.service_name = 'jython'
         self.install_var = 'installJython'
+        self.dependencies = ('jre',)
         self.app_type = AppType.APPLICATION
         self.install_type = InstallOption.MANDATORY
         self.register_progess()
@@ -16,6 +16,7 @@ from setup_app.static import InstallTypes, BackendTypes, SetupProfiles, fapolicy
 from setup_app.utils.setup_utils import SetupUtils
 from setup_app.installers.base import BaseInstaller
 from setup_app.utils.ldif_utils import myLdifParser
+from setup_app.utils.index_scheduler import IndexScheduler
 from setup_app.pylib.ldif4.ldif import LDIFWriter
 
 class OpenDjInstaller(BaseInstaller, SetupUtils):
@@ -479,6 +480,8 @@ class OpenDjInstaller(BaseInstaller, SetupUtils):
         if Config.mappingLocations['site'] == 'ldap':
             index_backends.append('site')
 
+        index_scheduler = IndexScheduler('opendj')
+
         for attrDict in index_json:
             attr_name = attrDict['attribute']
             for backend in attrDict['backend']:
@@ -490,8 +493,17 @@ class OpenDjInstaller(BaseInstaller, SetupUtils):
                             'ds-cfg-index-type': attrDict['index'],
                             'ds-cfg-index-entry-limit': ['4000']
                             }
-                    self.logIt("Creating Index {}".format(dn))
-                    self.dbUtils.ldap_conn.add(dn, attributes=entry)
+                    index_scheduler.add(backend, (dn, entry))
+
+        index_scheduler.report()
+
+        def add_backend_indexes(backend, index_entries):
+            # index configuration entries are written through single admin connection
+            for dn, entry in index_entries:
+                self.logIt("Creating Index {}".format(dn))
+                self.dbUtils.ldap_conn.add(dn, attributes=entry)
+
+        index_scheduler.run(add_backend_indexes)
 
 
     def prepare_opendj_schema(self):
@@ -572,7 +584,7 @@ class OpenDjInstaller(BaseInstaller, SetupUtils):
                     java_home_ln_w = True
                 if k == 'start-ds.java-args':
                     if os.environ.get('ce_ldap_xms') and os.environ.get('ce_ldap_xmx'):
-                        opendj_java_properties[i] = 'start-ds.java-args=-server -Xms{}m -Xmx{}m -XX:+UseCompressedOops'.format(os.environ['ce_ldap_xms'], os.environ['ce_ldap_xmx'])
+                        opendj_java_properties[i] = 'start-ds.java-args=-server -Xms{}m -Xmx{}m -XX:+UseCompressedOops {}'.format(os.environ['ce_ldap_xms'], os.environ['ce_ldap_xmx'], os.environ.get('ce_ldap_jvm_opts', '')).rstrip()
 
         if not java_home_ln_w:
             opendj_java_properties.append(java_home_ln)
@@ -623,7 +635,6 @@ class OpenDjInstaller(BaseInstaller, SetupUtils):
         opendj_config_ldif_fn = os.path.join(Config.ldapBaseFolder, 'config/config.ldif')
 
         parser = myLdifParser(opendj_config_ldif_fn)
-        parser.parse()
 
         dsa_key = 'ds-cfg-key-store-file'
         dsa_val = '/etc/certs/opendj.bcfks'
@@ -633,7 +644,7 @@ class OpenDjInstaller(BaseInstaller, SetupUtils):
         opendj_config_out = tmp_path.open('wb')
         ldif_writer = LDIFWriter(opendj_config_out, cols=10000)
 
-        for dn, entry in parser.entries:
+        for dn, entry in parser.iter_entries():
             if dn in ('cn=HTTP Connection Handler,cn=Connection Handlers,cn=config',
                       'cn=LDAP Connection Handler,cn=Connection Handlers,cn=config',
                       'cn=LDAPS Connection Handler,cn=Connection Handlers,cn=config'):
@@ -18,6 +18,7 @@ class OxtrustInstaller(JettyInstaller):
         self.app_type = AppType.SERVICE
         self.install_type = InstallOption.OPTONAL
         self.install_var = 'installOxTrust'
+        self.dependencies = ('oxauth',)
         self.register_progess()
 
         self.source_files = [
@@ -18,6 +18,7 @@ class PassportInstaller(NodeInstaller):
         self.app_type = AppType.SERVICE
         self.install_type = InstallOption.OPTONAL
         self.install_var = 'installPassport'
+        self.dependencies = ('oxauth', 'identity')
         self.register_progess()
 
         passport_version = Config.oxVersion.replace('-SNAPSHOT','').replace('.Final','')
@@ -17,6 +17,8 @@ from setup_app.static import InstallTypes
 from setup_app.installers.base import BaseInstaller
 from setup_app.utils.setup_utils import SetupUtils
 from setup_app.utils.package_utils import packageUtils
+from setup_app.utils.index_scheduler import IndexScheduler
+from setup_app.utils.schema_registry import schemaRegistry
 
 
 class RDBMInstaller(BaseInstaller, SetupUtils):
@@ -38,7 +40,6 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
 
     def prepare(self):
         self.schema_files = []
-        self.gluu_attributes = []
 
         json_schema_files = ['gluu_schema.json', 'custom_schema.json']
 
@@ -50,10 +51,9 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
             json_schema_files.append(edu_person_fn)
 
         for schema_fn in json_schema_files:
-            schema_full_path = os.path.join(Config.install_dir, 'schema', schema_fn)
-            self.schema_files.append(schema_full_path)
-            schema_ = base.readJsonFile(schema_full_path)
-            self.gluu_attributes += schema_.get('attributeTypes', [])
+            self.schema_files.append(os.path.join(Config.install_dir, 'schema', schema_fn))
+
+        self.gluu_attributes = schemaRegistry.get(schema_files=self.schema_files).attribute_types
 
 
     @property
@@ -185,53 +185,23 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
 
     def get_sql_tables(self, schema_files):
 
+        schema = schemaRegistry.get(schema_files=schema_files)
         tables_dict = OrderedDict()
-        all_schema = {}
-        tables_dict['__allattribs__'] = {}
-        
-        for schema_fn in schema_files:
-            schema = base.readJsonFile(schema_fn)
-            for obj in schema['objectClasses']:
-                if 'sql' in obj and Config.installSaml and obj['names'][0] == 'gluuPerson':
-                    obj['sql']['includeObjectClass'].append('eduPerson')
-                all_schema[obj['names'][0]] = obj
-            for attr in schema['attributeTypes']:
-                tables_dict['__allattribs__'][attr['names'][0]] = attr
-
-        subtable_attrs = {}
-        for stbl in self.dbUtils.sub_tables.get(Config.rdbm_type):
-            subtable_attrs[stbl] = [ scol[0] for scol in self.dbUtils.sub_tables[Config.rdbm_type][stbl] ]
-
-        for obj_name in all_schema:
-            obj = all_schema[obj_name]
+        tables_dict['__allattribs__'] = {attr['names'][0]: attr for attr in schema.attribute_types}
+        subtable_attrs = schema.subtable_attributes.get(Config.rdbm_type, {})
+
+        for sql_tbl_name, obj in schema.object_classes.items():
 
             if obj.get('sql', {}).get('ignore'):
                 continue
 
-            sql_tbl_name = obj['names'][0]
+            include_object_classes = ['eduPerson'] if 'sql' in obj and Config.installSaml and sql_tbl_name == 'gluuPerson' else []
             tables_dict[sql_tbl_name] = []
 
-            attr_list = obj['may']
-            if 'sql' in obj:
-                attr_list += obj['sql'].get('include',[])
-                if 'includeObjectClass' in obj['sql']:
-                    for incobjcls in obj['sql']['includeObjectClass']:
-                        attr_list += all_schema[incobjcls]['may']
-
-            for s in obj['sup']:
-                if s == 'top':
-                    continue
-                attr_list += all_schema[s]['may']
-
-            cols_ =[]
-            for attrname in attr_list:
-                if attrname in cols_:
-                    continue
-
+            for attrname in schema.get_object_class_attributes(sql_tbl_name, include_object_classes):
                 if attrname in subtable_attrs.get(sql_tbl_name, []):
                     continue
 
-                cols_.append(attrname)
                 data_type = self.get_sql_col_type(attrname, sql_tbl_name)
                 tables_dict[sql_tbl_name].append((attrname, data_type))
 
@@ -327,16 +297,14 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
         return re.sub(r'[^0-9a-zA-Z\s]+','_', attrname)
 
 
-    def old_mysql_json_index(self, tbl_name, col_name):
-        mem_index_tmp = "ALTER TABLE {0}.{1} ADD COLUMN `{3}_mem_idx_{2}` CHAR(128) AS ({3}->'$.v[{2}]')"
-        raw_index_tmp = "ALTER TABLE {0}.{1} ADD INDEX `{3}_mem_idx_{2}` (`{3}_mem_idx_{2}`)"
+    def old_mysql_json_index(self, index_scheduler, tbl_name, col_name):
+        mem_index_tmp = "ADD COLUMN `{1}_mem_idx_{0}` CHAR(128) AS ({1}->'$.v[{0}]')"
+        raw_index_tmp = "ADD INDEX `{1}_mem_idx_{0}` (`{1}_mem_idx_{0}`)"
         for i in range(4):
-            self.dbUtils.exec_rdbm_query(mem_index_tmp.format(Config.rdbm_db, tbl_name, i, col_name))
-            self.dbUtils.exec_rdbm_query(raw_index_tmp.format(Config.rdbm_db, tbl_name, i, col_name))
+            index_scheduler.add(tbl_name, mem_index_tmp.format(i, col_name))
+            index_scheduler.add(tbl_name, raw_index_tmp.format(i, col_name))
 
-    def create_indexes(self):
-
-        indexes = []
+    def plan_indexes(self, index_scheduler):
 
         sql_indexes_fn = os.path.join(Config.static_rdbm_dir, Config.rdbm_type + '_index.json')
         sql_indexes = base.readJsonFile(sql_indexes_fn)
@@ -357,14 +325,17 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
             for tblCls in tables:
                 tbl_fields = sql_indexes.get(tblCls, {}).get('fields', []) +  sql_indexes['__common__']['fields']
 
-                tbl_data = self.dbUtils.spanner_client.exec_sql('SELECT * FROM {} LIMIT 1'.format(tblCls))
+                # column types were looked up in a key executeSql response doesn't have,
+                # so these indexes were never created. They change schema of existing
+                # installations, create them only if asked for
+                table_fields = self.dbUtils.spanner_client.get_table_fields(tblCls) if Config.get('spanner_column_indexes') else []
 
-                for attr in tbl_data.get('fields', []):
+                for attr in table_fields:
                     if attr['name'] == 'doc_id':
                         continue
                     attr_name = attr['name']
                     ind_name = self.get_index_name(attr['name'])
-                    data_type = attr['type']
+                    data_type = attr['type']['code']
 
                     if data_type == 'ARRAY':
                         # How to index for ARRAY types in spanner?
@@ -376,7 +347,7 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
                                     tblCls,
                                     attr_name
                                 )
-                        self.dbUtils.spanner_client.exec_sql(sql_cmd)
+                        index_scheduler.add(tblCls, sql_cmd)
 
                 for i, custom_index in enumerate(sql_indexes.get(tblCls, {}).get('custom', [])):
                     sql_cmd = 'CREATE INDEX `{0}_CustomIdx{1}` ON {0} ({2})'.format(
@@ -384,13 +355,15 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
                                     i+1, 
                                     custom_index
                                 )
-                    self.dbUtils.spanner_client.exec_sql(sql_cmd)
+                    index_scheduler.add(tblCls, sql_cmd)
 
                 if tblCls == 'gluuPerson':
                     uniq_index_cmd = 'CREATE UNIQUE NULL_FILTERED INDEX gluuPerson_unique_uuid ON gluuPerson (uid)'
-                    self.dbUtils.spanner_client.exec_sql(uniq_index_cmd)
+                    index_scheduler.add(tblCls, uniq_index_cmd)
 
         else:
+            # For MySQL ALTER TABLE clauses are collected and merged per table,
+            # PostgreSQL indexes are built concurrently
             for tblCls in self.dbUtils.Base.classes.keys():
                 tblObj = self.dbUtils.Base.classes[tblCls]()
                 tbl_fields = sql_indexes.get(tblCls, {}).get('fields', []) + sql_indexes['__common__']['fields']
@@ -406,60 +379,105 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
 
                         if attr.name in tbl_fields:
                             if Config.rdbm_type == 'mysql' and self.dbUtils.mysql_version < (5, 7, 38):
-                                self.old_mysql_json_index(tblCls, attr.name)
+                                self.old_mysql_json_index(index_scheduler, tblCls, attr.name)
                             else:
                                 for i, ind_str in enumerate(sql_indexes['__common__']['JSON']):
                                     tmp_str = Template(ind_str)
                                     if Config.rdbm_type == 'mysql':
-                                        sql_cmd = 'ALTER TABLE {0}.{1} ADD INDEX `{2}_json_{3}`(({4}));'.format(
-                                                Config.rdbm_db,
-                                                tblCls,
+                                        sql_cmd = 'ADD INDEX `{0}_json_{1}`(({2}))'.format(
                                                 ind_name,
                                                 i+1,
                                                 tmp_str.safe_substitute({'field':attr.name})
                                                 )
-                                        self.dbUtils.exec_rdbm_query(sql_cmd)
+                                        index_scheduler.add(tblCls, sql_cmd)
                                     elif Config.rdbm_type == 'pgsql':
-                                        sql_cmd ='CREATE INDEX ON "{}" {};'.format(
+                                        sql_cmd ='CREATE INDEX CONCURRENTLY ON "{}" {};'.format(
                                                 tblCls,
                                                 tmp_str.safe_substitute({'field':attr.name})
                                                 )
-                                        self.dbUtils.exec_rdbm_query(sql_cmd)
+                                        index_scheduler.add(tblCls, sql_cmd)
 
 
                     elif attr.name in tbl_fields:
                         if Config.rdbm_type == 'mysql':
                             idx_key_length = '(768)' if str(attr.type) == 'TEXT' else ''
-                            sql_cmd = 'ALTER TABLE {0}.{1} ADD INDEX `{1}_{2}` (`{3}`{4});'.format(
-                                        Config.rdbm_db,
+                            sql_cmd = 'ADD INDEX `{0}_{1}` (`{2}`{3})'.format(
                                         tblCls,
                                         ind_name,
                                         attr.name,
                                         idx_key_length
                                     )
-                            self.dbUtils.exec_rdbm_query(sql_cmd)
+                            index_scheduler.add(tblCls, sql_cmd)
                         elif Config.rdbm_type == 'pgsql':
-                            sql_cmd = 'CREATE INDEX ON "{}" ("{}");'.format(
+                            sql_cmd = 'CREATE INDEX CONCURRENTLY ON "{}" ("{}");'.format(
                                         tblCls,
                                         attr.name
                                     )
-                            self.dbUtils.exec_rdbm_query(sql_cmd)
+                            index_scheduler.add(tblCls, sql_cmd)
 
                 for i, custom_index in enumerate(sql_indexes.get(tblCls, {}).get('custom', [])):
                     if Config.rdbm_type == 'mysql':
-                        sql_cmd = 'ALTER TABLE {0}.{1} ADD INDEX `{2}` ({3});'.format(
-                                        Config.rdbm_db,
-                                        tblCls,
+                        sql_cmd = 'ADD INDEX `{0}` ({1})'.format(
                                         '{}_CustomIdx{}'.format(tblCls, i+1),
                                         custom_index
                                     )
-                        self.dbUtils.exec_rdbm_query(sql_cmd)
+                        index_scheduler.add(tblCls, sql_cmd)
                     elif Config.rdbm_type == 'pgsql':
-                        sql_cmd = 'CREATE INDEX ON "{}" {};'.format(
+                        sql_cmd = 'CREATE INDEX CONCURRENTLY ON "{}" {};'.format(
                                     tblCls,
                                     custom_index
                                     )
-                        self.dbUtils.exec_rdbm_query(sql_cmd)
+                        index_scheduler.add(tblCls, sql_cmd)
+
+    def create_mysql_table_indexes(self, tbl_name, clauses):
+        sql_cmd = 'ALTER TABLE {0}.{1} {2};'.format(Config.rdbm_db, tbl_name, ', '.join(clauses))
+        self.logIt("Executing {} Query: {}".format(Config.rdbm_type, sql_cmd))
+        try:
+            self.dbUtils.session.execute(sql_cmd)
+            self.dbUtils.session.commit()
+        except Exception as e:
+            # some of indexes may already exist, add them one by one
+            self.dbUtils.session.rollback()
+            self.logIt("Merged index creation on {} failed: {}. Adding indexes one by one".format(tbl_name, e))
+            for clause in clauses:
+                self.dbUtils.exec_rdbm_query('ALTER TABLE {0}.{1} {2};'.format(Config.rdbm_db, tbl_name, clause))
+
+    def create_pgsql_table_indexes(self, tbl_name, statements):
+        # CREATE INDEX CONCURRENTLY can't run in a transaction, each worker uses its own connection
+        with self.dbUtils.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for sql_cmd in statements:
+                self.logIt("Executing {} Query: {}".format(Config.rdbm_type, sql_cmd))
+                try:
+                    conn.execute(sqlalchemy.text(sql_cmd))
+                except Exception as e:
+                    self.logIt("ERROR executing query {}".format(e.args), True)
+
+    def create_spanner_table_indexes(self, tbl_name, statements):
+        spanner_client = self.dbUtils.spanner_client
+        self.logIt("Executing {} DDL on {}: {}".format(Config.rdbm_type, tbl_name, '; '.join(statements)))
+        operation = spanner_client.update_ddl(statements)
+        if not operation.get('error'):
+            return
+
+        # statements up to the failing one were applied, some of indexes may already exist, add rest one by one
+        applied = spanner_client.applied_ddl_count(operation)
+        self.logIt("DDL on {} failed after {} statements: {}. Executing rest one by one".format(tbl_name, applied, operation['error']))
+        for sql_cmd in statements[applied:]:
+            operation = spanner_client.update_ddl([sql_cmd])
+            if operation.get('error'):
+                self.logIt("ERROR executing query {}: {}".format(sql_cmd, operation['error']), True)
+
+    def create_indexes(self):
+        index_scheduler = IndexScheduler(Config.rdbm_type)
+        self.plan_indexes(index_scheduler)
+        index_scheduler.report()
+
+        if Config.rdbm_type == 'mysql':
+            index_scheduler.run(self.create_mysql_table_indexes)
+        elif Config.rdbm_type == 'pgsql':
+            index_scheduler.run(self.create_pgsql_table_indexes, max_workers=min(base.current_number_of_cpu, Config.rdbm_index_workers))
+        elif Config.rdbm_type == 'spanner':
+            index_scheduler.run(self.create_spanner_table_indexes)
 
     def import_ldif(self):
         ldif_files = []
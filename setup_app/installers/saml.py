@@ -17,6 +17,7 @@ class SamlInstaller(JettyInstaller):
         self.app_type = AppType.SERVICE
         self.install_type = InstallOption.OPTONAL
         self.install_var = 'installSaml'
+        self.dependencies = ('identity',)
         self.register_progess()
 
         self.needdb = True
@@ -80,9 +81,11 @@ class SamlInstaller(JettyInstaller):
                 Config.encoded_shib_jks_pw = self.obscure(Config.shibJksPass)
 
             # generate crypto
-            self.gen_cert('shibIDP', Config.shibJksPass, 'jetty')
-            self.gen_cert('idp-encryption', Config.shibJksPass, 'jetty')
-            self.gen_cert('idp-signing', Config.shibJksPass, 'jetty')
+            self.gen_certs([
+                        ('shibIDP', Config.shibJksPass, 'jetty'),
+                        ('idp-encryption', Config.shibJksPass, 'jetty'),
+                        ('idp-signing', Config.shibJksPass, 'jetty'),
+                        ])
 
             self.gen_keystore('shibIDP',
                               self.shib_data_store_fn,
@@ -82,6 +82,8 @@ def arg_parser():
     parser.add_argument('--generate-oxd-certificate', help="Generate certificate for oxd based on hostname", action='store_true')
     parser.add_argument('--shell', help="Drop into interactive shell before starting installation", action='store_true')
     parser.add_argument('--no-progress', help="Use simple progress", action='store_true')
+    parser.add_argument('--plan-only', help="Print memory and JVM options planned for applications selected in loaded properties and exit, without prompting", action='store_true')
+    parser.add_argument('--profile-trace', help="Record durations of setup phases, commands, backend operations, downloads and template rendering into Chrome trace file (default logs/setup_trace.json)", nargs='?', const='')
     parser.add_argument('-enable-script', action='append', help="inum of script to enable", required=False)
     parser.add_argument('-ox-authentication-mode', help="Sets oxAuthenticationMode")
     parser.add_argument('-ox-trust-authentication-mode', help="Sets oxTrustAuthenticationMode")
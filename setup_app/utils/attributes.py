@@ -1,70 +1,41 @@
-import os
+import json
 import datetime
-import zipfile
-from setup_app import paths
-from setup_app.utils import base
-
-# Currently we implement only three data types: string, boolean, integer, datetime
-syntaxType = {
-                '1.3.6.1.4.1.1466.115.121.1.7': 'boolean',
-                '1.3.6.1.4.1.1466.115.121.1.27': 'integer',
-                '1.3.6.1.4.1.1466.115.121.1.24': 'datetime',
-              }
-# other syntaxes are treated as string
-
-# This function was used to gather data types from opendj schema files
-# collected types were dumped to opendj_types.json
+import threading
+from setup_app.utils.schema_registry import schemaRegistry, syntaxType
 
 
 class AttribDataTypes:
+    """Data types of attributes, taken from schemaRegistry on first lookup"""
 
-    listAttributes = ['member']
-    attribTypes = {}
+    schema_attributes = ('attribTypes', 'listAttributes', 'attribTypeIndex', 'listAttribIndex')
 
     def __init__(self):
-        opendjTypesFn = os.path.join(paths.INSTALL_DIR, 'schema/opendj_types.json')
-        self.attribTypes = base.readJsonFile(opendjTypesFn)
+        self.lock = threading.Lock()
 
-        for v in syntaxType.values():
-            if not v in self.attribTypes:
-                self.attribTypes[v] = []
+    def __getattr__(self, name):
+        if name in self.schema_attributes:
+            self.load()
+            return self.__dict__[name]
 
-        if 'json' not in self.attribTypes:
-            self.attribTypes['json'] = []
+        raise AttributeError(name)
 
-        self.processGluuSchema()
+    def load(self):
+        with self.lock:
+            if 'listAttribIndex' not in self.__dict__:
+                self.readSchema()
 
-    def processGluuSchema(self):
-
-        gluuSchemaFn = os.path.join(paths.INSTALL_DIR, 'schema/gluu_schema.json')
-        gluuSchema = base.readJsonFile(gluuSchemaFn)
-        gluuAtrribs = gluuSchema['attributeTypes']
-
-        for attrib in gluuAtrribs:
-            if attrib.get('multivalued'):
-                atype = 'json'
-            elif  attrib['syntax'] in syntaxType:
-                atype = syntaxType[attrib['syntax']]
-            else:
-                atype = 'string'
-                
-            for name in attrib['names']:
-                self.attribTypes[atype].append(name)
-
-        for obj_type in ['objectClasses', 'attributeTypes']:
-            for obj in gluuSchema[obj_type]:
-                if obj.get('multivalued'):
-                    for name in obj['names']:
-                        if not name in self.listAttributes:
-                            self.listAttributes.append(name)
+    def readSchema(self):
+        schema = schemaRegistry.get()
+        self.attribTypes = schema.attrib_types
+        self.listAttributes = schema.list_attributes
+        self.attribTypeIndex = schema.attrib_type_index
+        self.listAttribIndex = schema.list_attribute_index
 
+    def isListAttribute(self, attrib):
+        return attrib in self.listAttribIndex
 
     def getAttribDataType(self, attrib):
-        for atype in self.attribTypes:
-            if attrib in self.attribTypes[atype]:
-                return atype
-
-        return 'string'
+        return self.attribTypeIndex.get(attrib, 'string')
 
     def getTypedValue(self, dtype, val):
         retVal = val
@@ -20,7 +20,6 @@ import shlex
 
 from pathlib import Path
 from collections import OrderedDict
-from urllib.request import urlretrieve
 from types import SimpleNamespace
 
 # disable ssl certificate check
@@ -30,6 +29,7 @@ from setup_app import paths
 from setup_app import static
 from setup_app.config import Config
 from setup_app.pylib.jproperties import Properties
+from setup_app.utils.profiler import profiler
 
 # Note!!! This module should be imported after paths
 
@@ -37,7 +37,19 @@ cur_dir = Path(__file__).parent.as_posix()
 ces_dir = Path(__file__).parent.parent.as_posix()
 par_dir = Path(__file__).parent.parent.parent.as_posix()
 
-current_app = SimpleNamespace()
+class CurrentApp(SimpleNamespace):
+    """Namespace of application objects. Installers register themselves when
+    they are initialized, an installer which was not initialized yet is
+    initialized when it is accessed first"""
+
+    def __getattr__(self, name):
+        from setup_app.installers import installer_modules, get_installer_class
+        if name not in installer_modules:
+            raise AttributeError(name)
+        setattr(self, name, get_installer_class(name)())
+        return self.__dict__[name]
+
+current_app = CurrentApp()
 
 re_split_host = re.compile(r'[^,\s,;]+')
 
@@ -244,22 +256,24 @@ def run(args, cwd=None, env=None, useWait=False, shell=False, get_stderr=False):
         if not (argsc[1].startswith('/opt') or argsc[1].startswith('.')):
             logOSChanges('Creating directory %s' % (', '.join(argsc[1:])))
 
-    try:
-        p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env, shell=shell)
-        if useWait:
-            code = p.wait()
-            logIt('Run: %s with result code: %d' % (' '.join(args), code) )
-        else:
-            output, err = p.communicate()
-            output = output.decode('utf-8')
-            err = err.decode('utf-8')
-
-            if output:
-                logIt(output)
-            if err:
-                logIt(err, True)
-    except:
-        logIt("Error running command : %s" % " ".join(args), True)
+    command_name = os.path.basename(args[0] if type(args) is list else args.split()[0])
+    with profiler.span(command_name, 'run', command=log_arg):
+        try:
+            p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env, shell=shell)
+            if useWait:
+                code = p.wait()
+                logIt('Run: %s with result code: %d' % (' '.join(args), code) )
+            else:
+                output, err = p.communicate()
+                output = output.decode('utf-8')
+                err = err.decode('utf-8')
+
+                if output:
+                    logIt(output)
+                if err:
+                    logIt(err, True)
+        except:
+            logIt("Error running command : %s" % " ".join(args), True)
 
     if get_stderr:
         return output, err
@@ -293,25 +307,10 @@ def find_script_names(ldif_file):
 
     return name_list
 
-def download(url, dst):
-    pardir, fn = os.path.split(dst)
-    if not os.path.exists(pardir):
-        logIt("Creating driectory", pardir)
-        os.makedirs(pardir)
-    logIt("Downloading {} to {}".format(url, dst))
-    download_tries = 1
-    while download_tries < 4:
-        try:
-            result = urlretrieve(url, dst)
-            f_size = result[1].get('Content-Length','0')
-            logIt("Download size: {} bytes".format(f_size))
-            time.sleep(0.1)
-        except:
-             logIt("Error downloading {}. Download will be re-tried once more".format(url))
-             download_tries += 1
-             time.sleep(1)
-        else:
-            break
+def download(url, dst, checksum=None):
+    # downloads are resumed and cached by download manager
+    from setup_app.utils.download_manager import downloadManager
+    return downloadManager.download(url, dst, checksum)
 
 def check_port_available(port_list, host='localhost'):
     open_ports = []
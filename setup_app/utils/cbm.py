@@ -1,4 +1,5 @@
 import os
+import json
 import requests
 import urllib3
 import logging
@@ -6,6 +7,8 @@ import logging
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 from requests.auth import HTTPBasicAuth
 from setup_app.utils.base import logIt
+from setup_app.utils.http_utils import get_pooled_session
+from setup_app.utils.db_metrics import dbMetrics
 
 try:
     requests.packages.urllib3.disable_warnings()
@@ -22,6 +25,9 @@ class FakeResult:
 
 class CBM:
 
+    # connections are kept alive and shared by all CBM instances
+    session = None
+
     def __init__(self, host, admin, password, port=18091, n1qlport=18093):
         self.host = host
         self.port = port
@@ -29,6 +35,10 @@ class CBM:
         self.auth = HTTPBasicAuth(admin, password)
         self.set_api_root()
 
+        if not CBM.session:
+            CBM.session = get_pooled_session()
+            dbMetrics.instrument_http_session(CBM.session, 'couchbase', lambda request: 'n1ql' if '/query/service' in request.url else 'rest')
+
     def set_api_root(self):
         self.api_root = 'https://{}:{}/'.format(self.host, self.port)
         self.n1ql_api = 'https://{}:{}/query/service'.format(self.host, self.n1qlport)
@@ -37,7 +47,7 @@ class CBM:
         api = os.path.join(self.api_root, endpoint)
         logging.info('getting %s', endpoint)
         try:
-            result = requests.get(api, auth=self.auth, verify=False)
+            result = self.session.get(api, auth=self.auth, verify=False)
         except Exception as e:
             result = FakeResult()
             result.reason = 'Connection failed. Reason: ' + str(e)
@@ -47,7 +57,7 @@ class CBM:
     def _delete(self, endpoint):
         logging.info('deleting %s', endpoint)
         api = os.path.join(self.api_root, endpoint)
-        result = requests.delete(api, auth=self.auth, verify=False)
+        result = self.session.delete(api, auth=self.auth, verify=False)
         self.logIfError(result)
         return result
 
@@ -55,14 +65,14 @@ class CBM:
     def _post(self, endpoint, data):
         logging.info('posting %s to %s', data, endpoint)
         url = os.path.join(self.api_root, endpoint)
-        result = requests.post(url, data=data, auth=self.auth, verify=False)
+        result = self.session.post(url, data=data, auth=self.auth, verify=False)
         self.logIfError(result)
         return result
     
     def _put(self,  endpoint, data):
         logging.info('putting %s to %s', data, endpoint)
         url = os.path.join(self.api_root, endpoint)
-        result = requests.put(url, data=data, auth=self.auth, verify=False)
+        result = self.session.put(url, data=data, auth=self.auth, verify=False)
         self.logIfError(result)
         return result
 
@@ -104,7 +114,17 @@ class CBM:
     def exec_query(self, query):
         logging.info("Executing n1ql %s", query)
         data = {'statement': query}
-        result = requests.post(self.n1ql_api, data=data, auth=self.auth, verify=False)
+        result = self.session.post(self.n1ql_api, data=data, auth=self.auth, verify=False)
+        self.logIfError(result)
+        return result
+
+    def upsert_documents(self, bucket, documents):
+        """Upserts list of (key, document) tuples with a single N1QL statement"""
+        values = ', '.join([ 'VALUES ({}, {})'.format(json.dumps(key), json.dumps(document)) for key, document in documents ])
+        n1ql = 'UPSERT INTO `{}` (KEY, VALUE) {}'.format(bucket, values)
+        logging.info("Upserting %d documents to bucket %s", len(documents), bucket)
+        data = {'statement': n1ql}
+        result = self.session.post(self.n1ql_api, data=data, auth=self.auth, verify=False)
         self.logIfError(result)
         return result
 
@@ -0,0 +1,252 @@
+import os
+import time
+import base64
+import struct
+import hashlib
+import datetime
+
+from concurrent.futures import ThreadPoolExecutor
+
+from setup_app import paths
+from setup_app import static
+from setup_app.config import Config
+from setup_app.utils import base
+from setup_app.utils.profiler import profiler
+
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, padding, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    x509 = None
+
+
+def encrypt_pem_des3(key_pem, password):
+    """Encrypts traditional OpenSSL PEM key with DES-EDE3-CBC as openssl
+    genrsa -des3 does, key is derived with EVP_BytesToKey (MD5)"""
+
+    lines = key_pem.decode().strip().splitlines()
+    der = base64.b64decode(''.join(lines[1:-1]))
+    iv = os.urandom(8)
+
+    password = password.encode()
+    derived_key = digest = b''
+    while len(derived_key) < 24:
+        digest = hashlib.md5(digest + password + iv).digest()
+        derived_key += digest
+
+    padder = padding.PKCS7(64).padder()
+    encryptor = Cipher(algorithms.TripleDES(derived_key[:24]), modes.CBC(iv)).encryptor()
+    encrypted = encryptor.update(padder.update(der) + padder.finalize()) + encryptor.finalize()
+
+    encoded = base64.b64encode(encrypted).decode()
+    body = '\n'.join(encoded[i:i+64] for i in range(0, len(encoded), 64))
+
+    return '{}\nProc-Type: 4,ENCRYPTED\nDEK-Info: DES-EDE3-CBC,{}\n\n{}\n{}\n'.format(lines[0], iv.hex().upper(), body, lines[-1]).encode()
+
+
+def pem_to_der(pem):
+    lines = [l.strip() for l in pem.strip().splitlines()]
+    return base64.b64decode(''.join(l for l in lines if l and not l.startswith('-----')))
+
+
+def make_jks_truststore(certs, password):
+    """Returns JKS keystore containing trusted certificate entries of certs,
+    list of (alias, DER encoded certificate)"""
+
+    def java_utf(s):
+        s = s.encode('utf-8')
+        return struct.pack('>H', len(s)) + s
+
+    timestamp = int(time.time() * 1000)
+    data = struct.pack('>III', 0xFEEDFEED, 2, len(certs))
+    for alias, der in certs:
+        # JKS aliases are case insensitive and stored in lower case
+        data += struct.pack('>I', 2) + java_utf(alias.lower()) + struct.pack('>q', timestamp)
+        data += java_utf('X.509') + struct.pack('>I', len(der)) + der
+
+    # integrity check: sha1 of password, a fixed phrase and keystore data
+    data += hashlib.sha1(password.encode('utf-16-be') + b'Mighty Aphrodite' + data).digest()
+
+    return data
+
+
+class CertRequest:
+
+    __slots__ = ('suffix', 'password', 'user', 'cn', 'key_with_password', 'key_without_password', 'key', 'csr', 'crt')
+
+    def __init__(self, suffix, password, user='root', cn=None):
+        self.suffix = suffix
+        self.password = password
+        self.user = user
+        self.cn = cn or Config.hostname
+        self.key_with_password = os.path.join(Config.certFolder, suffix + '.key.orig')
+        self.key_without_password = os.path.join(Config.certFolder, suffix + '.key.noenc')
+        self.key = os.path.join(Config.certFolder, suffix + '.key')
+        self.csr = os.path.join(Config.certFolder, suffix + '.csr')
+        self.crt = os.path.join(Config.certFolder, suffix + '.crt')
+
+
+class CertFactory:
+    """Generates password protected and plain rsa keys, certificate signing
+    requests and self signed certificates of several requests concurrently.
+    Files are created in process with cryptography. With DISA-STIG profile,
+    or if cryptography is not available, openssl commands are run, so that
+    FIPS validated OpenSSL of the system is used."""
+
+    key_size = 2048
+    cert_days = 365
+
+    def use_cryptography(self):
+        return x509 is not None and Config.profile != static.SetupProfiles.DISA_STIG
+
+    def get_subject(self, cn):
+        subject = [
+            ('C', Config.countryCode),
+            ('ST', Config.state),
+            ('L', Config.city),
+            ('O', Config.orgName),
+            ('CN', cn),
+            ('emailAddress', Config.admin_email),
+            ]
+
+        # openssl skips components without value
+        return [(name, value) for name, value in subject if value]
+
+    def generate(self, requests):
+        """Generates certificates of requests, returns list of (request, error)
+        of failed ones"""
+
+        generate_cert = self.generate_cert if self.use_cryptography() else self.generate_cert_openssl
+        failures = []
+        with ThreadPoolExecutor(max_workers=Config.get('cert_workers', 4)) as pool:
+            futures = [(request, pool.submit(generate_cert, request)) for request in requests]
+            for request, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    base.logIt("Error generating certificate for {}: {}".format(request.suffix, e), True)
+                    failures.append((request, e))
+
+        return failures
+
+    def write_file(self, fn, data, private=False):
+        fd = os.open(fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 if private else 0o644)
+        with os.fdopen(fd, 'wb') as w:
+            w.write(data)
+
+    def generate_cert(self, request):
+        name_oids = {
+            'C': NameOID.COUNTRY_NAME,
+            'ST': NameOID.STATE_OR_PROVINCE_NAME,
+            'L': NameOID.LOCALITY_NAME,
+            'O': NameOID.ORGANIZATION_NAME,
+            'CN': NameOID.COMMON_NAME,
+            'emailAddress': NameOID.EMAIL_ADDRESS,
+            }
+
+        with profiler.span('cert', 'generate', suffix=request.suffix):
+            key = rsa.generate_private_key(public_exponent=65537, key_size=self.key_size)
+            key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption())
+            self.write_file(request.key_with_password, encrypt_pem_des3(key_pem, request.password), private=True)
+            self.write_file(request.key, key_pem, private=True)
+
+            subject = x509.Name([x509.NameAttribute(name_oids[name], str(value)) for name, value in self.get_subject(request.cn)])
+            csr = x509.CertificateSigningRequestBuilder().subject_name(subject).sign(key, hashes.SHA256())
+            self.write_file(request.csr, csr.public_bytes(serialization.Encoding.PEM))
+
+            now = datetime.datetime.utcnow()
+            cert = x509.CertificateBuilder().subject_name(
+                        subject
+                    ).issuer_name(
+                        subject
+                    ).public_key(
+                        key.public_key()
+                    ).serial_number(
+                        x509.random_serial_number()
+                    ).not_valid_before(
+                        now
+                    ).not_valid_after(
+                        now + datetime.timedelta(days=self.cert_days)
+                    ).add_extension(
+                        x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False
+                    ).add_extension(
+                        x509.AuthorityKeyIdentifier.from_issuer_public_key(key.public_key()), critical=False
+                    ).sign(key, hashes.SHA256())
+
+            self.write_file(request.crt, cert.public_bytes(serialization.Encoding.PEM))
+
+    def generate_cert_openssl(self, request):
+        with profiler.span('cert', 'generate', suffix=request.suffix):
+            if Config.profile == static.SetupProfiles.DISA_STIG:
+                base.run([paths.cmd_openssl,
+                      'genrsa',
+                      '-out',
+                      request.key_without_password,
+                      ])
+
+                base.run([paths.cmd_openssl,
+                      'pkey',
+                      '-in',
+                      request.key_without_password,
+                      '-out',
+                      request.key_with_password,
+                      '-des3',
+                      '-passout',
+                      'pass:%s' % request.password,
+                      ])
+
+                # remove unencrypted key
+                if os.path.exists(request.key_without_password):
+                    os.remove(request.key_without_password)
+
+            else:
+
+                base.run([paths.cmd_openssl,
+                          'genrsa',
+                          '-des3',
+                          '-out',
+                          request.key_with_password,
+                          '-passout',
+                          'pass:%s' % request.password,
+                          str(self.key_size)
+                          ])
+
+            base.run([paths.cmd_openssl,
+                      'rsa',
+                      '-in',
+                      request.key_with_password,
+                      '-passin',
+                      'pass:%s' % request.password,
+                      '-out',
+                      request.key
+                      ])
+
+            base.run([paths.cmd_openssl,
+                      'req',
+                      '-new',
+                      '-key',
+                      request.key,
+                      '-out',
+                      request.csr,
+                      '-subj',
+                      ''.join(['/%s=%s' % item for item in self.get_subject(request.cn)])
+                      ])
+
+            base.run([paths.cmd_openssl,
+                      'x509',
+                      '-req',
+                      '-days',
+                      str(self.cert_days),
+                      '-in',
+                      request.csr,
+                      '-signkey',
+                      request.key,
+                      '-out',
+                      request.crt
+                      ])
+
+
+certFactory = CertFactory()
@@ -5,10 +5,8 @@ import re
 import sys
 import base64
 import glob
-import ldap3
 
 from urllib.parse import urlparse
-from ldap3.utils import dn as dnutils
 
 from setup_app import paths
 from setup_app import static
@@ -18,8 +16,13 @@ from setup_app.utils.db_utils import dbUtils
 from setup_app.utils.setup_utils import SetupUtils
 from setup_app.utils.properties_utils import propertiesUtils
 from setup_app.pylib.jproperties import Properties
-from setup_app.installers.jetty import JettyInstaller
+from setup_app.installers import get_installer_class
 from setup_app.installers.base import BaseInstaller
+from setup_app.utils.lazy_import import lazy_import
+
+ldap3 = lazy_import('ldap3')
+dnutils = lazy_import('ldap3.utils.dn')
+
 
 class CollectProperties(SetupUtils, BaseInstaller):
 
@@ -27,9 +30,10 @@ class CollectProperties(SetupUtils, BaseInstaller):
     def __init__(self):
         pass
 
-    def collect(self):
-        print("Please wait while collecting properties...")
-        self.logIt("Previously installed instance. Collecting properties")
+    def collect_persistence_properties(self):
+        """Reads persistence type and backend connection parameters from
+        gluu-*.properties into Config, returns gluu.properties"""
+
         salt_fn = os.path.join(Config.configFolder,'salt')
         if os.path.exists(salt_fn):
             salt_prop = base.read_properties_file(salt_fn)
@@ -37,10 +41,6 @@ class CollectProperties(SetupUtils, BaseInstaller):
 
         gluu_prop = base.read_properties_file(Config.gluu_properties_fn)
         Config.persistence_type = gluu_prop['persistence.type']
-        oxauth_ConfigurationEntryDN = gluu_prop['oxauth_ConfigurationEntryDN']
-        oxtrust_ConfigurationEntryDN = gluu_prop['oxtrust_ConfigurationEntryDN']
-        oxidp_ConfigurationEntryDN = gluu_prop['oxidp_ConfigurationEntryDN']
-        gluu_ConfigurationDN = 'ou=configuration,o=gluu'
 
         if Config.persistence_type in ('sql', 'spanner'):
             Config.rdbm_install = True
@@ -107,7 +107,7 @@ class CollectProperties(SetupUtils, BaseInstaller):
                 Config.templateRenderingDict['spanner_creds'] = 'auth.credentials-file={}'.format(Config.google_application_credentials)
 
         if Config.persistence_type in ['hybrid']:
-             gluu_hybrid_properties = base.read_properties_file(gluu_hybrid_properties_fn)
+             gluu_hybrid_properties = base.read_properties_file(Config.gluu_hybrid_roperties_fn)
              Config.mappingLocations = {'default': gluu_hybrid_properties['storage.default']}
              storages = [ storage.strip() for storage in gluu_hybrid_properties['storages'].split(',') ]
 
@@ -119,6 +119,17 @@ class CollectProperties(SetupUtils, BaseInstaller):
         if not Config.get('couchbase_bucket_prefix'):
             Config.couchbase_bucket_prefix = 'gluu'
 
+        return gluu_prop
+
+    def collect(self):
+        print("Please wait while collecting properties...")
+        self.logIt("Previously installed instance. Collecting properties")
+        gluu_prop = self.collect_persistence_properties()
+        oxauth_ConfigurationEntryDN = gluu_prop['oxauth_ConfigurationEntryDN']
+        oxtrust_ConfigurationEntryDN = gluu_prop['oxtrust_ConfigurationEntryDN']
+        oxidp_ConfigurationEntryDN = gluu_prop['oxidp_ConfigurationEntryDN']
+        gluu_ConfigurationDN = 'ou=configuration,o=gluu'
+
         # It is time to bind database
         dbUtils.bind()
 
@@ -283,7 +294,7 @@ class CollectProperties(SetupUtils, BaseInstaller):
         usedRatio = 0.001
         oxauth_max_heap_mem = 0
 
-        jetty_services = JettyInstaller.jetty_app_configuration
+        jetty_services = get_installer_class('JettyInstaller').jetty_app_configuration
 
         for service in jetty_services:
             service_default_fn = os.path.join(default_dir, service)
@@ -2,6 +2,8 @@ import os
 import re
 import base64
 import json
+import tempfile
+import threading
 
 from collections import OrderedDict
 from pathlib import Path
@@ -12,10 +14,18 @@ from setup_app import paths
 from setup_app import static
 from setup_app.config import Config
 from setup_app.utils import base
+from setup_app.utils.permissions import permissionPlanner
+from setup_app.utils.lazy_import import lazy_import
+
+# cryptography is imported when first certificate is generated
+cert_factory = lazy_import('setup_app.utils.cert_factory')
 
 
 class Crypto64:
 
+    # keytool rewrites whole truststore, updates of concurrent installers are serialized
+    truststore_lock = threading.RLock()
+
     def get_ssl_subject(self, ssl_fn):
         retDict = {}
         cmd = paths.cmd_openssl + ' x509  -noout -subject -nameopt RFC2253 -in {}'.format(ssl_fn)
@@ -44,95 +54,30 @@ class Crypto64:
         return decrypted.decode('utf-8')
 
     def gen_cert(self, suffix, password, user='root', cn=None, truststore_fn=None):
-        self.logIt('Generating Certificate for %s' % suffix)
-        key_with_password = os.path.join(Config.certFolder, suffix + '.key.orig')
-        key_without_password = os.path.join(Config.certFolder, suffix + '.key.noenc')
-        key = '%s/%s.key' % (Config.certFolder, suffix)
-        csr = '%s/%s.csr' % (Config.certFolder, suffix)
-        public_certificate = '%s/%s.crt' % (Config.certFolder, suffix)
-        if not truststore_fn:
-            truststore_fn = Config.default_trust_store_fn
+        """Generates a single certificate. Certificates created in the same
+        installation step should be passed to gen_certs as one batch"""
+        return self.gen_certs([(suffix, password, user, cn)], truststore_fn)[0]
 
+    def gen_certs(self, certs, truststore_fn=None):
+        """Generates certificates concurrently and imports them to java
+        truststore. certs is a list of (suffix, password, user, cn) tuples,
+        returns list of (key, csr, certificate) file names"""
 
-        if Config.profile == static.SetupProfiles.DISA_STIG:
-            self.run([paths.cmd_openssl,
-                  'genrsa',
-                  '-out',
-                  key_without_password,
-                  ])
+        requests = [cert_factory.CertRequest(*cert) for cert in certs]
+        for request in requests:
+            self.logIt('Generating Certificate for %s' % request.suffix)
 
-            self.run([paths.cmd_openssl,
-                  'pkey',
-                  '-in',
-                  key_without_password,
-                  '-out',
-                  key_with_password,
-                  '-des3',
-                  '-passout',
-                  'pass:%s' % password,
-                  ])
+        failures = cert_factory.certFactory.generate(requests)
+        if failures:
+            raise ValueError("Generating certificates failed: {}".format(', '.join('{} ({})'.format(request.suffix, error) for request, error in failures)))
 
-            # remove unencrypted key
-            os.remove(key_without_password)
+        for request in requests:
+            for key_fn in (request.key_with_password, request.key):
+                permissionPlanner.change(key_fn, request.user, request.user, '700')
 
-        else:
+        self.import_certs_to_java_truststore([("%s_%s" % (Config.hostname, request.suffix), request.crt) for request in requests], truststore_fn)
 
-            self.run([paths.cmd_openssl,
-                      'genrsa',
-                      '-des3',
-                      '-out',
-                      key_with_password,
-                      '-passout',
-                      'pass:%s' % password,
-                      '2048'
-                      ])
-
-        self.run([paths.cmd_openssl,
-                  'rsa',
-                  '-in',
-                  key_with_password,
-                  '-passin',
-                  'pass:%s' % password,
-                  '-out',
-                  key
-                  ])
-
-        certCn = cn
-        if certCn == None:
-            certCn = Config.hostname
-
-        self.run([paths.cmd_openssl,
-                  'req',
-                  '-new',
-                  '-key',
-                  key,
-                  '-out',
-                  csr,
-                  '-subj',
-                  '/C=%s/ST=%s/L=%s/O=%s/CN=%s/emailAddress=%s' % (Config.countryCode, Config.state, Config.city, Config.orgName, certCn, Config.admin_email)
-                  ])
-        self.run([paths.cmd_openssl,
-                  'x509',
-                  '-req',
-                  '-days',
-                  '365',
-                  '-in',
-                  csr,
-                  '-signkey',
-                  key,
-                  '-out',
-                  public_certificate
-                  ])
-        self.run([paths.cmd_chown, '%s:%s' % (user, user), key_with_password])
-        self.run([paths.cmd_chmod, '700', key_with_password])
-        self.run([paths.cmd_chown, '%s:%s' % (user, user), key])
-        self.run([paths.cmd_chmod, '700', key])
-
-        alias = "%s_%s" % (Config.hostname, suffix)
-        self.delete_key(alias, truststore_fn)
-        self.import_cert_to_java_truststore(alias, public_certificate)
-
-        return key, csr, public_certificate
+        return [(request.key, request.csr, request.crt) for request in requests]
 
     def delete_key(self, alias, truststore_fn=None):
         if not truststore_fn:
@@ -155,6 +100,40 @@ class Crypto64:
         self.run(cmd)
 
 
+    def import_certs_to_java_truststore(self, certs, truststore_fn=None):
+        """Imports certificates, list of (alias, cert_fn), to java truststore.
+        Certificates are put in a temporary JKS keystore and imported with a
+        single keytool invocation, existing aliases are overwritten. If it
+        fails, or with DISA-STIG profile, they are imported one by one."""
+
+        with self.truststore_lock:
+            if Config.profile != static.SetupProfiles.DISA_STIG:
+                store_pw = os.urandom(8).hex()
+                fd, store_fn = tempfile.mkstemp(suffix='.jks')
+                try:
+                    with os.fdopen(fd, 'wb') as w:
+                        w.write(cert_factory.make_jks_truststore([(alias, cert_factory.pem_to_der(self.readFile(cert_fn))) for alias, cert_fn in certs], store_pw))
+
+                    output, err = self.run([Config.cmd_keytool, '-importkeystore',
+                                '-srckeystore', store_fn,
+                                '-srcstoretype', 'JKS',
+                                '-srcstorepass', store_pw,
+                                '-destkeystore', Config.default_trust_store_fn,
+                                '-deststorepass', 'changeit',
+                                '-noprompt'], get_stderr=True)
+
+                    if 'keytool error' not in output + err:
+                        return
+                    self.logIt("Importing certificates to java truststore one by one")
+                except Exception as e:
+                    self.logIt("Can't import certificates to java truststore at once: {}".format(e), True)
+                finally:
+                    os.remove(store_fn)
+
+            for alias, cert_fn in certs:
+                self.delete_key(alias, truststore_fn)
+                self.import_cert_to_java_truststore(alias, cert_fn)
+
     def import_cert_to_java_truststore(self, alias, cert_fn):
 
         self.run([Config.cmd_keytool, '-import', '-trustcacerts',
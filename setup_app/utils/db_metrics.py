@@ -0,0 +1,273 @@
+import os
+import time
+import json
+import random
+import threading
+import functools
+
+from contextlib import contextmanager
+
+
+class OperationMetrics:
+
+    def __init__(self, buckets, max_samples):
+        self.max_samples = max_samples
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.samples = []
+
+    def add(self, duration, bytes_sent=0, bytes_received=0, error=False):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        if error:
+            self.errors += 1
+
+        for i, bucket in enumerate(self.buckets):
+            if duration <= bucket:
+                self.bucket_counts[i] += 1
+                break
+
+        # keep a uniform sample of durations for percentiles
+        if len(self.samples) < self.max_samples:
+            self.samples.append(duration)
+        else:
+            i = random.randrange(self.count)
+            if i < self.max_samples:
+                self.samples[i] = duration
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def as_dict(self):
+        return {
+                'count': self.count,
+                'errors': self.errors,
+                'total_seconds': round(self.total, 6),
+                'p50': round(self.percentile(50), 6),
+                'p95': round(self.percentile(95), 6),
+                'p99': round(self.percentile(99), 6),
+                'max': round(self.max, 6),
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                }
+
+
+class DBMetrics:
+    """Counts, latencies and transferred bytes of backend operations, grouped
+    by backend (ldap, mysql, pgsql, spanner, couchbase) and operation"""
+
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    max_samples = 10000
+    prometheus_prefix = 'gluu_setup_db'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+
+    def record(self, backend, operation, duration, bytes_sent=0, bytes_received=0, error=False):
+        with self.lock:
+            if (backend, operation) not in self.operations:
+                self.operations[(backend, operation)] = OperationMetrics(self.buckets, self.max_samples)
+            self.operations[(backend, operation)].add(duration, bytes_sent, bytes_received, error)
+
+    def add_bytes_received(self, backend, operation, bytes_received):
+        with self.lock:
+            if (backend, operation) in self.operations:
+                self.operations[(backend, operation)].bytes_received += bytes_received
+
+    @contextmanager
+    def measure(self, backend, operation):
+        """Measures duration of block, block may set 'bytes_sent' and
+        'bytes_received' keys of yielded dictionary"""
+
+        transfer = {'bytes_sent': 0, 'bytes_received': 0}
+        start_time = time.time()
+        error = False
+        try:
+            yield transfer
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(backend, operation, time.time() - start_time, transfer['bytes_sent'], transfer['bytes_received'], error)
+
+    def trace_method(self, operation):
+        """Decorator for methods of objects having backend_name attribute"""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(obj, *args, **kwargs):
+                with self.measure(getattr(obj, 'backend_name', 'unknown'), operation):
+                    return func(obj, *args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def instrument_ldap_connection(self, conn, backend='ldap'):
+        """Wraps operations of ldap3 connection, bytes are taken from usage
+        statistics if connection collects them"""
+
+        for operation in ('search', 'add', 'modify', 'delete', 'modify_dn', 'compare'):
+            if not hasattr(conn, operation):
+                continue
+
+            def get_wrapper(operation, method):
+                @functools.wraps(method)
+                def wrapper(*args, **kwargs):
+                    usage = getattr(conn, 'usage', None)
+                    sent, received = (usage.bytes_transmitted, usage.bytes_received) if usage else (0, 0)
+                    with self.measure(backend, operation) as transfer:
+                        result = method(*args, **kwargs)
+                        if usage:
+                            transfer['bytes_sent'] = usage.bytes_transmitted - sent
+                            transfer['bytes_received'] = usage.bytes_received - received
+                    return result
+                return wrapper
+
+            setattr(conn, operation, get_wrapper(operation, getattr(conn, operation)))
+
+    @staticmethod
+    def get_sql_operation(statement):
+        verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+        return {
+                'select': 'search',
+                'insert': 'add',
+                'update': 'modify',
+                'delete': 'delete',
+                }.get(verb, 'sql')
+
+    def instrument_sqlalchemy_engine(self, engine, backend):
+        from sqlalchemy import event
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_start_time', []).append(time.time())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start_time = conn.info['metrics_start_time'].pop()
+            self.record(backend, self.get_sql_operation(statement), time.time() - start_time, len(statement) + len(str(parameters or '')))
+
+        def handle_error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get('metrics_start_time'):
+                start_time = conn.info['metrics_start_time'].pop()
+                statement = exception_context.statement or ''
+                self.record(backend, self.get_sql_operation(statement), time.time() - start_time, len(statement), error=True)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(engine, 'handle_error', handle_error)
+
+    def instrument_http_session(self, session, backend, get_operation):
+        """Adds response hook to requests session. get_operation is called with
+        prepared request and should return operation name"""
+
+        instrumented = getattr(session, 'metrics_backends', set())
+        if backend in instrumented:
+            return
+
+        def response_hook(response, *args, **kwargs):
+            # hooks are dispatched before the body is read, reading
+            # response.content here would defeat streamed responses. Duration
+            # is response.elapsed, time until headers were received
+            body = response.request.body or b''
+            operation = get_operation(response.request)
+            content_length = response.headers.get('Content-Length')
+            self.record(
+                    backend,
+                    operation,
+                    response.elapsed.total_seconds(),
+                    len(body),
+                    int(content_length) if content_length and content_length.isdigit() else 0,
+                    not response.ok
+                    )
+
+            if not (content_length and content_length.isdigit()):
+                # count received bytes as body is iterated, response.content
+                # uses iter_content() too
+                iter_content = response.iter_content
+
+                def counting_iter_content(*args, **kwargs):
+                    for chunk in iter_content(*args, **kwargs):
+                        self.add_bytes_received(backend, operation, len(chunk))
+                        yield chunk
+
+                response.iter_content = counting_iter_content
+
+        session.hooks['response'].append(response_hook)
+        instrumented.add(backend)
+        session.metrics_backends = instrumented
+
+    def get_stats(self):
+        stats = {}
+        with self.lock:
+            for (backend, operation), metrics in sorted(self.operations.items()):
+                stats.setdefault(backend, {})[operation] = metrics.as_dict()
+        return stats
+
+    def to_json(self):
+        return json.dumps(self.get_stats(), indent=2)
+
+    def to_prometheus(self):
+        prefix = self.prometheus_prefix
+        lines = [
+            '# HELP {}_operation_seconds Duration of backend operations'.format(prefix),
+            '# TYPE {}_operation_seconds histogram'.format(prefix),
+            ]
+
+        with self.lock:
+            operations = sorted(self.operations.items())
+
+        for (backend, operation), metrics in operations:
+            labels = 'backend="{}",operation="{}"'.format(backend, operation)
+            cumulative = 0
+            for bucket, bucket_count in zip(metrics.buckets, metrics.bucket_counts):
+                cumulative += bucket_count
+                lines.append('{}_operation_seconds_bucket{{{},le="{}"}} {}'.format(prefix, labels, bucket, cumulative))
+            lines.append('{}_operation_seconds_bucket{{{},le="+Inf"}} {}'.format(prefix, labels, metrics.count))
+            lines.append('{}_operation_seconds_sum{{{}}} {}'.format(prefix, labels, metrics.total))
+            lines.append('{}_operation_seconds_count{{{}}} {}'.format(prefix, labels, metrics.count))
+
+        for counter, attribute, help_text in (
+                    ('operation_errors_total', 'errors', 'Failed backend operations'),
+                    ('bytes_sent_total', 'bytes_sent', 'Bytes sent to backend'),
+                    ('bytes_received_total', 'bytes_received', 'Bytes received from backend'),
+                    ):
+            lines.append('# HELP {}_{} {}'.format(prefix, counter, help_text))
+            lines.append('# TYPE {}_{} counter'.format(prefix, counter))
+            for (backend, operation), metrics in operations:
+                lines.append('{}_{}{{backend="{}",operation="{}"}} {}'.format(prefix, counter, backend, operation, getattr(metrics, attribute)))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, directory):
+        """Writes db_metrics.json and db_metrics.prom to directory, returns their paths"""
+
+        json_fn = os.path.join(directory, 'db_metrics.json')
+        prometheus_fn = os.path.join(directory, 'db_metrics.prom')
+
+        with open(json_fn, 'w') as w:
+            w.write(self.to_json())
+
+        with open(prometheus_fn, 'w') as w:
+            w.write(self.to_prometheus())
+
+        return json_fn, prometheus_fn
+
+
+dbMetrics = DBMetrics()
@@ -6,10 +6,10 @@ import json
 import logging
 import copy
 import hashlib
-import ldap3
+import functools
 
-from ldap3.utils import dn as dnutils
 from pathlib import PurePath
+from collections import OrderedDict
 
 warnings.filterwarnings("ignore")
 
@@ -20,19 +20,49 @@ from setup_app.static import InstallTypes, BackendTypes, colors, SetupProfiles
 from setup_app.utils import base
 from setup_app.utils import ldif_utils
 from setup_app.utils.attributes import attribDataTypes
+from setup_app.utils.schema_registry import schemaRegistry
+from setup_app.utils.profiler import profiler
+from setup_app.utils.db_metrics import dbMetrics
+from setup_app.utils.ldap_writer import LDAPWriter
 from setup_app.utils.setup_utils import SetupUtils
+from setup_app.utils.lazy_import import lazy_import
+
+# ldap3 is imported when it is used first, default search scopes are given
+# as values of ldap3 constants, e.g. 'LEVEL' is ldap3.LEVEL
+ldap3 = lazy_import('ldap3')
+dnutils = lazy_import('ldap3.utils.dn')
 
 
 if Config.profile != SetupProfiles.DISA_STIG:
-    from setup_app.utils.cbm import CBM
-    from setup_app.utils.spanner_rest_client import SpannerClient
+    # backend drivers are imported when they are used first
+    cbm_module = lazy_import('setup_app.utils.cbm')
+    spanner_rest_client = lazy_import('setup_app.utils.spanner_rest_client')
 
     my_path = PurePath(os.path.dirname(os.path.realpath(__file__)))
     sys.path.append(my_path.parent.joinpath('pylib/sqlalchemy'))
 
-    import sqlalchemy
-    import sqlalchemy.orm
-    import sqlalchemy.ext.automap
+    sqlalchemy = lazy_import('sqlalchemy', ('sqlalchemy.orm', 'sqlalchemy.ext.automap'))
+
+
+class ResolvedDN:
+    """Parsed DN with its Couchbase key, group, bucket, backend and doc_id,
+    produced once by DBUtils.resolve_dn()"""
+
+    __slots__ = ('dn', 'rdns', 'doc_id', 'container', 'key', 'group', 'bucket', 'backend')
+
+    def __init__(self, dn, rdns, key, group, bucket, backend):
+        self.dn = dn
+        self.rdns = rdns
+        self.doc_id = None
+        self.container = None
+        if rdns:
+            self.doc_id = '_' if rdns[0][1] == 'gluu' else rdns[0][1]
+            # rdn attribute and parent dn, i.e. inum,ou=scripts,o=gluu
+            self.container = ','.join([rdns[0][0]] + ['='.join(rdn[:2]) for rdn in rdns[1:]])
+        self.key = key
+        self.group = group
+        self.bucket = bucket
+        self.backend = backend
 
 
 class DBUtils(SetupUtils):
@@ -42,12 +72,27 @@ class DBUtils(SetupUtils):
     session = None
     cbm = None
     mariadb = False
-
+    rdbm_batch = None
+    rdbm_pbar_name = 'rdbm-server'
+    couchbase_batch = None
+    dn_cache = None
+    dn_cache_size = 10000
+    spanner_tables = None
+    spanner_pending_locations = None
+    metrics = dbMetrics
+    ldap_writer = None
+    resolved_dn_cache_size = 10000
+    resolve_dn_cached = None
+    resolver_stamp = None
+    key_prefix_groups = None
+
+    @profiler.trace('db')
     def bind(self, use_ssl=True, force=False):
 
         setattr(base.current_app, self.__class__.__name__, self)
 
         base.logIt("Bind to database")
+        self.reset_dn_resolver()
 
         logging.basicConfig(
                 filename=os.path.join(Config.install_dir, 'logs/db-backend.log'),
@@ -65,7 +110,7 @@ class DBUtils(SetupUtils):
                 self.moddb = BackendTypes.PGSQL
             elif Config.rdbm_type == 'spanner':
                 self.moddb = BackendTypes.SPANNER
-                self.spanner_client = SpannerClient(
+                self.spanner_client = spanner_rest_client.SpannerClient(
                             project_id=Config.spanner_project,
                             instance_id=Config.spanner_instance,
                             database_id=Config.spanner_database,
@@ -81,12 +126,15 @@ class DBUtils(SetupUtils):
             for group in Config.mappingLocations:
                 if Config.mappingLocations[group] == 'ldap':
                     base.logIt("Making LDAP Conncetion")
-                    ldap_server = ldap3.Server(Config.ldap_hostname, port=int(Config.ldaps_port), use_ssl=use_ssl)
+                    self.close_ldap_writer()
+                    self.ldap_server = ldap3.Server(Config.ldap_hostname, port=int(Config.ldaps_port), use_ssl=use_ssl)
                     self.ldap_conn = ldap3.Connection(
-                                ldap_server,
+                                self.ldap_server,
                                 user=Config.ldap_binddn,
                                 password=Config.ldapPass,
+                                collect_usage=True,
                                 )
+                    dbMetrics.instrument_ldap_connection(self.ldap_conn)
                     base.logIt("Making LDAP Connection to host {}:{} with user {}".format(Config.ldap_hostname, Config.ldaps_port, Config.ldap_binddn))
                     self.ldap_conn.bind()
                     break
@@ -105,6 +153,16 @@ class DBUtils(SetupUtils):
             self.set_cbm()
         self.default_bucket = Config.couchbase_bucket_prefix
 
+    @property
+    def backend_name(self):
+        return {
+                BackendTypes.LDAP: 'ldap',
+                BackendTypes.COUCHBASE: 'couchbase',
+                BackendTypes.MYSQL: 'mysql',
+                BackendTypes.PGSQL: 'pgsql',
+                BackendTypes.SPANNER: 'spanner',
+                }.get(getattr(self, 'moddb', None), 'unknown')
+
     def sqlconnection(self, log=True):
         base.logIt("Making {} Connection to {}:{}/{} with user {}".format(Config.rdbm_type.upper(), Config.rdbm_host, Config.rdbm_port, Config.rdbm_db, Config.rdbm_user))
 
@@ -123,6 +181,7 @@ class DBUtils(SetupUtils):
 
         try:
             self.engine = sqlalchemy.create_engine(bind_uri)
+            dbMetrics.instrument_sqlalchemy_engine(self.engine, Config.rdbm_type)
             logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
             Session = sqlalchemy.orm.sessionmaker(bind=self.engine)
             self.session = Session()
@@ -165,30 +224,31 @@ class DBUtils(SetupUtils):
         return self.sqlconnection(log)
 
     def read_gluu_schema(self, others=[]):
-        self.gluu_attributes = []
+        self.schema = schemaRegistry.get(extra_schema_files=others)
+
+        self.gluu_attributes = self.schema.attribute_types
+        # tables (object classes) that can hold an rdn attribute
+        self.rdn_tables = self.schema.rdn_tables
+        self.container_tables = {}
 
-        for schema_fn_ in ['gluu_schema.json', 'custom_schema.json'] + others:
-            schema_fn = schema_fn_ if schema_fn_.startswith('/') else os.path.join(Config.install_dir, 'schema', schema_fn_)
-            schema = base.readJsonFile(schema_fn)
-            self.gluu_attributes += schema['attributeTypes']
+        self.ldap_sql_data_type_mapping = self.schema.ldap_sql_data_type_mapping
+        self.sql_data_types = self.schema.sql_data_types
+        self.opendj_attributes_syntax = self.schema.opendj_attributes_syntax
+        self.sub_tables = self.schema.sub_tables
 
-        self.ldap_sql_data_type_mapping = base.readJsonFile(os.path.join(Config.static_rdbm_dir, 'ldap_sql_data_type_mapping.json'))
-        self.sql_data_types = base.readJsonFile(os.path.join(Config.static_rdbm_dir, 'sql_data_types.json'))
-        self.opendj_attributes_syntax = base.readJsonFile(os.path.join(Config.static_rdbm_dir, 'opendj_attributes_syntax.json'))
-        self.sub_tables = base.readJsonFile(os.path.join(Config.static_rdbm_dir, 'sub_tables.json'))
+    def get_attr_info(self, attrname):
+        """Returns ldap syntax, data type, sql type for each rdbm backend,
+        multivaluedness and sub tables of attribute attrname"""
 
-        for attr in attribDataTypes.listAttributes:
-            if attr not in self.sql_data_types:
-                self.sql_data_types[attr] = { 'mysql': {'type': 'JSON'}, 'pgsql': {'type': 'JSONB'},  'spanner': {'type': 'ARRAY<STRING(MAX)>'} }
+        return self.schema.get_attr_info(attrname)
 
     def in_subtable(self, table, attr):
-        if table in self.sub_tables[Config.rdbm_type]:
-            for stbl in self.sub_tables[Config.rdbm_type][table]:
-                if stbl[0] == attr:
-                    return True
+        return table in self.get_attr_info(attr)['sub_tables'].get(Config.rdbm_type, [])
 
+    @profiler.trace('db')
     def exec_rdbm_query(self, query, getresult=False):
         base.logIt("Executing {} Query: {}".format(Config.rdbm_type, query))
+        profiler.add_args(query=query[:200])
         if Config.rdbm_type in ('mysql', 'pgsql'):
             try:
                 qresult = self.session.execute(query)
@@ -202,10 +262,11 @@ class DBUtils(SetupUtils):
                 elif getresult:
                     return qresult.fetchall()
         elif Config.rdbm_type == 'spanner':
+            self.spanner_tables = None
             self.spanner_client.exec_sql(query.strip(';'))
 
     def set_cbm(self):
-        self.cbm = CBM(Config.get('cb_query_node', Config.couchbase_hostname), Config.get('couchebaseClusterAdmin'), Config.get('cb_password'))
+        self.cbm = cbm_module.CBM(Config.get('cb_query_node', Config.couchbase_hostname), Config.get('couchebaseClusterAdmin'), Config.get('cb_password'))
 
     def get_oxAuthConfDynamic(self):
         if not Config.loadData:
@@ -329,6 +390,7 @@ class DBUtils(SetupUtils):
             n1ql = 'UPDATE `{}` USE KEYS "configuration_oxtrust" SET `oxTrustConfApplication`={}'.format(self.default_bucket, oxTrustConfApplication_js)
             self.cbm.exec_query(n1ql)
 
+    @profiler.trace('db')
     def enable_script(self, inum, enable=True):
         if not Config.loadData:
             return
@@ -376,6 +438,7 @@ class DBUtils(SetupUtils):
             n1ql = 'UPDATE `{}` USE KEYS "configuration" SET {}=true'.format(self.default_bucket, service)
             self.cbm.exec_query(n1ql)
 
+    @profiler.trace('db')
     def set_configuration(self, component, value, dn='ou=configuration,o=gluu'):
         if not Config.loadData:
             return
@@ -404,15 +467,18 @@ class DBUtils(SetupUtils):
             self.spanner_client.write_data(table=table, columns=["doc_id", component], values=[doc_id, type_val], mutation='update')
 
         elif self.moddb == BackendTypes.COUCHBASE:
-            key = ldif_utils.get_key_from(dn)
+            key = self.resolve_dn(dn).key
             if isinstance(value, str):
                 value = json.dumps(value)
             n1ql = 'UPDATE `{}` USE KEYS "{}" SET {}={}'.format(self.default_bucket, key, component, value)
             self.cbm.exec_query(n1ql)
 
 
+    @profiler.trace('db')
+    @dbMetrics.trace_method('dn_exists')
     def dn_exists(self, dn, check_only=False):
-        mapping_location = self.get_backend_location_for_dn(dn)
+        resolved_dn = self.resolve_dn(dn)
+        mapping_location = resolved_dn.backend
 
         if mapping_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
             base.logIt("Querying RDBM for dn {}".format(dn))
@@ -437,8 +503,8 @@ class DBUtils(SetupUtils):
                     return key_doc[1]
 
         else:
-            bucket = self.get_bucket_for_dn(dn)
-            key = ldif_utils.get_key_from(dn)
+            bucket = resolved_dn.bucket
+            key = resolved_dn.key
             n1ql = 'SELECT * FROM `{}` USE KEYS "{}"'.format(bucket, key)
             result = self.cbm.exec_query(n1ql)
             if result.ok:
@@ -462,161 +528,223 @@ class DBUtils(SetupUtils):
         return self.session.query(sqlalchemy_table).filter(sqlalchemy_table.columns.dn == dn).first()
 
 
-    def search(self, search_base, search_filter='(objectClass=*)', search_scope=ldap3.LEVEL, fetchmany=False):
-        if not Config.loadData:
-            return {}
+    def get_rdbm_search_list(self, search_filter):
+        """Returns list of (attribute, value) tuples of simple ldap filters
+        and table name taken from objectClass"""
 
-        base.logIt("Searching database for dn {} with filter {}".format(search_base, search_filter))
-        backend_location = self.get_backend_location_for_dn(search_base)
+        search_list = []
+        s_table = None
 
-        if backend_location == BackendTypes.LDAP:
-            if self.ldap_conn.search(search_base=search_base, search_filter=search_filter, search_scope=search_scope, attributes=['*']):
-                if not fetchmany:
-                    key, document = ldif_utils.get_document_from_entry(self.ldap_conn.response[0]['dn'], self.ldap_conn.response[0]['attributes'])
-                    return document
+        if '&' in search_filter:
+            re_match = re.match('\(&\((.*?)=(.*?)\)\((.*?)=(.*?)\)', search_filter)
+            if re_match:
+                re_list = re_match.groups()
+                search_list.append((re_list[0], re_list[1]))
+                search_list.append((re_list[2], re_list[3]))
+        else:
+            re_match = re.match('\((.*?)=(.*?)\)', search_filter)
 
-                documents = []
-                for result in self.ldap_conn.response:
-                    key, document = ldif_utils.get_document_from_entry(result['dn'], result['attributes'])
-                    documents.append((key, document))
-                return documents
+            if re_match:
+                re_list = re_match.groups()
+                search_list.append((re_list[0], re_list[1]))
 
-        if backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL, BackendTypes.SPANNER):
-            if backend_location != BackendTypes.SPANNER and self.Base is None:
-                self.rdm_automapper()
+        for col, val in search_list:
+            if col.lower() == 'objectclass':
+                s_table = val
+                break
 
-            s_table = None
-            where_clause = ''
-            search_list = []
+        return s_table, search_list
 
-            if '&' in search_filter:
-                re_match = re.match('\(&\((.*?)=(.*?)\)\((.*?)=(.*?)\)', search_filter)
-                if re_match:
-                    re_list = re_match.groups()
-                    search_list.append((re_list[0], re_list[1]))
-                    search_list.append((re_list[2], re_list[3]))
-            else:
-                re_match = re.match('\((.*?)=(.*?)\)', search_filter)
+    def get_spanner_search_sql(self, search_base, s_table, search_list, search_scope):
+        where_clause = ''
+        for col, val in search_list:
+            if val == '*' or col.lower() == 'objectclass':
+                continue
 
-                if re_match:
-                    re_list = re_match.groups()
-                    search_list.append((re_list[0], re_list[1]))
+            val = val.replace('*', '%')
+            q_operator = 'LIKE' if '%' in val else '='
+            where_clause = 'AND {} {} "{}"'.format(col, q_operator, val)
 
+        if search_scope == ldap3.BASE:
+            dn_clause = 'dn = "{}"'.format(search_base)
+        else:
+            dn_clause = 'dn LIKE "%{}"'.format(search_base)
 
-            for col, val in search_list:
-                if col.lower() == 'objectclass':
-                    s_table = val
-                    break
+        return 'SELECT * FROM {} WHERE ({}) {}'.format(s_table, dn_clause, where_clause)
 
-            if not s_table:
-                return
+    def get_sqlalchemy_search_query(self, search_base, s_table, search_list, search_scope):
+        sqlalchemy_table = self.Base.classes[s_table]
+        sqlalchemyQueryObject = self.session.query(sqlalchemy_table)
 
-            if backend_location == BackendTypes.SPANNER:
+        for col, val in search_list:
+            if val == '*':
+                continue
 
-                if fetchmany:
-                    retVal = []
+            if col.lower() != 'objectclass':
+                val = val.replace('*', '%')
+                sqlalchemyCol = getattr(sqlalchemy_table, col)
+                if '%' in val:
+                    sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemyCol.like(val))
                 else:
-                    retVal = {}
+                    sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemyCol == val)
 
-                for col, val in search_list:
-                    if val == '*':
-                        continue
+        if search_scope == ldap3.BASE:
+            sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemy_table.dn == search_base)
+        else:
+            sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemy_table.dn.like('%'+search_base))
 
-                    if col.lower() == 'objectclass':
-                        s_table = val
-                    else:
-                        val = val.replace('*', '%')
-                        q_operator = 'LIKE' if '%' in val else '='
-                        where_clause = 'AND {} {} "{}"'.format(col, q_operator, val)
+        return sqlalchemyQueryObject
 
-                if not s_table:
-                    return retVal
+    def get_couchbase_search_clause(self, search_filter):
+        if '&' in search_filter:
+            re_match = re.match('\(&\((.*?)\)\((.*?)\)\)', search_filter)
+            if re_match:
+                re_list = re_match.groups()
+                dn_to_parse = re_list[0] if 'objectclass' in re_list[1].lower() else re_list[1]
+        else:
+            dn_to_parse = search_filter.strip('(').strip(')')
 
-                if search_scope == ldap3.BASE:
-                    dn_clause = 'dn = "{}"'.format(search_base)
-                else:
-                    dn_clause = 'dn LIKE "%{}"'.format(search_base)
+        parsed_dn = dnutils.parse_dn(dn_to_parse)
+        attr = parsed_dn[0][0]
+        val = parsed_dn[0][1]
+        if '*' in val:
+            search_clause = 'LIKE "{}"'.format(val.replace('*', '%'))
+        else:
+            search_clause = '="{}"'.format(val.replace('*', '%'))
 
-                sql_cmd = 'SELECT * FROM {} WHERE ({}) {}'.format(s_table, dn_clause, where_clause)
+        return '`{}` {}'.format(attr, search_clause)
 
-                retVal = self.spanner_client.get_dict_data(sql_cmd)
-                if not fetchmany and retVal:
-                    retVal = retVal[0]
+    @profiler.trace('db')
+    def search(self, search_base, search_filter='(objectClass=*)', search_scope='LEVEL', fetchmany=False):
+        if not Config.loadData:
+            return {}
 
-                return retVal
+        if fetchmany:
+            return list(self.iter_search(search_base, search_filter, search_scope))
 
-            sqlalchemy_table = self.Base.classes[s_table]
-            sqlalchemyQueryObject = self.session.query(sqlalchemy_table)
+        base.logIt("Searching database for dn {} with filter {}".format(search_base, search_filter))
+        resolved_dn = self.resolve_dn(search_base)
+        backend_location = resolved_dn.backend
 
-            for col, val in search_list:
-                if val == '*':
-                    continue
+        if backend_location == BackendTypes.LDAP:
+            if self.ldap_conn.search(search_base=search_base, search_filter=search_filter, search_scope=search_scope, attributes=['*']):
+                key, document = ldif_utils.get_document_from_entry(self.ldap_conn.response[0]['dn'], self.ldap_conn.response[0]['attributes'])
+                return document
 
-                if col.lower() != 'objectclass':
-                    val = val.replace('*', '%')
-                    sqlalchemyCol = getattr(sqlalchemy_table, col)
-                    if '%' in val:
-                        sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemyCol.like(val))
-                    else:
-                        sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemyCol == val)
+        if backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL, BackendTypes.SPANNER):
+            if backend_location != BackendTypes.SPANNER and self.Base is None:
+                self.rdm_automapper()
 
-            if search_scope == ldap3.BASE:
-                sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemy_table.dn == search_base)
-            else:
-                sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemy_table.dn.like('%'+search_base))
+            s_table, search_list = self.get_rdbm_search_list(search_filter)
+
+            if not s_table:
+                return
 
-            if fetchmany:
-                result = sqlalchemyQueryObject.all()
-                return [ item.__dict__ for item in result ]
+            if backend_location == BackendTypes.SPANNER:
+                sql_cmd = self.get_spanner_search_sql(search_base, s_table, search_list, search_scope)
+                retVal = self.spanner_client.get_dict_data(sql_cmd)
+                return retVal[0] if retVal else {}
 
-            else:
-                result = sqlalchemyQueryObject.first()
-                if result:
-                    return result.__dict__
+            result = self.get_sqlalchemy_search_query(search_base, s_table, search_list, search_scope).first()
+            if result:
+                return result.__dict__
 
 
         if backend_location == BackendTypes.COUCHBASE:
-            key = ldif_utils.get_key_from(search_base)
-            bucket = self.get_bucket_for_key(key)
+            key = resolved_dn.key
+            bucket = resolved_dn.bucket
 
             if search_scope == ldap3.BASE:
                 n1ql = 'SELECT * FROM `{}` USE KEYS "{}"'.format(bucket, key)
             else:
-
-                if '&' in search_filter:
-                    re_match = re.match('\(&\((.*?)\)\((.*?)\)\)', search_filter)
-                    if re_match:
-                        re_list = re_match.groups()
-                        dn_to_parse = re_list[0] if 'objectclass' in re_list[1].lower() else re_list[1]
-                else:
-                    dn_to_parse = search_filter.strip('(').strip(')')
-
-                parsed_dn = dnutils.parse_dn(dn_to_parse)
-                attr = parsed_dn[0][0]
-                val = parsed_dn[0][1]
-                if '*' in val:
-                    search_clause = 'LIKE "{}"'.format(val.replace('*', '%'))
-                else:
-                    search_clause = '="{}"'.format(val.replace('*', '%'))
-
-                n1ql = 'SELECT * FROM `{}` WHERE `{}` {}'.format(bucket, attr, search_clause)
+                n1ql = 'SELECT * FROM `{}` WHERE {}'.format(bucket, self.get_couchbase_search_clause(search_filter))
 
             result = self.cbm.exec_query(n1ql)
             if result.ok:
                 data = result.json()
                 if data.get('results'):
-                    if fetchmany:
-                        return [ item[bucket] for item in data['results'] ]
-                    else:
-                        return data['results'][0][bucket]
+                    return data['results'][0][bucket]
+
+    def iter_search(self, search_base, search_filter='(objectClass=*)', search_scope='LEVEL', page_size=None):
+        """Yields search results page by page, so that only one page is kept in
+        memory. Items are the same as list items returned by search(fetchmany=True)"""
+
+        if not Config.loadData:
+            return
+
+        page_size = page_size or Config.search_page_size
+        base.logIt("Searching database for dn {} with filter {} (page size {})".format(search_base, search_filter, page_size))
+        resolved_dn = self.resolve_dn(search_base)
+        backend_location = resolved_dn.backend
+
+        if backend_location == BackendTypes.LDAP:
+            for result in self.ldap_conn.extend.standard.paged_search(
+                                        search_base=search_base,
+                                        search_filter=search_filter,
+                                        search_scope=search_scope,
+                                        attributes=['*'],
+                                        paged_size=page_size,
+                                        generator=True
+                                        ):
+                if result.get('type') == 'searchResEntry':
+                    yield ldif_utils.get_document_from_entry(result['dn'], result['attributes'])
+
+        elif backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL, BackendTypes.SPANNER):
+            if backend_location != BackendTypes.SPANNER and self.Base is None:
+                self.rdm_automapper()
 
+            s_table, search_list = self.get_rdbm_search_list(search_filter)
+
+            if not s_table:
+                return
+
+            if backend_location == BackendTypes.SPANNER:
+                sql_cmd = self.get_spanner_search_sql(search_base, s_table, search_list, search_scope)
+                yield from self.spanner_client.iter_dict_data(sql_cmd)
+                return
+
+            # yield_per fetches rows in batches (server side cursor on PostgreSQL)
+            for item in self.get_sqlalchemy_search_query(search_base, s_table, search_list, search_scope).yield_per(page_size):
+                yield item.__dict__
+
+        elif backend_location == BackendTypes.COUCHBASE:
+            key = resolved_dn.key
+            bucket = resolved_dn.bucket
+
+            if search_scope == ldap3.BASE:
+                result = self.cbm.exec_query('SELECT * FROM `{}` USE KEYS "{}"'.format(bucket, key))
+                if result.ok:
+                    for item in result.json().get('results', []):
+                        yield item[bucket]
+                return
+
+            # keyset pagination on document keys, OFFSET would rescan skipped documents
+            search_clause = self.get_couchbase_search_clause(search_filter)
+            last_key = ''
+            while True:
+                n1ql = 'SELECT META().id AS `_key`, * FROM `{}` WHERE {} AND META().id > "{}" ORDER BY META().id LIMIT {}'.format(bucket, search_clause, last_key, page_size)
+                result = self.cbm.exec_query(n1ql)
+                if not result.ok:
+                    return
+
+                results = result.json().get('results', [])
+                for item in results:
+                    yield item[bucket]
+
+                if len(results) < page_size:
+                    return
+
+                last_key = results[-1]['_key']
+
+    @profiler.trace('db')
     def delete_dn(self, dn):
         if self.dn_exists(dn):
-            backend_location = self.get_backend_location_for_dn(dn)
+            resolved_dn = self.resolve_dn(dn)
+            backend_location = resolved_dn.backend
 
             if backend_location == BackendTypes.LDAP:
                 def recursive_delete(dn):
-                    self.ldap_conn.search(search_base=dn, search_filter='(objectClass=*)', search_scope=ldap3.LEVEL)
+                    self.ldap_conn.search(search_base=dn, search_filter='(objectClass=*)', search_scope='LEVEL')
                     for entry in self.ldap_conn.response:
                         recursive_delete(entry['dn'])
                     self.ldap_conn.delete(dn)
@@ -633,14 +761,14 @@ class DBUtils(SetupUtils):
                 data = self.spanner_client.get_dict_data('SELECT doc_id FROM {} WHERE dn="{}"'.format(tbl, dn))
                 if data:
                     doc_id = data[0]['doc_id']
-                    self.spanner_client.delete_data_data(tbl, doc_id)
+                    self.spanner_client.delete_data(tbl, doc_id)
 
             elif backend_location == BackendTypes.COUCHBASE:
-                key = ldif_utils.get_key_from(dn)
-                bucket =self.get_bucket_for_key(key)
-                n1ql = 'DELETE FROM `{}` USE KEYS "{}"'.format(bucket, key)
+                n1ql = 'DELETE FROM `{}` USE KEYS "{}"'.format(resolved_dn.bucket, resolved_dn.key)
                 self.cbm.exec_query(n1ql)
 
+            self.uncache_dn(dn)
+
 
     def add2strlist(self, client_id, strlist):
         value2 = []
@@ -767,28 +895,44 @@ class DBUtils(SetupUtils):
             base.logIt("Ldap modify operation failed {}".format(str(self.ldap_conn.result)), True)
 
 
-    def get_attr_syntax(self, attrname):
-        for gluu_attr in self.gluu_attributes:
-            if attrname in gluu_attr['names']:
-                if gluu_attr.get('multivalued'):
-                    return 'JSON'
-                return gluu_attr['syntax']
-        else:
-            opendj_syntax = self.opendj_attributes_syntax.get(attrname)
-            if opendj_syntax is None:
-                opendj_syntax = '1.3.6.1.4.1.1466.115.121.1.15'
+    def make_ldap_writer_connection(self):
+        conn = ldap3.Connection(
+                    self.ldap_server,
+                    user=Config.ldap_binddn,
+                    password=Config.ldapPass,
+                    client_strategy=ldap3.ASYNC,
+                    )
+        conn.bind()
+        return conn
+
+    def get_ldap_writer(self):
+        if not self.ldap_writer:
+            self.ldap_writer = LDAPWriter(
+                        self.make_ldap_writer_connection,
+                        Config.get('ldap_import_connections', 4),
+                        Config.get('ldap_import_in_flight', 64)
+                        )
+        return self.ldap_writer
 
-            return opendj_syntax
+    @profiler.trace('db')
+    def flush_ldap_writer(self):
+        if not self.ldap_writer or not self.ldap_writer.in_flight:
+            return
 
-    def get_rootdn(self, dn):
-        dn_parsed = dnutils.parse_dn(dn)
-        dn_parsed.pop(0)
-        dnl=[]
+        stats = self.ldap_writer.flush()
+        profiler.add_args(**stats)
+        base.logIt("LDAP write statistics: {}".format(stats))
+
+    def close_ldap_writer(self):
+        if self.ldap_writer:
+            self.ldap_writer.close()
+            self.ldap_writer = None
 
-        for dnp in dn_parsed:
-            dnl.append('='.join(dnp[:2]))
+    def get_attr_syntax(self, attrname):
+        return self.get_attr_info(attrname)['syntax']
 
-        return ','.join(dnl)
+    def get_rootdn(self, dn):
+        return ','.join(['='.join(rdn[:2]) for rdn in self.resolve_dn(dn).rdns[1:]])
 
 
     def rdm_automapper(self, force=False):
@@ -812,11 +956,73 @@ class DBUtils(SetupUtils):
         base.logIt("Reflected tables {}".format(list(self.metadata.tables.keys())))
 
 
+    def get_dn_container(self, dn):
+        return self.resolve_dn(dn).container
+
+    def cache_dn_location(self, dn, table, doc_id=None):
+        if self.dn_cache is None:
+            self.dn_cache = OrderedDict()
+
+        self.dn_cache[dn] = (table, doc_id or self.get_doc_id_from_dn(dn))
+        self.dn_cache.move_to_end(dn)
+        if len(self.dn_cache) > self.dn_cache_size:
+            self.dn_cache.popitem(last=False)
+
+        if hasattr(self, 'container_tables'):
+            self.container_tables[self.get_dn_container(dn)] = table
+
+    def get_cached_dn_location(self, dn):
+        if self.dn_cache and dn in self.dn_cache:
+            self.dn_cache.move_to_end(dn)
+            return self.dn_cache[dn]
+
+    def uncache_dn(self, dn):
+        if self.dn_cache and dn in self.dn_cache:
+            del self.dn_cache[dn]
+
+    def get_candidate_tables_for_dn(self, dn, tables):
+        """Returns tables that may hold dn, most probable first. Tables which
+        already hold siblings of dn come first, then tables having rdn attribute
+        of dn in schema"""
+
+        candidates = []
+        container = self.get_dn_container(dn)
+
+        if container in getattr(self, 'container_tables', {}) and self.container_tables[container] in tables:
+            candidates.append(self.container_tables[container])
+
+        rdn_attr = container.split(',')[0]
+        for table in getattr(self, 'rdn_tables', {}).get(rdn_attr, []):
+            if table in tables and table not in candidates:
+                candidates.append(table)
+
+        return candidates
+
     def get_sqlalchObj_for_dn(self, dn):
 
+        location = self.get_cached_dn_location(dn)
+        if location and location[0] in self.Base.classes:
+            tbl = self.Base.classes[location[0]]
+            result = self.session.query(tbl).filter(tbl.dn == dn).first()
+            if result:
+                return result
+            self.uncache_dn(dn)
+
+        tried_tables = []
+        for table in self.get_candidate_tables_for_dn(dn, self.Base.classes.keys()):
+            tbl = self.Base.classes[table]
+            tried_tables.append(table)
+            result = self.session.query(tbl).filter(tbl.dn == dn).first()
+            if result:
+                self.cache_dn_location(dn, table, result.doc_id)
+                return result
+
         for tbl in self.Base.classes:
+            if tbl.__table__.name in tried_tables:
+                continue
             result = self.session.query(tbl).filter(tbl.dn == dn).first()
             if result:
+                self.cache_dn_location(dn, tbl.__table__.name, result.doc_id)
                 return result
 
         for tbl in self.Base.classes:
@@ -837,15 +1043,7 @@ class DBUtils(SetupUtils):
             return table in metadata
 
     def get_attr_sql_data_type(self, key):
-        if key in self.sql_data_types:
-            data_type = self.sql_data_types[key]
-        else:
-            attr_syntax = self.get_attr_syntax(key)
-            data_type = self.ldap_sql_data_type_mapping[attr_syntax]
-
-        data_type = (data_type.get(Config.rdbm_type) or data_type['mysql'])['type']
-
-        return data_type
+        return self.get_attr_info(key)['sql_types'][Config.rdbm_type]
 
     def get_rdbm_val(self, key, val, rdbm_type=None):
 
@@ -889,19 +1087,22 @@ class DBUtils(SetupUtils):
         return objectClass
 
     def get_doc_id_from_dn(self, dn):
-        dn_parsed = dnutils.parse_dn(dn)
-        doc_id = dn_parsed[0][1]
-        if doc_id == 'gluu':
-            return '_'
-        return doc_id
+        return self.resolve_dn(dn).doc_id
 
     def get_spanner_table_for_dn(self, dn):
-        tables = self.spanner_client.get_tables()
+        location = self.get_cached_dn_location(dn)
+        if location:
+            return location[0]
+
+        if self.spanner_tables is None:
+            self.spanner_tables = self.spanner_client.get_tables()
 
-        for table in tables:
+        candidates = self.get_candidate_tables_for_dn(dn, self.spanner_tables)
+        for table in candidates + [ table for table in self.spanner_tables if table not in candidates ]:
             sql_cmd = 'SELECT doc_id FROM {} WHERE dn="{}"'.format(table, dn)
             result = self.spanner_client.get_dict_data(sql_cmd)
             if result:
+                self.cache_dn_location(dn, table, result[0]['doc_id'])
                 return table
 
     def get_sha_digest(self, val):
@@ -909,43 +1110,149 @@ class DBUtils(SetupUtils):
         msha.update(val.encode())
         return msha.digest().hex()
 
+    def rdbm_batch_add(self, table_name, vals):
+        if self.rdbm_batch is None:
+            self.rdbm_batch = OrderedDict()
+            self.rdbm_batch_count = 0
+            self.rdbm_imported_count = 0
+
+        self.rdbm_batch.setdefault(table_name, OrderedDict())
+        if vals['dn'] in self.rdbm_batch[table_name]:
+            base.logIt("DN {} was already queued for {} skipping".format(vals['dn'], Config.rdbm_type))
+            return
+
+        self.rdbm_batch[table_name][vals['dn']] = vals
+        self.rdbm_batch_count += 1
+
+        if self.rdbm_batch_count >= int(Config.get('rdbm_batch_size', 1000)):
+            self.flush_rdbm_batch()
+
+    def get_existing_dns_rdbm(self, table, dn_list):
+        sqlalchemy_table = self.Base.classes[table].__table__
+        result = self.session.query(sqlalchemy_table.columns.dn).filter(sqlalchemy_table.columns.dn.in_(dn_list)).all()
+        return { row[0] for row in result }
+
+    @profiler.trace('db')
+    def flush_spanner_mutations(self):
+        self.spanner_client.flush_mutations()
+
+        # rows also fail when mutation buffer is flushed while buffering
+        failed_rows = set()
+        for mutation, table, row, error in self.spanner_client.pop_failed_rows():
+            base.logIt("Spanner {} of {} in {} failed: {}".format(mutation, row[0], table, error), True)
+            failed_rows.add((table, row[0]))
+
+        # cache locations of buffered entries once they are committed
+        for dn, table, doc_id in self.spanner_pending_locations or []:
+            if (table, doc_id) not in failed_rows:
+                self.cache_dn_location(dn, table, doc_id)
+        self.spanner_pending_locations = []
+
+    @profiler.trace('db')
+    def flush_rdbm_batch(self):
+        if not self.rdbm_batch:
+            return
+
+        for table_name, rows_dict in self.rdbm_batch.items():
+            existing_dns = self.get_existing_dns_rdbm(table_name, list(rows_dict.keys()))
+            for dn in existing_dns:
+                base.logIt("DN {} exsits in {} skipping".format(dn, Config.rdbm_type))
+
+            rows = [ rows_dict[dn] for dn in rows_dict if dn not in existing_dns ]
+            if not rows:
+                continue
+
+            sqlalchCls = self.Base.classes[table_name]
+            base.logIt("Adding {} rows to {}".format(len(rows), table_name))
+            try:
+                self.session.bulk_insert_mappings(sqlalchCls, rows)
+                self.session.commit()
+            except Exception as e:
+                # find out which row causes error by inserting them one by one
+                self.session.rollback()
+                base.logIt("Bulk insert to {} failed: {}. Retrying row by row".format(table_name, e), True)
+                for vals in rows:
+                    try:
+                        self.session.bulk_insert_mappings(sqlalchCls, [vals])
+                        self.session.commit()
+                    except Exception as e:
+                        self.session.rollback()
+                        self.uncache_dn(vals['dn'])
+                        base.logIt("Adding {} failed: {}".format(vals['dn'], e), True)
+
+            self.rdbm_imported_count += len(rows)
+
+        profiler.add_args(rows=self.rdbm_batch_count)
+        Config.pbar.progress(self.rdbm_pbar_name, "Imported {} entries to {}".format(self.rdbm_imported_count, Config.rdbm_type), False)
+
+        self.rdbm_batch = OrderedDict()
+        self.rdbm_batch_count = 0
+
+    def couchbase_batch_add(self, bucket, key, document):
+        if self.couchbase_batch is None:
+            self.couchbase_batch = OrderedDict()
+
+        self.couchbase_batch.setdefault(bucket, [])
+        self.couchbase_batch[bucket].append((key, document))
+
+        if len(self.couchbase_batch[bucket]) >= int(Config.get('couchbase_batch_size', 100)):
+            self.cbm.upsert_documents(bucket, self.couchbase_batch.pop(bucket))
+
+    @profiler.trace('db')
+    def flush_couchbase_batch(self):
+        if not self.couchbase_batch:
+            return
+
+        for bucket in self.couchbase_batch:
+            if self.couchbase_batch[bucket]:
+                self.cbm.upsert_documents(bucket, self.couchbase_batch[bucket])
+
+        profiler.add_args(rows=sum([len(self.couchbase_batch[bucket]) for bucket in self.couchbase_batch]))
+
+        self.couchbase_batch = OrderedDict()
+
+    @profiler.trace('db')
     def import_ldif(self, ldif_files, bucket=None, force=None):
         if not Config.loadData:
             return
 
         base.logIt("Importing ldif file(s): {} ".format(', '.join(ldif_files)))
+        profiler.add_args(files=', '.join([os.path.basename(ldif_fn) for ldif_fn in ldif_files]))
 
         sql_data_fn = os.path.join(Config.outputFolder, Config.rdbm_type, 'gluu_data.sql')
 
         for ldif_fn in ldif_files:
             base.logIt("Importing entries from " + ldif_fn)
             parser = ldif_utils.myLdifParser(ldif_fn)
-            parser.parse()
 
-            for dn, entry in parser.entries:
-                backend_location = force if force else self.get_backend_location_for_dn(dn)
+            for dn, entry in parser.iter_entries():
+                resolved_dn = self.resolve_dn(dn)
+                backend_location = force if force else resolved_dn.backend
                 if backend_location == BackendTypes.LDAP:
+                    ldap_writer = self.get_ldap_writer()
                     if 'add' in  entry and 'changetype' in entry:
                         base.logIt("LDAP modify add dn:{} entry:{}".format(dn, dict(entry)))
                         change_attr = entry['add'][0]
-                        ldap_operation_result = self.ldap_conn.modify(dn, {change_attr: [(ldap3.MODIFY_ADD, entry[change_attr])]})
-                        self.log_ldap_result(ldap_operation_result)
+                        ldap_writer.modify(dn, {change_attr: [(ldap3.MODIFY_ADD, entry[change_attr])]}, resolved_dn.rdns)
 
                     elif 'replace' in  entry and 'changetype' in entry:
                         base.logIt("LDAP modify replace dn:{} entry:{}".format(dn, dict(entry)))
                         change_attr = entry['replace'][0]
-                        ldap_operation_result = self.ldap_conn.modify(dn, {change_attr: [(ldap3.MODIFY_REPLACE, [entry[change_attr][0]])]})
-                        self.log_ldap_result(ldap_operation_result)
+                        ldap_writer.modify(dn, {change_attr: [(ldap3.MODIFY_REPLACE, [entry[change_attr][0]])]}, resolved_dn.rdns)
 
-                    elif not self.dn_exists(dn):
+                    else:
+                        # added optimistically, existing entries are skipped by writer
                         base.logIt("Adding LDAP dn:{} entry:{}".format(dn, dict(entry)))
-                        ldap_operation_result = self.ldap_conn.add(dn, attributes=entry)
-                        self.log_ldap_result(ldap_operation_result)
+                        ldap_writer.add(dn, entry, resolved_dn.rdns)
 
                 elif backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
                     if self.Base is None:
                         self.rdm_automapper()
 
+                    if 'changetype' in entry:
+                        # modifications may target entries waiting in batch
+                        self.flush_rdbm_batch()
+
                     if 'add' in  entry and 'changetype' in entry:
                         attribute = entry['add'][0]
                         new_val = entry[attribute]
@@ -983,13 +1290,11 @@ class DBUtils(SetupUtils):
 
                     else:
                         vals = {}
-                        dn_parsed = dnutils.parse_dn(dn)
-                        rdn_name = dn_parsed[0][0]
                         objectClass = self.get_clean_objcet_class(entry)
                         if objectClass.lower() == 'organizationalunit':
                             continue
 
-                        vals['doc_id'] = self.get_doc_id_from_dn(dn)
+                        vals['doc_id'] = resolved_dn.doc_id
                         vals['dn'] = dn
                         vals['objectClass'] = objectClass
 
@@ -1001,44 +1306,31 @@ class DBUtils(SetupUtils):
 
                         table_name = objectClass
 
-                        if self.dn_exists_rdbm(dn, table_name):
-                            base.logIt("DN {} exsits in {} skipping".format(dn, Config.rdbm_type))
-                            continue
-
                         for lkey in entry:
                             vals[lkey] = self.get_rdbm_val(lkey, entry[lkey])
 
-                        sqlalchCls = self.Base.classes[table_name]
-
-                        #for col in sqlalchCls.__table__.columns:
-                        #    if isinstance(col.type, self.json_dialects_instance) and col.name not in vals:
-                        #        vals[col.name] = {'v': []} if Config.rdbm_type == 'mysql' else []
-
-                        sqlalchObj = sqlalchCls()
-
-                        for v in vals:
-                            setattr(sqlalchObj, v, vals[v])
-
-                        base.logIt("Adding {}".format(sqlalchObj.doc_id))
-                        self.session.add(sqlalchObj)
-                        self.session.commit()
+                        base.logIt("Queuing {} for {}".format(vals['doc_id'], table_name))
+                        self.rdbm_batch_add(table_name, vals)
+                        self.cache_dn_location(dn, table_name, vals['doc_id'])
 
 
                 elif backend_location == BackendTypes.SPANNER:
 
+                    if 'changetype' in entry:
+                        # modifications read current data, write buffered mutations first
+                        self.flush_spanner_mutations()
+
                     if 'add' in  entry and 'changetype' in entry:
                         table = self.get_spanner_table_for_dn(dn)
-                        doc_id = self.get_doc_id_from_dn(dn)
+                        doc_id = resolved_dn.doc_id
                         change_attr = entry['add'][0]
                         if table:
-                            doc_id = self.get_doc_id_from_dn(dn)
-
                             if self.in_subtable(table, change_attr):
                                 sub_table = '{}_{}'.format(table, change_attr)
                                 for subval in entry[change_attr]:
                                     typed_val = self.get_rdbm_val(change_attr, subval, rdbm_type='spanner')
                                     dict_doc_id = self.get_sha_digest(typed_val)
-                                    self.spanner_client.write_data(table=sub_table, columns=['doc_id', 'dict_doc_id', change_attr], values=[doc_id, typed_val, typed_val])
+                                    self.spanner_client.buffer_mutation('insert', table=sub_table, columns=['doc_id', 'dict_doc_id', change_attr], values=[doc_id, dict_doc_id, typed_val])
 
                             else:
                                 data_list = self.spanner_client.get_dict_data('SELECT {} FROM {} WHERE doc_id="{}"'.format(entry['add'][0], table, doc_id))
@@ -1054,7 +1346,7 @@ class DBUtils(SetupUtils):
 
                     elif 'replace' in entry and 'changetype' in entry:
                         table = self.get_spanner_table_for_dn(dn)
-                        doc_id = self.get_doc_id_from_dn(dn)
+                        doc_id = resolved_dn.doc_id
                         replace_attr = entry['replace'][0]
                         typed_val = self.get_rdbm_val(replace_attr, entry[replace_attr], rdbm_type='spanner')
 
@@ -1068,13 +1360,11 @@ class DBUtils(SetupUtils):
 
                     else:
                         vals = {}
-                        dn_parsed = dnutils.parse_dn(dn)
-                        rdn_name = dn_parsed[0][0]
                         objectClass = objectClass = self.get_clean_objcet_class(entry)
                         if objectClass.lower() == 'organizationalunit':
                             continue
 
-                        doc_id = self.get_doc_id_from_dn(dn)
+                        doc_id = resolved_dn.doc_id
                         vals['doc_id'] = doc_id
                         vals['dn'] = dn
                         vals['objectClass'] = objectClass
@@ -1104,21 +1394,27 @@ class DBUtils(SetupUtils):
                         columns = [ *vals.keys() ]
                         values = [ vals[lkey] for lkey in columns ]
 
-                        self.spanner_client.write_data(table=table_name, columns=columns, values=values)
+                        self.spanner_client.buffer_mutation('insert', table=table_name, columns=columns, values=values)
+                        if self.spanner_pending_locations is None:
+                            self.spanner_pending_locations = []
+                        self.spanner_pending_locations.append((dn, table_name, doc_id))
 
-                        for sdata in subtable_data:
-                            self.spanner_client.write_data(table=sdata[0], columns=sdata[1], values=sdata[2][0])
+                        for sub_table, sub_table_columns, sub_table_values in subtable_data:
+                            for sub_table_row in sub_table_values:
+                                self.spanner_client.buffer_mutation('insert', table=sub_table, columns=sub_table_columns, values=sub_table_row)
 
                 elif backend_location == BackendTypes.COUCHBASE:
                     if len(entry) < 3:
                         continue
-                    key, document = ldif_utils.get_document_from_entry(dn, entry)
-                    cur_bucket = bucket if bucket else self.get_bucket_for_dn(dn)
+                    key, document = ldif_utils.get_document_from_entry(dn, entry, resolved_dn.key)
+                    cur_bucket = bucket if bucket else resolved_dn.bucket
                     base.logIt("Addnig document {} to Couchebase bucket {}".format(key, cur_bucket))
 
                     n1ql_list = []
 
                     if 'changetype' in document:
+                        # modified document may be waiting in batch
+                        self.flush_couchbase_batch()
                         if 'replace' in document:
                             attribute = document['replace']
                             n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=%s' % (cur_bucket, key, attribute, json.dumps(document[attribute])))
@@ -1127,13 +1423,13 @@ class DBUtils(SetupUtils):
                             result = self.check_attribute_exists(key, attribute)
                             data = document[attribute]
                             if result:
-                                if isinstance(data, list):
-                                    for d in data:
-                                        n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=ARRAY_APPEND(`%s`, %s)' % (cur_bucket, key, attribute, attribute, json.dumps(d)))
-                                else:
-                                    n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=ARRAY_APPEND(`%s`, %s)' % (cur_bucket, key, attribute, attribute, json.dumps(data)))
+                                if not isinstance(data, list):
+                                    data = [data]
+                                # append all values with a single statement
+                                append_values = ', '.join([json.dumps(d) for d in data])
+                                n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=ARRAY_APPEND(`%s`, %s)' % (cur_bucket, key, attribute, attribute, append_values))
                             else:
-                                if attribute in attribDataTypes.listAttributes and not isinstance(data, list):
+                                if attribDataTypes.isListAttribute(attribute) and not isinstance(data, list):
                                     data = [data]
                                 n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=%s' % (cur_bucket, key, attribute, json.dumps(data)))
                     else:
@@ -1145,17 +1441,22 @@ class DBUtils(SetupUtils):
                             except:
                                 pass
 
-                        n1ql_list.append('UPSERT INTO `%s` (KEY, VALUE) VALUES ("%s", %s)' % (cur_bucket, key, json.dumps(document)))
+                        self.couchbase_batch_add(cur_bucket, key, document)
 
                     for q in n1ql_list:
                         self.cbm.exec_query(q)
 
+            self.flush_ldap_writer()
+            self.flush_rdbm_batch()
+            self.flush_couchbase_batch()
+            if self.moddb == BackendTypes.SPANNER:
+                self.flush_spanner_mutations()
+
     def import_schema(self, schema_file):
         if self.moddb == BackendTypes.LDAP:
             base.logIt("Importing schema {}".format(schema_file))
             parser = ldif_utils.myLdifParser(schema_file)
-            parser.parse()
-            for dn, entry in parser.entries:
+            for dn, entry in parser.iter_entries():
                 if 'changetype' in entry:
                     entry.pop('changetype')
                 if 'add' in entry:
@@ -1168,35 +1469,61 @@ class DBUtils(SetupUtils):
             #we need re-bind after schema operations
             self.ldap_conn.rebind()
 
-    def get_group_for_key(self, key):
-        key_prefix = self.get_key_prefix(key)
-        for group in Config.couchbaseBucketDict:
-            if key_prefix in Config.couchbaseBucketDict[group]['document_key_prefix']:
-                break
-        else:
-            group = 'default'
+    def get_resolver_stamp(self):
+        # mappingLocations items are also changed in place
+        return (type(Config).changes, tuple(Config.get('mappingLocations', {}).items()))
 
-        return group
+    def reset_dn_resolver(self):
+        self.resolver_stamp = self.get_resolver_stamp()
+        self.key_prefix_groups = None
+        self.resolve_dn_cached = functools.lru_cache(maxsize=self.resolved_dn_cache_size)(self.make_resolved_dn)
 
-    def get_bucket_for_key(self, key):
+    def resolve_dn(self, dn):
+        """Returns ResolvedDN of dn. Results are memoized until Config or
+        Config.mappingLocations changes, or database is bound again."""
+
+        if self.resolver_stamp != self.get_resolver_stamp():
+            self.reset_dn_resolver()
+
+        return self.resolve_dn_cached(dn)
+
+    def make_resolved_dn(self, dn):
+        rdns = dnutils.parse_dn(dn)
+        key = ldif_utils.get_key_from_rdns(rdns)
         group = self.get_group_for_key(key)
+
+        return ResolvedDN(dn, rdns, key, group, self.get_bucket_for_group(group), self.get_backend_for_group(group))
+
+    def get_group_for_key(self, key):
+        if self.key_prefix_groups is None:
+            # the first group listing a prefix wins
+            key_prefix_groups = {}
+            for group in Config.couchbaseBucketDict:
+                for key_prefix in Config.couchbaseBucketDict[group]['document_key_prefix']:
+                    key_prefix_groups.setdefault(key_prefix, group)
+            self.key_prefix_groups = key_prefix_groups
+
+        return self.key_prefix_groups.get(self.get_key_prefix(key), 'default')
+
+    def get_bucket_for_group(self, group):
         if group == 'default':
             return Config.couchbase_bucket_prefix
 
         return Config.couchbase_bucket_prefix + '_' + group
 
+    def get_bucket_for_key(self, key):
+        return self.get_bucket_for_group(self.get_group_for_key(key))
+
     def get_bucket_for_dn(self, dn):
-        key = ldif_utils.get_key_from(dn)
-        return self.get_bucket_for_key(key)
+        return self.resolve_dn(dn).bucket
 
-    def get_backend_location_for_dn(self, dn):
-        key = ldif_utils.get_key_from(dn)
-        group = self.get_group_for_key(key)
+    def get_backend_for_group(self, group):
+        location = Config.mappingLocations.get(group)
 
-        if Config.mappingLocations[group] == 'ldap':
+        if location == 'ldap':
             return static.BackendTypes.LDAP
 
-        if Config.mappingLocations[group] == 'rdbm':
+        if location == 'rdbm':
             if Config.rdbm_type == 'mysql':
                 return static.BackendTypes.MYSQL
             elif Config.rdbm_type == 'pgsql':
@@ -1204,9 +1531,12 @@ class DBUtils(SetupUtils):
             elif Config.rdbm_type == 'spanner':
                 return static.BackendTypes.SPANNER
 
-        if Config.mappingLocations[group] == 'couchbase':
+        if location == 'couchbase':
             return static.BackendTypes.COUCHBASE
 
+    def get_backend_location_for_dn(self, dn):
+        return self.resolve_dn(dn).backend
+
 
     def checkCBRoles(self, buckets=[]):
 
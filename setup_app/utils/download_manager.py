@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import urllib.request
+import urllib.error
+
+from setup_app.config import Config
+from setup_app.utils import base
+from setup_app.utils.profiler import profiler
+
+
+class DownloadManager:
+    """Downloads artifacts into a content addressed cache and copies them to
+    their destinations. Partially downloaded files are resumed with HTTP Range
+    requests, validators (ETag, Last-Modified) of urls are kept in cache index
+    so that unchanged artifacts are not downloaded again. Least recently used
+    artifacts are removed when cache exceeds download_cache_size (MB)."""
+
+    chunk_size = 1024 * 1024
+    retries = 3
+    timeout = 60
+    partial_max_age = 7 * 24 * 3600
+
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir
+        self.index_lock = threading.Lock()
+        self.url_locks = {}
+        self.index = None
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir or Config.get('download_cache_dir') or os.path.join(Config.distFolder, 'cache')
+
+    @property
+    def index_fn(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def blob_path(self, sha256):
+        return os.path.join(self.cache_dir, 'sha256', sha256[:2], sha256)
+
+    def partial_path(self, url):
+        return os.path.join(self.cache_dir, 'partial', hashlib.sha1(url.encode()).hexdigest())
+
+    def remove_partial(self, url):
+        for fn in (self.partial_path(url), self.partial_path(url) + '.json'):
+            if os.path.exists(fn):
+                os.remove(fn)
+
+    def get_partial_validator(self, url):
+        """Returns If-Range validator saved when partial file of url was
+        started, strong ETag or Last-Modified"""
+
+        try:
+            with open(self.partial_path(url) + '.json') as f:
+                validators = json.load(f)
+        except Exception:
+            return
+
+        etag = validators.get('etag')
+        # weak ETags can't be used in If-Range
+        if etag and not etag.startswith('W/'):
+            return etag
+
+        return validators.get('last_modified')
+
+    def load_index(self):
+        if self.index is None:
+            self.index = {}
+            if os.path.exists(self.index_fn):
+                try:
+                    with open(self.index_fn) as f:
+                        self.index = json.load(f)
+                except Exception as e:
+                    base.logIt("Can't read download cache index {}: {}".format(self.index_fn, e))
+        return self.index
+
+    def get_index_entry(self, url):
+        with self.index_lock:
+            entry = self.load_index().get(url)
+
+        if entry and os.path.exists(self.blob_path(entry['sha256'])):
+            return entry
+
+    def write_index(self):
+        tmp_fn = self.index_fn + '.tmp'
+        with open(tmp_fn, 'w') as w:
+            json.dump(self.index, w, indent=2)
+        os.replace(tmp_fn, self.index_fn)
+
+    def set_index_entry(self, url, entry, src_fn=None):
+        """Sets index entry of url, src_fn is moved into cache as its blob"""
+
+        with self.index_lock:
+            if src_fn:
+                # blobs are moved and pruned under the lock, so that a new blob
+                # is not removed before it is referenced by index
+                blob_fn = self.blob_path(entry['sha256'])
+                os.makedirs(os.path.dirname(blob_fn), exist_ok=True)
+                os.replace(src_fn, blob_fn)
+            self.load_index()[url] = entry
+            self.prune()
+            self.write_index()
+
+    def prune(self):
+        """Removes blobs no url refers to, least recently used entries while
+        cache is larger than download_cache_size and stale partial files.
+        Called with index_lock held."""
+
+        max_size = int(Config.get('download_cache_size', 2048)) * 1024 * 1024
+        entries = sorted(self.index.items(), key=lambda item: item[1].get('used', 0))
+        cache_size = sum(entry['size'] for entry in {entry['sha256']: entry for url, entry in entries}.values())
+
+        for url, entry in entries[:-1]:
+            if cache_size <= max_size:
+                break
+            # artifact may be being copied to its destination
+            if url in self.url_locks and self.url_locks[url].locked():
+                continue
+            base.logIt("Removing {} from download cache".format(url))
+            del self.index[url]
+            if not any(other['sha256'] == entry['sha256'] for other in self.index.values()):
+                cache_size -= entry['size']
+
+        referenced = {entry['sha256'] for entry in self.index.values()}
+        blob_dir = os.path.join(self.cache_dir, 'sha256')
+        for dirpath, dirnames, filenames in os.walk(blob_dir):
+            for fn in filenames:
+                if fn not in referenced:
+                    os.remove(os.path.join(dirpath, fn))
+
+        partial_dir = os.path.dirname(self.partial_path(''))
+        if os.path.exists(partial_dir):
+            for entry in os.scandir(partial_dir):
+                if entry.stat().st_mtime < time.time() - self.partial_max_age:
+                    os.remove(entry.path)
+
+    def get_url_lock(self, url):
+        with self.index_lock:
+            return self.url_locks.setdefault(url, threading.Lock())
+
+    @staticmethod
+    def file_hash(fn, algorithm='sha256'):
+        hasher = hashlib.new(algorithm)
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def get_expected_checksum(self, url, checksum=None):
+        """Returns (algorithm, hexdigest) tuple. checksum is in form algorithm:hexdigest,
+        if not given, sidecar sha1 file of maven repositories is tried"""
+
+        if checksum:
+            algorithm, digest = checksum.split(':', 1)
+            return algorithm.lower(), digest.strip().lower()
+
+        try:
+            with urllib.request.urlopen(url + '.sha1', timeout=self.timeout) as response:
+                digest = response.read(256).decode().split()[0].strip().lower()
+        except Exception:
+            return
+
+        if len(digest) == 40:
+            return 'sha1', digest
+
+    def fetch(self, url, entry=None):
+        """Downloads url into partial file, resuming it if exists. Returns
+        response headers, or None if cached entry is still valid"""
+
+        partial_fn = self.partial_path(url)
+        os.makedirs(os.path.dirname(partial_fn), exist_ok=True)
+
+        request = urllib.request.Request(url)
+        offset = os.path.getsize(partial_fn) if os.path.exists(partial_fn) else 0
+        validator = self.get_partial_validator(url) if offset else None
+
+        if offset and not validator:
+            # we can't tell if partial file is of current resource, start over
+            base.logIt("Partial download of {} has no validator, downloading from start".format(url))
+            self.remove_partial(url)
+            offset = 0
+
+        if offset:
+            # server sends whole resource if it was changed since partial file was started
+            request.add_header('Range', 'bytes={}-'.format(offset))
+            request.add_header('If-Range', validator)
+        elif entry:
+            if entry.get('etag'):
+                request.add_header('If-None-Match', entry['etag'])
+            if entry.get('last_modified'):
+                request.add_header('If-Modified-Since', entry['last_modified'])
+
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return
+            if e.code == 416:
+                # partial file is not valid for current resource, start over
+                self.remove_partial(url)
+            raise
+
+        with response:
+            if response.status == 206:
+                base.logIt("Resuming download of {} from byte {}".format(url, offset))
+                mode = 'ab'
+            else:
+                mode = 'wb'
+                # validators of resource partial file is made of
+                with open(partial_fn + '.json', 'w') as w:
+                    json.dump({'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}, w)
+
+            with open(partial_fn, mode) as w:
+                for chunk in iter(lambda: response.read(self.chunk_size), b''):
+                    w.write(chunk)
+
+            return response.headers
+
+    def store(self, url, headers, expected_checksum=None):
+        """Verifies partial download of url and moves it into cache"""
+
+        partial_fn = self.partial_path(url)
+
+        if expected_checksum:
+            algorithm, digest = expected_checksum
+            if self.file_hash(partial_fn, algorithm) != digest:
+                self.remove_partial(url)
+                raise ValueError("{} checksum of {} does not match {}".format(algorithm, url, digest))
+
+        entry = {
+                'sha256': self.file_hash(partial_fn),
+                'size': os.path.getsize(partial_fn),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'used': time.time(),
+                }
+
+        self.set_index_entry(url, entry, partial_fn)
+        self.remove_partial(url)
+
+        return entry
+
+    def place(self, entry, dst):
+        if os.path.exists(dst) and os.path.getsize(dst) == entry['size'] and self.file_hash(dst) == entry['sha256']:
+            base.logIt("{} is up to date".format(dst))
+            return
+
+        pardir = os.path.dirname(dst)
+        if pardir and not os.path.exists(pardir):
+            base.logIt("Creating directory {}".format(pardir))
+            os.makedirs(pardir)
+
+        tmp_fn = dst + '.tmp'
+        shutil.copyfile(self.blob_path(entry['sha256']), tmp_fn)
+        os.replace(tmp_fn, dst)
+
+    @profiler.trace('download')
+    def download(self, url, dst, checksum=None):
+        """Downloads url to dst, returns True on success"""
+
+        base.logIt("Downloading {} to {}".format(url, dst))
+        profiler.add_args(url=url)
+
+        with self.get_url_lock(url):
+            entry = self.get_index_entry(url)
+            expected_checksum = None
+            downloaded = False
+
+            for download_try in range(1, self.retries + 1):
+                try:
+                    headers = self.fetch(url, entry)
+                    if headers is None:
+                        base.logIt("{} was not modified, using cached copy".format(url))
+                    else:
+                        if expected_checksum is None:
+                            expected_checksum = self.get_expected_checksum(url, checksum)
+                        entry = self.store(url, headers, expected_checksum)
+                        base.logIt("Download size: {} bytes".format(entry['size']))
+                    downloaded = True
+                    break
+                except Exception as e:
+                    base.logIt("Error downloading {} (try {}/{}): {}".format(url, download_try, self.retries, e))
+                    if isinstance(e, urllib.error.HTTPError) and e.code in (401, 403, 404, 410):
+                        break
+                    if download_try < self.retries:
+                        time.sleep(2 ** (download_try - 1))
+
+            if not downloaded:
+                if entry:
+                    base.logIt("Using cached copy of {}".format(url))
+                else:
+                    base.logIt("Downloading {} failed".format(url), True)
+                    return False
+
+            if not downloaded or headers is None:
+                entry['used'] = time.time()
+                self.set_index_entry(url, entry)
+
+            profiler.add_args(bytes=entry['size'])
+            self.place(entry, dst)
+
+        return True
+
+
+downloadManager = DownloadManager()
@@ -0,0 +1,24 @@
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def get_pooled_session(pool_size=10, retries=3, backoff_factor=0.3):
+    """Returns requests session that keeps connections alive and retries
+    failed connections and gateway errors with backoff"""
+
+    retry = Retry(
+                total=retries,
+                connect=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(502, 503, 504),
+                )
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
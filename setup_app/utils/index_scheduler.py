@@ -0,0 +1,52 @@
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from setup_app.utils import base
+
+
+class IndexScheduler:
+    """Collects index DDL of a backend grouped by target (table, bucket, backend)
+    so that the whole plan can be reported and executed at once. Statements of a
+    target are executed in order, different targets may run concurrently."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.plan = OrderedDict()
+
+    def add(self, target, statement):
+        self.plan.setdefault(target, []).append(statement)
+
+    def __len__(self):
+        return sum([len(self.plan[target]) for target in self.plan])
+
+    def report(self):
+        base.logIt("Index plan for {}: {} statement(s) on {} target(s)".format(self.backend, len(self), len(self.plan)))
+        for target in self.plan:
+            for statement in self.plan[target]:
+                base.logIt("  {}: {}".format(target, statement))
+
+    def run(self, executor, max_workers=1):
+        """Calls executor(target, statements) for each target of the plan"""
+
+        start_time = time.time()
+        errors = []
+
+        def run_target(target):
+            try:
+                executor(target, self.plan[target])
+            except Exception as e:
+                errors.append(target)
+                base.logIt("Creating indexes on {} failed: {}".format(target, e), True)
+
+        if max_workers > 1 and len(self.plan) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                list(pool.map(run_target, self.plan))
+        else:
+            for target in self.plan:
+                run_target(target)
+
+        base.logIt("Index plan for {} was executed in {:.2f} seconds".format(self.backend, time.time() - start_time))
+
+        return errors
@@ -0,0 +1,73 @@
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from setup_app.utils import base
+from setup_app.utils.progress import gluuProgress
+
+
+class InstallerScheduler:
+    """Runs a phase (method) of installers in the order given by dependencies
+    they declare. Installers whose dependencies were completed may run
+    concurrently on a worker pool. Dependencies to installers which are not
+    scheduled are considered as satisfied."""
+
+    def __init__(self, installers):
+        self.installers = OrderedDict()
+        for installer in installers:
+            self.installers[installer.service_name] = installer
+
+    def get_dependencies(self, service_name):
+        return [ dep for dep in self.installers[service_name].dependencies if dep in self.installers and dep != service_name ]
+
+    def get_order(self):
+        """Returns service names in dependency order, keeping given order of independent installers"""
+
+        ordered = []
+
+        def visit(service_name, path):
+            if service_name in ordered:
+                return
+            if service_name in path:
+                raise ValueError("Cyclic installer dependency: {}".format(' -> '.join(path + [service_name])))
+            for dep in self.get_dependencies(service_name):
+                visit(dep, path + [service_name])
+            ordered.append(service_name)
+
+        for service_name in self.installers:
+            visit(service_name, [])
+
+        return ordered
+
+    def run_installer(self, service_name, phase):
+        gluuProgress.started(service_name)
+        getattr(self.installers[service_name], phase)()
+        gluuProgress.finished(service_name)
+
+    def run(self, phase='start_installation', max_workers=1, respect_dependencies=True):
+        start_time = time.time()
+        order = self.get_order()
+        base.logIt("Running {} of {} with {} worker(s)".format(phase, ', '.join(order), max_workers))
+
+        if max_workers < 2 or len(order) < 2:
+            for service_name in order:
+                getattr(self.installers[service_name], phase)()
+        else:
+            completed = set()
+            running = {}
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                while order or running:
+                    for service_name in order[:]:
+                        if not respect_dependencies or completed.issuperset(self.get_dependencies(service_name)):
+                            order.remove(service_name)
+                            running[pool.submit(self.run_installer, service_name, phase)] = service_name
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        service_name = running.pop(future)
+                        # re-raises exception of installer, pool waits for running ones
+                        future.result()
+                        completed.add(service_name)
+
+        base.logIt("{} was completed in {:.2f} seconds".format(phase, time.time() - start_time))
@@ -0,0 +1,40 @@
+import sys
+import importlib
+import threading
+
+
+class LazyModule:
+    """Proxy of module which imports it, and given submodules, on first
+    attribute access"""
+
+    def __init__(self, name, submodules=()):
+        self._name = name
+        self._submodules = submodules
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    for submodule in self._submodules:
+                        importlib.import_module(submodule)
+                    self._module = module
+
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return '<lazy module {!r}{}>'.format(self._name, '' if self._module is None else ' (loaded)')
+
+
+def lazy_import(name, submodules=()):
+    """Returns module if it was already imported, otherwise a LazyModule"""
+
+    if name in sys.modules and all(submodule in sys.modules for submodule in submodules):
+        return sys.modules[name]
+
+    return LazyModule(name, submodules)
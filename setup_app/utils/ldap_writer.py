@@ -0,0 +1,112 @@
+import time
+import itertools
+
+from collections import deque
+
+from setup_app.utils import base
+from setup_app.utils.db_metrics import dbMetrics
+from setup_app.utils.lazy_import import lazy_import
+
+dnutils = lazy_import('ldap3.utils.dn')
+
+
+class LDAPWriter:
+    """Writes entries over several asynchronous ldap3 connections, keeping up
+    to max_in_flight operations waiting for response. Entries are added
+    optimistically and entryAlreadyExists result is treated as skip. An
+    operation is sent after pending operations on its own dn and on its parent
+    dn are completed, so parents are always written before children."""
+
+    backend_name = 'ldap'
+    entry_already_exists = 68
+
+    def __init__(self, connection_factory, connections=4, max_in_flight=64):
+        self.connection_factory = connection_factory
+        self.num_connections = max(1, int(connections))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.connections = []
+        self.connection_cycle = None
+        self.in_flight = deque()
+        self.pending_dns = {}
+        self.stats = {'add': 0, 'modify': 0, 'skipped': 0, 'failed': 0}
+
+    def get_connection(self):
+        if len(self.connections) < self.num_connections:
+            conn = self.connection_factory()
+            self.connections.append(conn)
+            if len(self.connections) == self.num_connections:
+                self.connection_cycle = itertools.cycle(self.connections)
+            return conn
+
+        return next(self.connection_cycle)
+
+    @staticmethod
+    def get_dn_key(rdns):
+        return ','.join(['='.join(rdn[:2]) for rdn in rdns]).lower()
+
+    def add(self, dn, attributes, rdns=None):
+        self.send('add', dn, rdns, lambda conn: conn.add(dn, attributes=attributes))
+
+    def modify(self, dn, changes, rdns=None):
+        self.send('modify', dn, rdns, lambda conn: conn.modify(dn, changes))
+
+    def send(self, operation, dn, rdns, request):
+        if rdns is None:
+            rdns = dnutils.parse_dn(dn)
+
+        dn_key = self.get_dn_key(rdns)
+        for key in (dn_key, self.get_dn_key(rdns[1:])):
+            if key in self.pending_dns:
+                self.wait(self.pending_dns[key])
+
+        while len(self.in_flight) >= self.max_in_flight:
+            self.complete(self.in_flight[0])
+
+        conn = self.get_connection()
+        op = (operation, dn, dn_key, conn, request(conn), time.time())
+        self.in_flight.append(op)
+        self.pending_dns[dn_key] = op
+
+    def wait(self, op):
+        # operations sent before op may still be in flight, others are not waited
+        if op in self.in_flight:
+            self.complete(op)
+
+    def complete(self, op):
+        operation, dn, dn_key, conn, message_id, start_time = op
+        self.in_flight.remove(op)
+        if self.pending_dns.get(dn_key) is op:
+            del self.pending_dns[dn_key]
+
+        try:
+            response, result = conn.get_response(message_id)
+        except Exception as e:
+            result = {'result': None, 'description': str(e)}
+
+        result_code = result.get('result')
+        dbMetrics.record(self.backend_name, operation, time.time() - start_time, error=result_code not in (0, self.entry_already_exists))
+
+        if result_code == 0:
+            self.stats[operation] += 1
+        elif operation == 'add' and result_code == self.entry_already_exists:
+            base.logIt("Entry {} exists, skipping".format(dn))
+            self.stats['skipped'] += 1
+        else:
+            base.logIt("Ldap {} operation on {} failed {}".format(operation, dn, str(result)), True)
+            self.stats['failed'] += 1
+
+    def flush(self):
+        while self.in_flight:
+            self.complete(self.in_flight[0])
+
+        return self.stats
+
+    def close(self):
+        self.flush()
+        for conn in self.connections:
+            try:
+                conn.unbind()
+            except Exception as e:
+                base.logIt("Error closing LDAP connection: {}".format(e))
+        self.connections = []
+        self.connection_cycle = None
@@ -4,11 +4,13 @@ import json
 
 from collections import OrderedDict
 
-from ldap3.utils import dn as dnutils
 from setup_app.pylib.ldif4.ldif import LDIFParser
 from setup_app.pylib.schema import AttributeType, ObjectClass
 from setup_app.utils.attributes import attribDataTypes
 from setup_app.config import Config
+from setup_app.utils.lazy_import import lazy_import
+
+dnutils = lazy_import('ldap3.utils.dn')
 
 
 class myLdifParser(LDIFParser):
@@ -16,7 +18,8 @@ class myLdifParser(LDIFParser):
         self.ldif_file = ldif_file
         self.entries = []
 
-    def parse(self):
+    def iter_entries(self):
+        """Yields (dn, entry) tuples one at a time without keeping them in memory"""
         with open(self.ldif_file, 'rb') as f:
             parser = LDIFParser(f)
             for dn, entry in parser.parse():
@@ -24,12 +27,20 @@ class myLdifParser(LDIFParser):
                     for i, v in enumerate(entry[e][:]):
                         if isinstance(v, bytes):
                             entry[e][i] = v.decode('utf-8')
-                self.entries.append((dn, entry))
+                yield dn, entry
+
+    def parse(self):
+        for dn, entry in self.iter_entries():
+            self.entries.append((dn, entry))
 
 
 def get_key_from(dn):
+    return get_key_from_rdns(dnutils.parse_dn(dn))
+
+
+def get_key_from_rdns(rdns):
     dns = []
-    for rd in dnutils.parse_dn(dn):
+    for rd in rdns:
 
         if rd[0] == 'o' and rd[1] == 'gluu':
             continue
@@ -44,16 +55,17 @@ def get_key_from(dn):
     return key
 
 
-def get_document_from_entry(dn, entry):
+def get_document_from_entry(dn, entry, key=None):
 
     document = copy.deepcopy(entry)
 
     if len(document) > 2:
-        key = get_key_from(dn)
+        if not key:
+            key = get_key_from(dn)
         document['dn'] = dn
         for k in document:
             if len(document[k]) == 1:
-                if not k in attribDataTypes.listAttributes:
+                if not attribDataTypes.isListAttribute(k):
                     document[k] = document[k][0]
 
         for k in document:
@@ -84,27 +96,32 @@ def get_document_from_entry(dn, entry):
 
         return key, document
 
-def get_documents_from_ldif(ldif_file):
+def iter_documents_from_ldif(ldif_file):
     parser = myLdifParser(ldif_file)
-    parser.parse()
-    documents = []
 
-    for dn, entry in parser.entries:
-        key, document = get_document_from_entry(dn, entry)
+    for dn, entry in parser.iter_entries():
+        key_document = get_document_from_entry(dn, entry)
+        if key_document:
+            yield key_document
 
-        documents.append((key, document))
-
-    return documents
+def get_documents_from_ldif(ldif_file):
+    return list(iter_documents_from_ldif(ldif_file))
 
 def schema2json(schema_file, out_dir=None):
 
     ldif_parser = myLdifParser(schema_file)
-    ldif_parser.parse()
 
     jans_schema = OrderedDict((('attributeTypes',[]), ('objectClasses',[])))
 
-    if 'attributeTypes' in ldif_parser.entries[0][1]:
-        for attr_str in ldif_parser.entries[0][1]['attributeTypes']:
+    attribute_type_list = []
+    object_class_list = []
+    for i, (dn, entry) in enumerate(ldif_parser.iter_entries()):
+        if i == 0:
+            attribute_type_list = entry.get('attributeTypes', [])
+        object_class_list += entry.get('objectClasses', [])
+
+    if attribute_type_list:
+        for attr_str in attribute_type_list:
             attr_type = AttributeType(attr_str)
 
             attr_dict = {
@@ -123,11 +140,6 @@ def schema2json(schema_file, out_dir=None):
             jans_schema['attributeTypes'].append(attr_dict)
 
 
-    object_class_list = []
-    for el in ldif_parser.entries:
-        if 'objectClasses' in el[1]:
-            object_class_list += el[1]['objectClasses']
-
     for objcls_str in object_class_list:
         objcls_type = ObjectClass(objcls_str)
         objcls_dict = {
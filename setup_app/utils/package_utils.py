@@ -1,13 +1,110 @@
 import os
+import re
 import sys
-import importlib
+import subprocess
+import importlib.util
 
 from setup_app import paths
-from setup_app.config import Config
 from setup_app.utils import base
+from setup_app.config import Config
 from setup_app.utils.setup_utils import SetupUtils
 from setup_app.static import InstallTypes, SetupProfiles
 
+class PackageInventory:
+    """Installed state of OS packages, queried once per run for all packages.
+    dpkg status file is read directly, rpm database is queried with a single
+    rpm -q call."""
+
+    dpkg_status_fn = '/var/lib/dpkg/status'
+
+    def __init__(self, clone_type=None, dpkg_status_fn=None):
+        self._clone_type = clone_type
+        if dpkg_status_fn:
+            self.dpkg_status_fn = dpkg_status_fn
+        self.installed = {}
+        self.dpkg_packages = None
+
+    @property
+    def clone_type(self):
+        return self._clone_type or base.clone_type
+
+    def read_dpkg_status(self):
+        """Returns installed packages, both as name and name:architecture,
+        since Multi-Arch packages have a stanza for each architecture"""
+
+        packages = set()
+        stanza = {}
+
+        def add_stanza():
+            # Status is "want flag state", only state installed counts
+            if stanza.get('Package') and stanza.get('Status', '').split()[-1:] == ['installed']:
+                packages.add(stanza['Package'])
+                if stanza.get('Architecture'):
+                    packages.add('{}:{}'.format(stanza['Package'], stanza['Architecture']))
+
+        with open(self.dpkg_status_fn, encoding='utf-8', errors='ignore') as f:
+            for l in f:
+                if not l.strip():
+                    add_stanza()
+                    stanza = {}
+                elif not l[0].isspace() and ':' in l:
+                    field, value = l.split(':', 1)
+                    stanza[field] = value.strip()
+            add_stanza()
+
+        return packages
+
+    def query_dpkg(self, packages):
+        if self.dpkg_packages is None:
+            try:
+                self.dpkg_packages = self.read_dpkg_status()
+            except OSError as e:
+                base.logIt("Can't read {}: {}. Querying dpkg".format(self.dpkg_status_fn, e))
+                output = self.query(['dpkg-query', '-W', '-f=${Package} ${Status}\n'] + packages)
+                return { l.split()[0] for l in output.splitlines() if l.endswith(' installed') }
+
+        return { package for package in packages if package in self.dpkg_packages }
+
+    def query_rpm(self, packages):
+        output = self.query(['rpm', '-q'] + packages)
+        not_installed = set(re.findall(r'package (\S+) is not installed', output))
+        return { package for package in packages if package not in not_installed }
+
+    def query(self, cmd):
+        base.logIt("Querying packages: {}".format(' '.join(cmd)))
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return result.stdout.decode('utf-8', errors='ignore')
+
+    def is_installed(self, packages):
+        """Returns dictionary of package: installed state, packages not
+        queried before are queried with a single command"""
+
+        unknown = [ package for package in dict.fromkeys(packages) if package not in self.installed ]
+
+        if unknown:
+            installed = self.query_dpkg(unknown) if self.clone_type == 'deb' else self.query_rpm(unknown)
+            for package in unknown:
+                self.installed[package] = package in installed
+
+        return { package: self.installed[package] for package in packages }
+
+    def forget(self, packages):
+        # state of packages changes after they are installed
+        for package in packages:
+            self.installed.pop(package, None)
+        self.dpkg_packages = None
+
+    @staticmethod
+    def has_python_module(module_name):
+        try:
+            return importlib.util.find_spec(module_name) is not None
+        except (ImportError, ValueError):
+            return False
+
+
+packageInventory = PackageInventory()
+
+
 class PackageUtils(SetupUtils):
 
     #TODO: get commands from paths
@@ -15,8 +112,6 @@ class PackageUtils(SetupUtils):
         if base.clone_type == 'deb':
             install_command = 'DEBIAN_FRONTEND=noninteractive apt-get install -y {0}'
             update_command = 'DEBIAN_FRONTEND=noninteractive apt-get update -y'
-            query_command = 'dpkg-query -W -f=\'${{Status}}\' {} 2>/dev/null | grep -c "ok installed"'
-            check_text = '0'
 
         elif base.clone_type == 'rpm':
             if base.os_type == 'suse':
@@ -25,14 +120,12 @@ class PackageUtils(SetupUtils):
             else:
                 install_command = 'yum install -y {0}'
                 update_command = 'yum install -y epel-release'
-            query_command = 'rpm -q {0}'
-            check_text = 'is not installed'
 
-        return install_command, update_command, query_command, check_text
+        return install_command, update_command
 
     def check_and_install_packages(self):
 
-        install_command, update_command, query_command, check_text = self.get_install_commands()
+        install_command, update_command = self.get_install_commands()
 
         install_list = {'mandatory': [], 'optional': []}
         on_disa_stig = base.argsp.profile == 'DISA-STIG' or os.path.exists(os.path.join(paths.INSTALL_DIR, 'disa-stig'))
@@ -54,24 +147,20 @@ class PackageUtils(SetupUtils):
                 self.run(['dnf', '-y', 'module', 'enable', 'postgresql:12'])
 
         for pypackage in package_list[os_type_version]['python']:
-            try:
-                importlib.import_module(pypackage)
-            except Exception:
+            if not packageInventory.has_python_module(pypackage):
                 package_list[os_type_version]['mandatory'] += ' ' + package_list[os_type_version]['python'][pypackage]
 
         if on_disa_stig:
             package_list[os_type_version]['mandatory'] += ' java-11-openjdk-headless'
 
         for install_type in install_list:
-            for package in package_list[os_type_version][install_type].split():
-                if on_disa_stig and 'python3' in package:
-                    continue
-                sout, serr = self.run(query_command.format(package), shell=True, get_stderr=True)
-                if check_text in sout+serr:
+            packages = [ package for package in package_list[os_type_version][install_type].split() if not (on_disa_stig and 'python3' in package) ]
+            for package, installed in packageInventory.is_installed(packages).items():
+                if installed:
+                    self.logIt('Package {0} was installed'.format(package))
+                else:
                     self.logIt('Package {0} was not installed'.format(package))
                     install_list[install_type].append(package)
-                else:
-                    self.logIt('Package {0} was installed'.format(package))
 
         install = {'mandatory': True, 'optional': False}
 
@@ -103,6 +192,7 @@ class PackageUtils(SetupUtils):
                     if not base.os_type == 'fedora':
                         sout, serr = self.run(update_command, shell=True, get_stderr=True)
                     self.run(install_command.format(packages), shell=True)
+                    packageInventory.forget(install_list[install_type])
 
         if base.clone_type == 'deb':
             self.run('a2enmod ssl headers proxy proxy_http proxy_ajp', shell=True)
@@ -0,0 +1,250 @@
+import os
+import re
+import pwd
+import grp
+import stat
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from setup_app.config import Config
+from setup_app.utils import base
+from setup_app.utils.profiler import profiler
+
+
+def get_mode(mode_spec, current_mode, is_dir):
+    """Returns permission bits after applying chmod style mode_spec, either
+    octal (i.e. 660) or symbolic (i.e. u+rwX,g+rwX,o-rwX) to current_mode"""
+
+    if mode_spec.isdigit():
+        return int(mode_spec, 8)
+
+    mode = stat.S_IMODE(current_mode)
+    shifts = {'u': 6, 'g': 3, 'o': 0}
+    special_bits = {'u': stat.S_ISUID, 'g': stat.S_ISGID, 'o': stat.S_ISVTX}
+
+    for clause in mode_spec.split(','):
+        m = re.match(r'([ugoa]*)((?:[+\-=][rwxXst]*)+)$', clause)
+        if not m:
+            raise ValueError("Invalid mode {}".format(mode_spec))
+        who = (m.group(1) or 'a').replace('a', 'ugo')
+
+        for op, perms in re.findall(r'([+\-=])([rwxXst]*)', m.group(2)):
+            bits = 0
+            for w in set(who):
+                perm_bits = 0
+                for p in perms:
+                    if p == 'r':
+                        perm_bits |= 4
+                    elif p == 'w':
+                        perm_bits |= 2
+                    elif p == 'x' or (p == 'X' and (is_dir or mode & 0o111)):
+                        perm_bits |= 1
+                    elif (p == 's' and w in 'ug') or (p == 't' and w == 'o'):
+                        bits |= special_bits[w]
+                bits |= perm_bits << shifts[w]
+
+                if op == '=':
+                    mode &= ~((7 << shifts[w]) | special_bits[w])
+
+            if op == '-':
+                mode &= ~bits
+            else:
+                mode |= bits
+
+    return mode
+
+
+class PermissionRule:
+
+    __slots__ = ('index', 'path', 'uid', 'gid', 'owner', 'mode', 'recursive')
+
+    def __init__(self, index, path, uid, gid, owner, mode, recursive):
+        self.index = index
+        self.path = path
+        self.uid = uid
+        self.gid = gid
+        self.owner = owner
+        self.mode = mode
+        self.recursive = recursive
+
+
+class PermissionPlanner:
+    """Collects owner, group and mode rules and applies them in process with
+    a single parallel os.scandir walk of each tree. Rules are applied in the
+    order they were added, files that already match are not changed.
+    Symbolic links in trees are lchown'ed and their modes are not changed,
+    as chown -R and chmod -R do."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rules = []
+        self.rule_counter = 0
+
+    def make_rule(self, path, user=None, group=None, mode=None, recursive=False):
+        try:
+            uid = pwd.getpwnam(user).pw_uid if user else -1
+            gid = grp.getgrnam(group).gr_gid if group else -1
+            if mode:
+                get_mode(mode, 0, True)
+        except (KeyError, ValueError) as e:
+            base.logIt("Can't set owner {}:{} mode {} of {}: {}".format(user, group, mode, path, e), True)
+            return
+
+        with self.lock:
+            self.rule_counter += 1
+            index = self.rule_counter
+
+        owner = '{}:{}'.format(user, group) if group else user
+        return PermissionRule(index, path.rstrip('/') or '/', uid, gid, owner, mode, recursive)
+
+    def add(self, path, user=None, group=None, mode=None, recursive=False):
+        """Queues rule to be applied with apply()"""
+
+        rule = self.make_rule(path, user, group, mode, recursive)
+        if rule:
+            with self.lock:
+                self.rules.append(rule)
+
+    def change(self, path, user=None, group=None, mode=None, recursive=False):
+        """Applies rule immediately, queued rules are not touched"""
+
+        rule = self.make_rule(path, user, group, mode, recursive)
+        if rule:
+            self.apply_rules([rule])
+
+    def apply(self):
+        with self.lock:
+            rules, self.rules = self.rules, []
+
+        self.apply_rules(rules)
+
+    def log_rule(self, rule):
+        # same lines as base.run() writes for chown/chmod commands
+        base.logIt("Setting {}owner {} mode {} of {}".format('recursively ' if rule.recursive else '', rule.owner, rule.mode, rule.path))
+        if rule.path.startswith('/opt'):
+            return
+        if rule.owner:
+            base.logOSChanges('Making owner of %s to %s' % (rule.path, rule.owner))
+        if rule.mode:
+            base.logOSChanges('Setting permission of %s to %s' % (rule.path, rule.mode))
+
+    def apply_entry(self, path, rules, stat_result, is_dir, is_link):
+        uid, gid, mode = stat_result.st_uid, stat_result.st_gid, stat.S_IMODE(stat_result.st_mode)
+        new_uid, new_gid, new_mode = uid, gid, mode
+
+        for rule in rules:
+            if rule.uid != -1:
+                new_uid = rule.uid
+            if rule.gid != -1:
+                new_gid = rule.gid
+            if rule.mode and not is_link:
+                new_mode = get_mode(rule.mode, new_mode, is_dir)
+
+        changed = 0
+        try:
+            if (new_uid, new_gid) != (uid, gid):
+                if is_link:
+                    os.lchown(path, new_uid, new_gid)
+                else:
+                    os.chown(path, new_uid, new_gid)
+                changed = 1
+            if new_mode != mode:
+                # chown clears setuid/setgid bits, so mode is set after owner
+                os.chmod(path, new_mode)
+                changed = 1
+        except OSError as e:
+            base.logIt("Error setting owner/mode of {}: {}".format(path, e), True)
+
+        return changed
+
+    def apply_dir(self, dir_path, inherited_rules, recursive_rules, path_rules):
+        """Applies rules to entries of dir_path, returns subdirectories to be walked
+        and number of changed entries"""
+
+        subdirs = []
+        changed = 0
+
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError as e:
+            base.logIt("Can't scan {}: {}".format(dir_path, e), True)
+            return subdirs, changed
+
+        for entry in entries:
+            rules = inherited_rules
+            if entry.path in recursive_rules:
+                rules = sorted(inherited_rules + recursive_rules[entry.path], key=lambda rule: rule.index)
+            entry_rules = sorted(rules + path_rules[entry.path], key=lambda rule: rule.index) if entry.path in path_rules else rules
+
+            try:
+                is_link = entry.is_symlink()
+                is_dir = entry.is_dir(follow_symlinks=False)
+                changed += self.apply_entry(entry.path, entry_rules, entry.stat(follow_symlinks=False), is_dir, is_link)
+            except OSError as e:
+                base.logIt("Can't stat {}: {}".format(entry.path, e), True)
+                continue
+
+            if is_dir:
+                subdirs.append((entry.path, rules))
+
+        return subdirs, changed
+
+    def apply_rules(self, rules):
+        if not rules:
+            return
+
+        for rule in rules:
+            self.log_rule(rule)
+
+        recursive_rules = {}
+        path_rules = {}
+        for rule in rules:
+            (recursive_rules if rule.recursive else path_rules).setdefault(rule.path, []).append(rule)
+
+        # trees under another recursive rule are walked with their parent tree
+        def covered(path):
+            parent = os.path.dirname(path)
+            while parent and parent != path:
+                if parent in recursive_rules:
+                    return True
+                path, parent = parent, os.path.dirname(parent)
+            return False
+
+        roots = [path for path in sorted(set(recursive_rules).union(path_rules)) if not covered(path)]
+        changed = 0
+
+        with profiler.span('permissions', 'run', rules=len(rules)):
+            with ThreadPoolExecutor(max_workers=Config.get('permission_workers', 8)) as pool:
+                pending = set()
+
+                for root in roots:
+                    root_rules = sorted(recursive_rules.get(root, []) + path_rules.get(root, []), key=lambda rule: rule.index)
+                    try:
+                        stat_result = os.lstat(root)
+                    except OSError as e:
+                        base.logIt("Can't stat {}: {}".format(root, e), True)
+                        continue
+
+                    # symlinked roots are treated as entries of a tree, link itself is changed
+                    is_link = stat.S_ISLNK(stat_result.st_mode)
+                    is_dir = stat.S_ISDIR(stat_result.st_mode)
+                    changed += self.apply_entry(root, root_rules, stat_result, is_dir, is_link)
+
+                    if root in recursive_rules and is_dir:
+                        pending.add(pool.submit(self.apply_dir, root, recursive_rules[root], recursive_rules, path_rules))
+
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        subdirs, dir_changed = future.result()
+                        changed += dir_changed
+                        for subdir, subdir_rules in subdirs:
+                            pending.add(pool.submit(self.apply_dir, subdir, subdir_rules, recursive_rules, path_rules))
+
+            profiler.add_args(changed=changed)
+
+        base.logIt("Applied {} owner/mode rules, {} entries changed".format(len(rules), changed))
+
+
+permissionPlanner = PermissionPlanner()
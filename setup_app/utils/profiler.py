@@ -0,0 +1,116 @@
+import os
+import time
+import json
+import threading
+import functools
+
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Records spans of setup phases when enabled. Spans are written as Chrome
+    trace events (chrome://tracing, https://ui.perfetto.dev) and summarized
+    by total duration."""
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_fn = None
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_time = time.time()
+
+    def enable(self, trace_fn):
+        self.enabled = True
+        self.trace_fn = trace_fn
+        self.start_time = time.time()
+
+    @contextmanager
+    def span(self, name, category='setup', **args):
+        if not self.enabled:
+            yield
+            return
+
+        stack = self.local.__dict__.setdefault('stack', [])
+        span = {'name': name, 'cat': category, 'args': args, 'tid': threading.get_ident()}
+        stack.append(span)
+        span['start'] = time.time()
+        try:
+            yield
+        finally:
+            span['end'] = time.time()
+            stack.pop()
+            with self.lock:
+                self.spans.append(span)
+
+    def add_args(self, **args):
+        """Adds arguments (i.e. rows, bytes) to current span of thread"""
+        stack = self.local.__dict__.get('stack')
+        if self.enabled and stack:
+            stack[-1]['args'].update(args)
+
+    def trace(self, category, name=None):
+        """Decorator recording each call of function as a span"""
+
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(span_name, category):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def get_trace_events(self):
+        pid = os.getpid()
+        events = []
+        with self.lock:
+            spans = self.spans[:]
+
+        for span in spans:
+            events.append({
+                    'name': span['name'],
+                    'cat': span['cat'],
+                    'ph': 'X',
+                    'ts': int((span['start'] - self.start_time) * 1000000),
+                    'dur': int((span['end'] - span['start']) * 1000000),
+                    'pid': pid,
+                    'tid': span['tid'],
+                    'args': {key: str(val) for key, val in span['args'].items()},
+                    })
+
+        return events
+
+    def write_trace(self, trace_fn=None):
+        trace_fn = trace_fn or self.trace_fn
+        with open(trace_fn, 'w') as w:
+            json.dump({'traceEvents': self.get_trace_events(), 'displayTimeUnit': 'ms'}, w)
+        return trace_fn
+
+    def summary(self, top=20):
+        """Returns text table of spans grouped by category, installer and name,
+        sorted by total duration"""
+
+        totals = {}
+        with self.lock:
+            for span in self.spans:
+                key = (span['cat'], span['args'].get('installer', ''), span['name'])
+                total = totals.setdefault(key, {'count': 0, 'total': 0, 'max': 0})
+                duration = span['end'] - span['start']
+                total['count'] += 1
+                total['total'] += duration
+                total['max'] = max(total['max'], duration)
+
+        lines = ['{:<10} {:<16} {:<40} {:>7} {:>10} {:>10}'.format('category', 'installer', 'name', 'count', 'total(s)', 'max(s)')]
+        for key, total in sorted(totals.items(), key=lambda item: item[1]['total'], reverse=True)[:top]:
+            lines.append('{:<10} {:<16} {:<40} {:>7} {:>10.2f} {:>10.2f}'.format(key[0], key[1], key[2][:40], total['count'], total['total'], total['max']))
+
+        return '\n'.join(lines)
+
+
+profiler = Profiler()
@@ -20,6 +20,8 @@ class ShowProgress(Thread):
         self.services = services
         self.service_names = [s['name'] for s in services]
         self.queue = queue
+        self.running = set()
+        self.finished = set()
         self.end_time = time.time() + timeout * 60
 
     def get_max_len(self):
@@ -46,6 +48,13 @@ class ShowProgress(Thread):
             if not self.queue.empty():
                 data = self.queue.get()
 
+            # services may be installed concurrently
+            if data.get('started'):
+                self.running.add(data['started'])
+            elif data.get('finished'):
+                self.running.discard(data['finished'])
+                self.finished.add(data['finished'])
+
             if data.get('current'):
                 for si, s in enumerate(self.services):
                     if s['name'] == data['current']:
@@ -69,9 +78,9 @@ class ShowProgress(Thread):
 
             for i, service in enumerate(self.services):
                 spin_char = ' '
-                if i == current_service:
+                if i == current_service or service['name'] in self.running:
                     spin_char = phases[phase_counter%len(phases)]
-                elif i < current_service:
+                elif i < current_service or service['name'] in self.finished:
                     spin_char = '\033[92m{}\033[0m'.format(finished_char)
 
                 sys.stdout.write(spin_char + ' ' + service['name'].ljust(max_len) + ' ' + service.get('msg','') +'\n')
@@ -128,5 +137,13 @@ class GluuProgress:
             self.queue.put({'current': service_name, 'msg': msg})
         elif service_name != static.COMPLETED:
             print("Process {}: {}".format(service_name, msg))
+
+    def started(self, service_name):
+        if self.queue:
+            self.queue.put({'started': service_name})
+
+    def finished(self, service_name):
+        if self.queue:
+            self.queue.put({'finished': service_name})
         
 gluuProgress = GluuProgress()
@@ -9,11 +9,9 @@ import ssl
 import re
 import inspect
 
-import ldap3
-
 from setup_app import paths
 from setup_app.utils import base
-from setup_app.utils.cbm import CBM
+from setup_app.utils.lazy_import import lazy_import
 from setup_app.static import InstallTypes, SetupProfiles, BackendStrings, colors
 from setup_app.messages import msg
 
@@ -23,10 +21,13 @@ from setup_app.utils.setup_utils import SetupUtils
 from setup_app.utils.db_utils import dbUtils
 from setup_app.pylib.jproperties import Properties
 
+ldap3 = lazy_import('ldap3')
+cbm_module = lazy_import('setup_app.utils.cbm')
+
 if Config.profile != SetupProfiles.DISA_STIG:
-    import pymysql
-    import psycopg2
-    from setup_app.utils.spanner_rest_client import SpannerClient
+    pymysql = lazy_import('pymysql')
+    psycopg2 = lazy_import('psycopg2')
+    spanner_rest_client = lazy_import('setup_app.utils.spanner_rest_client')
 
 class PropertiesUtils(SetupUtils):
 
@@ -279,7 +280,7 @@ class PropertiesUtils(SetupUtils):
             Config.cb_password = p.get('ldapPass')
 
         if Config.cb_install == InstallTypes.REMOTE:
-            cbm_ = CBM(Config.couchbase_hostname, Config.couchebaseClusterAdmin, Config.cb_password)
+            cbm_ = cbm_module.CBM(Config.couchbase_hostname, Config.couchebaseClusterAdmin, Config.cb_password)
             if not cbm_.test_connection().ok:
                 print("Can't connect to remote Couchbase Server with credentials found in setup.properties.")
                 sys.exit(1)
@@ -373,7 +374,7 @@ class PropertiesUtils(SetupUtils):
 
         for i, cb_host in enumerate(cb_hosts):
 
-                cbm_ = CBM(cb_host, Config.couchebaseClusterAdmin, Config.cb_password)
+                cbm_ = cbm_module.CBM(cb_host, Config.couchebaseClusterAdmin, Config.cb_password)
                 if not Config.thread_queue:
                     print("    Checking Couchbase connection for " + cb_host)
 
@@ -885,7 +886,7 @@ class PropertiesUtils(SetupUtils):
 
             print("  Checking spanner connection")
             try:
-                SpannerClient(
+                spanner_rest_client.SpannerClient(
                             project_id=Config.spanner_project,
                             instance_id=Config.spanner_instance,
                             database_id=Config.spanner_database,
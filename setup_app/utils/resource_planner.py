@@ -0,0 +1,247 @@
+import os
+import math
+
+from setup_app.config import Config
+from setup_app.utils import base
+
+
+class ResourcePlanner:
+    """Plans heap sizes and JVM options of applications from memory and cpu
+    limits of the host or container (cgroup v1 and v2). Non heap memory of
+    each process (metaspace, direct buffers, code cache and thread stacks),
+    OS and Apache are reserved before heaps are shared by weight."""
+
+    cgroup_root = '/sys/fs/cgroup'
+    # cgroup v1 reports a huge number if memory is not limited
+    unlimited_memory = 1 << 60
+
+    def __init__(self):
+        self.plan = None
+
+    def get_cgroup_paths(self):
+        # cgroup of process for each controller, unified hierarchy (v2) has empty controller name
+        cgroup_paths = {}
+        try:
+            with open('/proc/self/cgroup') as f:
+                for l in f:
+                    hierarchy_id, controllers, path = l.strip().split(':', 2)
+                    for controller in controllers.split(','):
+                        cgroup_paths[controller] = path
+        except Exception as e:
+            base.logIt("Can't read cgroup of process: {}".format(e))
+
+        return cgroup_paths
+
+    def get_cgroup_version(self):
+        if os.path.exists(os.path.join(self.cgroup_root, 'cgroup.controllers')):
+            return 2
+        if os.path.exists(os.path.join(self.cgroup_root, 'memory')):
+            return 1
+
+    def read_cgroup_file(self, fn, controller=''):
+        controller_dir = os.path.join(self.cgroup_root, controller) if controller else self.cgroup_root
+        cgroup_path = self.get_cgroup_paths().get(controller, '/')
+
+        # inside containers cgroup of process is mounted as root
+        for cgroup_dir in (os.path.join(controller_dir, cgroup_path.lstrip('/')), controller_dir):
+            cgroup_fn = os.path.join(cgroup_dir, fn)
+            if os.path.isfile(cgroup_fn):
+                try:
+                    with open(cgroup_fn) as f:
+                        return f.read().strip()
+                except Exception as e:
+                    base.logIt("Can't read {}: {}".format(cgroup_fn, e))
+
+    def get_cgroup_memory_limit(self, cgroup_version):
+        """Returns memory limit of cgroup in bytes, None if not limited"""
+
+        if cgroup_version == 2:
+            limit = self.read_cgroup_file('memory.max')
+        elif cgroup_version == 1:
+            limit = self.read_cgroup_file('memory.limit_in_bytes', 'memory')
+        else:
+            return
+
+        if limit and limit.isdigit() and int(limit) < self.unlimited_memory:
+            return int(limit)
+
+    def get_cgroup_cpu_limit(self, cgroup_version):
+        """Returns cpu quota of cgroup as number of cores, None if not limited"""
+
+        quota = period = None
+        if cgroup_version == 2:
+            cpu_max = self.read_cgroup_file('cpu.max')
+            if cpu_max:
+                quota, period = (cpu_max.split() + ['100000'])[:2]
+        elif cgroup_version == 1:
+            quota = self.read_cgroup_file('cpu.cfs_quota_us', 'cpu')
+            period = self.read_cgroup_file('cpu.cfs_period_us', 'cpu')
+
+        try:
+            quota, period = int(quota), int(period)
+        except (TypeError, ValueError):
+            return
+
+        if quota > 0 and period > 0:
+            return quota / period
+
+    def get_resources(self):
+        cgroup_version = self.get_cgroup_version()
+        physical_memory = base.current_mem_bytes // (1024 * 1024)
+        memory_limit = self.get_cgroup_memory_limit(cgroup_version)
+        memory_limit = memory_limit // (1024 * 1024) if memory_limit else None
+
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else base.current_number_of_cpu
+        cpu_limit = self.get_cgroup_cpu_limit(cgroup_version)
+        if cpu_limit:
+            cores = min(cores, max(1, math.ceil(cpu_limit)))
+
+        return {
+            'cgroup_version': cgroup_version,
+            'physical_memory': physical_memory,
+            'cgroup_memory_limit': memory_limit,
+            'memory': min(physical_memory, memory_limit) if memory_limit else physical_memory,
+            'cgroup_cpu_limit': cpu_limit,
+            'cores': cores,
+            }
+
+    def get_non_heap(self, app):
+        if app == 'passport':
+            return Config.node_overhead_ram
+
+        return Config.app_mem_weigths[app].get('metaspace', 128) + Config.jvm_max_direct_memory + Config.jvm_overhead_ram
+
+    def get_gc_options(self, heap, cores, jvm_count, gc=None):
+        """Returns collector, its thread count and options. gc forces
+        collector of an application, e.g. idp is tuned for ParallelGC"""
+
+        # JVM ergonomics assume the whole machine, cores are shared by all JVMs
+        if cores < 2 and not gc:
+            return 'SerialGC', 1, ['-XX:+UseSerialGC']
+
+        gc_threads = max(1, min(cores, max(2, cores // jvm_count)))
+
+        if gc != 'ParallelGC' and heap >= Config.g1gc_min_heap:
+            return 'G1GC', gc_threads, [
+                        '-XX:+UseG1GC',
+                        '-XX:ParallelGCThreads={}'.format(gc_threads),
+                        '-XX:ConcGCThreads={}'.format(max(1, (gc_threads + 3) // 4))
+                        ]
+
+        return 'ParallelGC', gc_threads, ['-XX:+UseParallelGC', '-XX:ParallelGCThreads={}'.format(gc_threads)]
+
+    def make_plan(self, application_max_ram, apps, with_opendj=False):
+        resources = self.get_resources()
+
+        reserved = {'system': Config.system_ram}
+        if Config.get('installHttpd'):
+            reserved['apache'] = Config.httpd_ram
+
+        budget = min(float(application_max_ram), resources['memory'] - sum(reserved.values()))
+
+        processes = list(apps) + (['opendj'] if with_opendj else [])
+        jvms = [app for app in processes if app != 'passport']
+        non_heap = {app: self.get_non_heap(app) for app in processes}
+        heap_pool = budget - sum(non_heap.values())
+
+        weights = {app: Config.app_mem_weigths[app]['weigth'] for app in processes}
+        heaps = {}
+
+        if with_opendj:
+            opendj_heap = weights['opendj'] * heap_pool / sum(weights.values())
+            if opendj_heap < Config.opendj_ram:
+                heaps['opendj'] = Config.opendj_ram
+                heap_pool -= Config.opendj_ram
+                weights.pop('opendj')
+
+        total_weigth = sum(weights.values())
+        for app in weights:
+            heaps[app] = round(weights[app] * heap_pool / total_weigth)
+
+        plan = {'resources': resources, 'reserved': reserved, 'budget': round(budget), 'apps': {}, 'sufficient': True}
+
+        for app in processes:
+            min_heap = Config.app_mem_weigths[app]['min']
+            heap = max(heaps[app], min_heap)
+            if heaps[app] < min_heap:
+                plan['sufficient'] = False
+
+            app_plan = {
+                'heap': heap,
+                'min_heap': min_heap,
+                'non_heap': non_heap[app],
+                'options': '',
+                }
+
+            if app in jvms:
+                gc, gc_threads, options = self.get_gc_options(heap, resources['cores'], len(jvms), Config.app_mem_weigths[app].get('gc'))
+                metaspace = Config.app_mem_weigths[app].get('metaspace', 128)
+                options += [
+                        '-XX:MaxMetaspaceSize={}m'.format(metaspace),
+                        '-XX:MaxDirectMemorySize={}m'.format(Config.jvm_max_direct_memory),
+                        ] + Config.app_mem_weigths[app].get('jvm_opts', [])
+                app_plan.update({'gc': gc, 'gc_threads': gc_threads, 'metaspace': metaspace, 'options': ' '.join(options)})
+
+            plan['apps'][app] = app_plan
+
+        return plan
+
+    def apply(self, plan):
+        # defaults are needed for proper rendering of templates of not installed apps
+        for app in Config.app_mem_weigths:
+            Config.templateRenderingDict['{}_max_mem'.format(app)] = Config.app_mem_weigths[app]['min']
+            Config.templateRenderingDict['{}_min_mem'.format(app)] = Config.app_mem_weigths[app]['min']
+            Config.templateRenderingDict['{}_jvm_opts'.format(app)] = ''
+
+        for app, app_plan in plan['apps'].items():
+            if app == 'opendj':
+                os.environ['ce_ldap_xms'] = str(app_plan['min_heap'])
+                os.environ['ce_ldap_xmx'] = str(app_plan['heap'])
+                os.environ['ce_ldap_jvm_opts'] = app_plan['options']
+            else:
+                Config.templateRenderingDict['{}_max_mem'.format(app)] = app_plan['heap']
+                Config.templateRenderingDict['{}_min_mem'.format(app)] = app_plan['min_heap']
+                Config.templateRenderingDict['{}_jvm_opts'.format(app)] = app_plan['options']
+
+    def calculate(self, application_max_ram, apps, with_opendj=False):
+        """Plans and applies memory settings, returns False if memory is not
+        enough for minimum heaps of applications"""
+
+        self.plan = self.make_plan(application_max_ram, apps, with_opendj)
+        self.apply(self.plan)
+
+        base.logIt("Resource plan: {}".format(self.plan))
+        if not self.plan['sufficient']:
+            base.logIt("Memory is not enough for applications, minimum heap sizes are used", True)
+
+        return self.plan['sufficient']
+
+    def report(self, plan=None):
+        plan = plan or self.plan
+        resources = plan['resources']
+
+        memory = '{} MB'.format(resources['physical_memory'])
+        if resources['cgroup_memory_limit']:
+            memory += ', cgroup v{} limit {} MB'.format(resources['cgroup_version'], resources['cgroup_memory_limit'])
+
+        cores = str(resources['cores'])
+        if resources['cgroup_cpu_limit']:
+            cores += ', cgroup v{} quota {:.2f}'.format(resources['cgroup_version'], resources['cgroup_cpu_limit'])
+
+        txt = 'Memory'.ljust(30) + memory.rjust(35) + "\n"
+        txt += 'Cores'.ljust(30) + cores.rjust(35) + "\n"
+        for name, ram in plan['reserved'].items():
+            txt += 'Reserved for {} (MB)'.format(name).ljust(30) + str(ram).rjust(35) + "\n"
+        txt += 'Applications budget (MB)'.ljust(30) + str(plan['budget']).rjust(35) + "\n\n"
+
+        txt += 'App'.ljust(10) + 'Heap'.rjust(8) + 'Min'.rjust(8) + 'Non heap'.rjust(10) + '  JVM options\n'
+        for app, app_plan in plan['apps'].items():
+            txt += app.ljust(10) + str(app_plan['heap']).rjust(8) + str(app_plan['min_heap']).rjust(8) + str(app_plan['non_heap']).rjust(10) + '  ' + app_plan['options'] + "\n"
+
+        if not plan['sufficient']:
+            txt += "\nMemory is not enough for applications, minimum heap sizes are used\n"
+
+        return txt
+
+
+resourcePlanner = ResourcePlanner()
@@ -0,0 +1,309 @@
+import os
+import json
+import marshal
+import hashlib
+import threading
+
+from setup_app import paths
+from setup_app.utils import base
+
+# Currently we implement only three data types: string, boolean, integer, datetime
+syntaxType = {
+                '1.3.6.1.4.1.1466.115.121.1.7': 'boolean',
+                '1.3.6.1.4.1.1466.115.121.1.27': 'integer',
+                '1.3.6.1.4.1.1466.115.121.1.24': 'datetime',
+              }
+# other syntaxes are treated as string
+
+default_syntax = '1.3.6.1.4.1.1466.115.121.1.15'
+rdbm_types = ('mysql', 'pgsql', 'spanner')
+
+
+def get_object_class_attributes(object_classes, obj, include_object_classes=()):
+    """Returns attributes of object class obj as stored in sql table: its own
+    attributes, sql includes and attributes of included and super classes"""
+
+    attr_list = obj['may'] + obj.get('sql', {}).get('include', [])
+    for incobjcls in obj.get('sql', {}).get('includeObjectClass', []) + list(include_object_classes):
+        attr_list += object_classes.get(incobjcls, {}).get('may', [])
+    for sup_name in obj['sup']:
+        if sup_name != 'top':
+            attr_list += object_classes.get(sup_name, {}).get('may', [])
+
+    return list(dict.fromkeys(attr_list))
+
+
+class CompiledSchema:
+    """Lookup tables compiled from schema and rdbm mapping files. Objects
+    are shared between consumers, copy them before modifying."""
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+
+    def get_attribute(self, attrname):
+        return self.attributes.get(attrname)
+
+    def get_object_class(self, name):
+        return self.object_classes.get(name)
+
+    def get_object_class_attributes(self, name, include_object_classes=()):
+        if include_object_classes:
+            return get_object_class_attributes(self.object_classes, self.object_classes[name], include_object_classes)
+        return self.object_class_attributes[name]
+
+    def is_multivalued(self, attrname):
+        return attrname in self.list_attribute_index
+
+    def get_data_type(self, attrname):
+        return self.attrib_type_index.get(attrname, 'string')
+
+    def make_attr_info(self, attrname, syntax):
+        if attrname in self.sql_data_types:
+            data_type = self.sql_data_types[attrname]
+        else:
+            data_type = self.ldap_sql_data_type_mapping.get(syntax, {})
+
+        sql_types = {}
+        for rdbm_type in rdbm_types:
+            rdbm_data_type = data_type.get(rdbm_type) or data_type.get('mysql')
+            sql_types[rdbm_type] = rdbm_data_type['type'] if rdbm_data_type else None
+
+        sub_tables = {}
+        for rdbm_type, tables in self.subtable_attributes.items():
+            sub_tables[rdbm_type] = [ table for table in tables if attrname in tables[table] ]
+
+        return {
+                'syntax': syntax,
+                'data_type': self.get_data_type(attrname),
+                'sql_types': sql_types,
+                'multivalued': self.is_multivalued(attrname),
+                'sub_tables': sub_tables,
+                }
+
+    def get_attr_info(self, attrname):
+        """Returns ldap syntax, data type, sql type for each rdbm backend,
+        multivaluedness and sub tables of attribute attrname"""
+
+        attr_info = self.attr_index.get(attrname)
+        if attr_info is None:
+            attr_info = self.make_attr_info(attrname, default_syntax)
+            self.attr_index[attrname] = attr_info
+
+        return attr_info
+
+
+class SchemaRegistry:
+    """Loads Gluu schema files, OpenDJ attribute types and rdbm mapping files
+    once and compiles them to lookup tables. Compiled tables are cached in
+    memory and on disk (marshal), keyed by sha1 of source files, so they are
+    compiled again only when a source file changes."""
+
+    schema_dir = os.path.join(paths.INSTALL_DIR, 'schema')
+    static_rdbm_dir = os.path.join(paths.INSTALL_DIR, 'static/rdbm')
+    base_schema_files = ('gluu_schema.json', 'custom_schema.json')
+    rdbm_mapping_files = ('ldap_sql_data_type_mapping', 'sql_data_types', 'opendj_attributes_syntax', 'sub_tables')
+    cache_dir = os.path.join(paths.INSTALL_DIR, 'schema/.schema_cache')
+    cache_version = 1
+    cache_size = 8
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.schemas = {}
+
+    def get_schema_path(self, schema_fn):
+        return schema_fn if schema_fn.startswith('/') else os.path.join(self.schema_dir, schema_fn)
+
+    def get_sources(self, schema_files):
+        sources = [
+            ('opendj_types', os.path.join(self.schema_dir, 'opendj_types.json')),
+            ('gluu_schema', os.path.join(self.schema_dir, 'gluu_schema.json')),
+            ]
+
+        for name in self.rdbm_mapping_files:
+            sources.append((name, os.path.join(self.static_rdbm_dir, name + '.json')))
+
+        for schema_fn in schema_files:
+            sources.append(('schema', self.get_schema_path(schema_fn)))
+
+        return sources
+
+    def read_sources(self, sources):
+        """Returns contents of source files and cache key made of their hashes"""
+
+        contents = {}
+        key = hashlib.sha1(str(self.cache_version).encode())
+        for name, fn in sources:
+            if fn not in contents:
+                try:
+                    with open(fn, 'rb') as f:
+                        contents[fn] = f.read()
+                except FileNotFoundError:
+                    contents[fn] = None
+            key.update('{}:{}:{}\n'.format(name, fn, hashlib.sha1(contents[fn]).hexdigest() if contents[fn] is not None else '-').encode())
+
+        return contents, key.hexdigest()
+
+    def get(self, extra_schema_files=(), schema_files=None):
+        """Returns CompiledSchema of schema_files (base schema files if not
+        given) and extra_schema_files. File names not starting with / are
+        relative to schema directory."""
+
+        schema_files = list(self.base_schema_files if schema_files is None else schema_files) + list(extra_schema_files)
+        sources = self.get_sources(schema_files)
+        contents, key = self.read_sources(sources)
+
+        with self.lock:
+            if key not in self.schemas:
+                data = self.read_cache(key)
+                if data is None:
+                    base.logIt("Compiling schema {}".format(', '.join(schema_files)))
+                    data = self.compile(sources, contents)
+                    self.write_cache(key, data)
+                self.schemas[key] = CompiledSchema(data)
+
+            return self.schemas[key]
+
+    def get_schema_file(self, schema_fn):
+        """Returns parsed content of schema file schema_fn"""
+
+        extra_schema_files = [] if schema_fn in self.base_schema_files else [schema_fn]
+        return self.get(extra_schema_files).schemas[self.get_schema_path(schema_fn)]
+
+    def read_cache(self, key):
+        cache_fn = os.path.join(self.cache_dir, key)
+        try:
+            # marshal.load() reads file in small chunks, loads() is much faster
+            with open(cache_fn, 'rb') as f:
+                return marshal.loads(f.read())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            base.logIt("Can't read schema cache {}: {}".format(cache_fn, e))
+
+    def write_cache(self, key, data):
+        cache_fn = os.path.join(self.cache_dir, key)
+        tmp_fn = '{}.{}'.format(cache_fn, os.getpid())
+
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with open(tmp_fn, 'wb') as w:
+                w.write(marshal.dumps(data))
+            os.replace(tmp_fn, cache_fn)
+
+            # keep the most recently compiled schemas only
+            cache_files = sorted(os.scandir(self.cache_dir), key=lambda entry: entry.stat().st_mtime, reverse=True)
+            for entry in cache_files[self.cache_size:]:
+                os.remove(entry.path)
+        except Exception as e:
+            base.logIt("Can't write schema cache {}: {}".format(cache_fn, e))
+            if os.path.exists(tmp_fn):
+                os.remove(tmp_fn)
+
+    def compile(self, sources, contents):
+        parsed = {fn: json.loads(content) if content is not None else None for fn, content in contents.items()}
+        source_fns = {name: fn for name, fn in sources if name != 'schema'}
+        schema_fns = [fn for name, fn in sources if name == 'schema']
+
+        # data types of attributes used while parsing ldif files
+        attrib_types = parsed[source_fns['opendj_types']] or {}
+        for atype in list(syntaxType.values()) + ['json']:
+            attrib_types.setdefault(atype, [])
+        list_attributes = ['member']
+
+        gluu_schema = parsed[source_fns['gluu_schema']]
+        for attrib in gluu_schema['attributeTypes']:
+            if attrib.get('multivalued'):
+                atype = 'json'
+            else:
+                atype = syntaxType.get(attrib['syntax'], 'string')
+            attrib_types[atype] += attrib['names']
+
+        for obj_type in ('objectClasses', 'attributeTypes'):
+            for obj in gluu_schema[obj_type]:
+                if obj.get('multivalued'):
+                    list_attributes += [name for name in obj['names'] if name not in list_attributes]
+
+        # first type listing an attribute wins
+        attrib_type_index = {}
+        for atype in attrib_types:
+            for attrib in attrib_types[atype]:
+                attrib_type_index.setdefault(attrib, atype)
+
+        # attributes and object classes of schema files
+        attribute_types = []
+        attributes = {}
+        object_classes = {}
+        schemas = {}
+        for schema_fn in schema_fns:
+            schema = parsed[schema_fn]
+            if schema is None:
+                base.logIt("Schema file {} was not found".format(schema_fn), True)
+                continue
+            schemas[schema_fn] = schema
+            attribute_types += schema.get('attributeTypes', [])
+            for obj in schema.get('objectClasses', []):
+                object_classes[obj['names'][0]] = obj
+
+        for attrib in attribute_types:
+            for attrname in attrib['names']:
+                attributes.setdefault(attrname, attrib)
+
+        object_class_attributes = {}
+        rdn_tables = {}
+        for obj_name, obj in object_classes.items():
+            object_class_attributes[obj_name] = get_object_class_attributes(object_classes, obj)
+            # tables (object classes) that can hold an rdn attribute
+            if not obj.get('sql', {}).get('ignore'):
+                for attrname in object_class_attributes[obj_name]:
+                    rdn_tables.setdefault(attrname, []).append(obj_name)
+
+        # rdbm mappings
+        rdbm_mappings = {name: parsed[source_fns[name]] for name in self.rdbm_mapping_files}
+        sql_data_types = rdbm_mappings['sql_data_types']
+        for attrname in list_attributes:
+            if attrname not in sql_data_types:
+                sql_data_types[attrname] = { 'mysql': {'type': 'JSON'}, 'pgsql': {'type': 'JSONB'},  'spanner': {'type': 'ARRAY<STRING(MAX)>'} }
+
+        subtable_attributes = {}
+        for rdbm_type, tables in rdbm_mappings['sub_tables'].items():
+            subtable_attributes[rdbm_type] = {table: [scol[0] for scol in tables[table]] for table in tables}
+
+        data = {
+            'schema_files': schema_fns,
+            'schemas': schemas,
+            'attrib_types': attrib_types,
+            'list_attributes': list_attributes,
+            'list_attribute_index': set(list_attributes),
+            'attrib_type_index': attrib_type_index,
+            'attribute_types': attribute_types,
+            'attributes': attributes,
+            'object_classes': object_classes,
+            'object_class_attributes': object_class_attributes,
+            'rdn_tables': rdn_tables,
+            'subtable_attributes': subtable_attributes,
+            'attr_index': {},
+            }
+        data.update(rdbm_mappings)
+
+        # attribute name -> type information, first definition of an attribute wins
+        attr_syntaxes = {}
+        for attrib in attribute_types:
+            for attrname in attrib['names']:
+                attr_syntaxes.setdefault(attrname, 'JSON' if attrib.get('multivalued') else attrib['syntax'])
+
+        for attrname, syntax in rdbm_mappings['opendj_attributes_syntax'].items():
+            attr_syntaxes.setdefault(attrname, syntax)
+
+        for attrname in sql_data_types:
+            if ':' not in attrname:
+                attr_syntaxes.setdefault(attrname, rdbm_mappings['opendj_attributes_syntax'].get(attrname, default_syntax))
+
+        compiled_schema = CompiledSchema(data)
+        for attrname, syntax in attr_syntaxes.items():
+            data['attr_index'][attrname] = compiled_schema.make_attr_info(attrname, syntax)
+
+        return data
+
+
+schemaRegistry = SchemaRegistry()
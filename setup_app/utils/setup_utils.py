@@ -13,6 +13,7 @@ import random
 import pwd
 import grp
 import hashlib
+import threading
 import ruamel.yaml
 
 from pathlib import Path
@@ -24,6 +25,11 @@ from setup_app.config import Config
 from setup_app.utils import base
 from setup_app.static import InstallTypes, SetupProfiles
 from setup_app.utils.crypto64 import Crypto64
+from setup_app.utils.template_engine import templateEngine
+from setup_app.utils.permissions import permissionPlanner
+
+# installers may run concurrently, user database is modified by one at a time
+user_db_lock = threading.RLock()
 
 class SetupUtils(Crypto64):
 
@@ -395,15 +401,8 @@ class SetupUtils(Crypto64):
         return text % dictionary
 
     def render_template(self, tmp_fn):
-        template_text = self.readFile(tmp_fn)
-        format_dict = self.merge_dicts(Config.__dict__, Config.templateRenderingDict)
-        for k in format_dict:
-            if isinstance(format_dict[k], bool):
-                format_dict[k] = str(format_dict[k]).lower()
-
-        rendered_text = self.fomatWithDict(template_text, format_dict)
-
-        return rendered_text
+        # templates are compiled once, rendering context is cached until Config changes
+        return templateEngine.render(tmp_fn)
 
     def renderTemplateInOut(self, file_path, template_folder, output_folder=None, backup=False, out_file=None):
         fn = os.path.basename(file_path)
@@ -415,7 +414,7 @@ class SetupUtils(Crypto64):
 
         # Create output folder if needed
         if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
+            os.makedirs(output_folder, exist_ok=True)
 
         rendered_text = self.render_template(in_fp)
 
@@ -426,39 +425,39 @@ class SetupUtils(Crypto64):
         self.renderTemplateInOut(filePath, Config.templateFolder, Config.outputFolder)
 
     def createUser(self, userName, homeDir, shell='/bin/bash'):
-
-        try:
-            grp.getgrnam(userName)
-            user_group_exists = True
-        except KeyError:
-            user_group_exists = False
-
-        try:
-            pwd.getpwnam(userName)
-            self.logIt("User {} exists".format(userName))
-        except KeyError:
+        with user_db_lock:
             try:
-                useradd = '/usr/sbin/useradd'
-                cmd = [useradd, '--system', '--shell', shell, userName]
-                if user_group_exists:
-                    cmd.insert(1, '-g')
-                    cmd.insert(2, userName)
-                else:
-                    cmd.insert(1, '--user-group')
-                if homeDir:
-                    cmd.insert(-1, '--create-home')
-                    cmd.insert(-1, '--home-dir')
-                    cmd.insert(-1, homeDir)
-                else:
-                    cmd.insert(-1, '--no-create-home')
-                self.run(cmd)
-                if homeDir:
-                    self.logOSChanges("User %s with homedir %s was created" % (userName, homeDir))
-                else:
-                    self.logOSChanges("User %s without homedir was created" % (userName))
+                grp.getgrnam(userName)
+                user_group_exists = True
+            except KeyError:
+                user_group_exists = False
 
-            except Exception as e:
-                self.logIt("Error adding user: {}".format(e), True)
+            try:
+                pwd.getpwnam(userName)
+                self.logIt("User {} exists".format(userName))
+            except KeyError:
+                try:
+                    useradd = '/usr/sbin/useradd'
+                    cmd = [useradd, '--system', '--shell', shell, userName]
+                    if user_group_exists:
+                        cmd.insert(1, '-g')
+                        cmd.insert(2, userName)
+                    else:
+                        cmd.insert(1, '--user-group')
+                    if homeDir:
+                        cmd.insert(-1, '--create-home')
+                        cmd.insert(-1, '--home-dir')
+                        cmd.insert(-1, homeDir)
+                    else:
+                        cmd.insert(-1, '--no-create-home')
+                    self.run(cmd)
+                    if homeDir:
+                        self.logOSChanges("User %s with homedir %s was created" % (userName, homeDir))
+                    else:
+                        self.logOSChanges("User %s without homedir was created" % (userName))
+
+                except Exception as e:
+                    self.logIt("Error adding user: {}".format(e), True)
 
     def createGroup(self, groupName):
         try:
@@ -473,20 +472,21 @@ class SetupUtils(Crypto64):
                 self.logIt("Error adding group", True)
 
     def addUserToGroup(self, groupName, userName):
-        try:
-            grpdb = grp.getgrnam(groupName)
-        except KeyError:
-            self.createGroup(groupName)
-            grpdb = grp.getgrnam(groupName)
-        if userName in grpdb.gr_mem:
-            self.logIt("User {} is already member of {}".format(userName, groupName))
-            return
-        try:
-            usermod = '/usr/sbin/usermod'
-            self.run([usermod, '-a', '-G', groupName, userName])
-            self.logOSChanges("User %s was added to group %s" % (userName,groupName))
-        except:
-            self.logIt("Error adding group", True)
+        with user_db_lock:
+            try:
+                grpdb = grp.getgrnam(groupName)
+            except KeyError:
+                self.createGroup(groupName)
+                grpdb = grp.getgrnam(groupName)
+            if userName in grpdb.gr_mem:
+                self.logIt("User {} is already member of {}".format(userName, groupName))
+                return
+            try:
+                usermod = '/usr/sbin/usermod'
+                self.run([usermod, '-a', '-G', groupName, userName])
+                self.logOSChanges("User %s was added to group %s" % (userName,groupName))
+            except:
+                self.logIt("Error adding group", True)
 
     def set_systemd_timeout(self, t=300):
         systemd_conf_fn = '/etc/systemd/system.conf'
@@ -561,6 +561,7 @@ class SetupUtils(Crypto64):
                 if p.as_posix().startswith(idir):
                     return True
 
+        template_files = []
         tp = Path(templatesFolder)
         for te in tp.rglob('*'):
             if in_ignoredirs(te):
@@ -570,21 +571,24 @@ class SetupUtils(Crypto64):
                 continue
 
             if te.is_file() and not te.name.endswith('.nrnd'):
-                self.logIt("Rendering template {}".format(te))
-                rp = te.relative_to(Config.templateFolder)
-                output_dir = rp.parent
-                template_name = rp.name
+                template_files.append(te)
+
+        def render_file(te):
+            self.logIt("Rendering template {}".format(te))
+            rp = te.relative_to(Config.templateFolder)
+            output_dir = rp.parent
+
+            fullOutputDir = Path(Config.outputFolder, output_dir)
+            fullOutputFile = Path(Config.outputFolder, rp)
 
-                fullOutputDir = Path(Config.outputFolder, output_dir)
-                fullOutputFile = Path(Config.outputFolder, rp)
+            if not fullOutputDir.exists():
+                fullOutputDir.mkdir(parents=True, exist_ok=True)
 
-                if not fullOutputDir.exists():
-                    fullOutputDir.mkdir(parents=True, exist_ok=True)
+            rendered_text = templateEngine.render(te.as_posix(), escape=False, config_first=False, lower_bools=False)
+            self.logIt("Writing rendered template {}".format(fullOutputFile))
+            fullOutputFile.write_text(rendered_text)
 
-                template_text = te.read_text()
-                rendered_text = template_text % self.merge_dicts(Config.templateRenderingDict, Config.__dict__)
-                self.logIt("Writing rendered template {}".format(fullOutputFile))
-                fullOutputFile.write_text(rendered_text)
+        templateEngine.map(render_file, template_files)
 
     def render_unit_file(self, service_name):
         self.renderTemplateInOut(service_name+'.service', os.path.join(Config.templateFolder, 'systemd'), Config.system_dir)
@@ -682,12 +686,9 @@ class SetupUtils(Crypto64):
         return keystore_name + '.' + Config.default_client_test_store_type
 
     def chown(self, fn, user, group=None, recursive=False):
-        cmd = [paths.cmd_chown]
-        if recursive:
-            cmd.append('-R')
-        usr_grp = '{}:{}'.format(user, group) if group else user
-        cmd += [usr_grp, fn]
-        self.run(cmd)
+        if ':' in user and not group:
+            user, group = user.split(':', 1)
+        permissionPlanner.change(fn, user, group, recursive=recursive)
 
     def get_version(self, s):
         ret_val = [0, 0 ,0]
@@ -1,16 +1,135 @@
 import os
 import time
 import json
+import codecs
+import threading
 import jwt
-import requests
 import logging
 
 import http.client
 from http.client import HTTPConnection
+from contextlib import contextmanager
+
+from setup_app.utils.http_utils import get_pooled_session
+from setup_app.utils.profiler import profiler
+from setup_app.utils.db_metrics import dbMetrics
+
+
+class SpannerSessionPool:
+    """Spanner sessions shared by threads. Sessions are created on demand up to
+    size, idle sessions are kept alive since Spanner deletes sessions which are
+    not used for one hour."""
+
+    keep_alive_interval = 45 * 60
+    keep_alive_check_interval = 60
+
+    def __init__(self, http_session, database_url, base_url, headers, size):
+        # client is not referenced, so that it can be garbage collected and close the pool
+        self.http_session = http_session
+        self.database_url = database_url
+        self.base_url = base_url
+        self.headers = headers
+        self.size = size
+        self.idle = []
+        self.discarded = set()
+        self.created = 0
+        self.condition = threading.Condition()
+        self.closed = threading.Event()
+        self.keep_alive_thread = None
+
+    def create_session(self):
+        request = self.http_session.post(os.path.join(self.database_url, 'sessions'), headers=self.headers)
+        result = request.json()
+        if 'name' not in result:
+            raise ValueError("Can't create Spanner session: {}".format(result.get('error', result)))
+        return os.path.join(self.base_url, result['name'])
+
+    def acquire(self):
+        with self.condition:
+            while not self.idle and self.created >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()[1]
+            self.created += 1
+
+        try:
+            session_url = self.create_session()
+        except Exception:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+
+        if not self.keep_alive_thread:
+            self.keep_alive_thread = threading.Thread(target=self.keep_alive, daemon=True)
+            self.keep_alive_thread.start()
+
+        return session_url
+
+    def release(self, session_url):
+        with self.condition:
+            if session_url in self.discarded:
+                self.discarded.remove(session_url)
+                self.created -= 1
+            else:
+                self.idle.append((time.time(), session_url))
+            self.condition.notify()
+
+    def discard(self, session_url):
+        """Marks session as invalid, it is dropped when released"""
+        with self.condition:
+            self.discarded.add(session_url)
+
+    @contextmanager
+    def use(self):
+        session_url = self.acquire()
+        try:
+            yield session_url
+        finally:
+            self.release(session_url)
+
+    def keep_alive(self):
+        while not self.closed.wait(self.keep_alive_check_interval):
+            with self.condition:
+                stale = [item for item in self.idle if time.time() - item[0] > self.keep_alive_interval]
+                for item in stale:
+                    self.idle.remove(item)
+
+            for last_used, session_url in stale:
+                try:
+                    result = self.http_session.post(url=session_url + ':executeSql', json={'sql': 'SELECT 1'}, headers=self.headers).json()
+                    if 'error' in result:
+                        self.discard(session_url)
+                except Exception:
+                    self.discard(session_url)
+                self.release(session_url)
+
+    def close(self):
+        self.closed.set()
+        with self.condition:
+            sessions = [session_url for last_used, session_url in self.idle]
+            self.idle = []
+
+        for session_url in sessions:
+            try:
+                self.http_session.delete(session_url, headers=self.headers)
+            except Exception:
+                pass
 
 
 class SpannerClient:
 
+    # Spanner limits number of mutations (cells) per commit, keep some margin
+    max_commit_mutations = 20000
+    max_commit_bytes = 50 * 1024 * 1024
+    commit_retries = 5
+    stream_chunk_size = 64 * 1024
+    session_pool_size = 10
+    ddl_timeout = 3600
+
+    # connections are kept alive and shared by all SpannerClient instances
+    session = None
+
     def __init__(self, project_id, instance_id, database_id, google_application_credentials=None, emulator_host=None, log_dir='.', emulator_port=9020):
         self.project_id = project_id
         self.instance_id = instance_id
@@ -19,8 +138,18 @@ class SpannerClient:
         self.emulator_host = emulator_host
         self.log_dir = log_dir
         self.emulator_port = emulator_port
-        self.sessioned_url = None
         self.headers = {}
+        self.row_decoders = {}
+        self.mutations_lock = threading.RLock()
+        self.mutations = []
+        self.mutations_count = 0
+        self.mutations_size = 0
+        # rows of buffered mutations which could not be written, see pop_failed_rows()
+        self.failed_rows = []
+
+        if not SpannerClient.session:
+            SpannerClient.session = get_pooled_session()
+            dbMetrics.instrument_http_session(SpannerClient.session, 'spanner', self.get_request_operation)
 
         if emulator_host:
             schema = 'http'
@@ -35,7 +164,7 @@ class SpannerClient:
 
 
         self.set_logging()
-        self.get_session()
+        self.session_pool = SpannerSessionPool(self.session, self.spanner_database_url, self.spanner_base_url, self.headers, self.session_pool_size)
 
     def set_spanner_database_url(self):
         self.spanner_database_url = os.path.join(
@@ -73,7 +202,7 @@ class SpannerClient:
             algorithm='RS256'
             )
 
-        req = requests.post(
+        req = self.session.post(
             url=aud,
             data={
                 'assertion': [assertion],
@@ -100,59 +229,141 @@ class SpannerClient:
 
         http.client.print = print_to_log
 
-    def get_session(self):
-        session_url = os.path.join(self.spanner_database_url, 'sessions')
-        request = requests.post(session_url, headers=self.headers)
-        result = request.json()
-        self.sessioned_url = os.path.join(self.spanner_base_url, result['name'])
-
+    @staticmethod
+    def is_session_not_found(result):
+        error = result.get('error', {}) if isinstance(result, dict) else {}
+        return error.get('status') == 'NOT_FOUND' and 'session' in error.get('message', '').lower()
+
+    def post_with_session(self, suffix, data):
+        """Posts data to suffix of a pooled session, a new session is tried if
+        Spanner has deleted the session"""
+
+        for i in range(2):
+            with self.session_pool.use() as session_url:
+                request = self.session.post(
+                            url=session_url + suffix,
+                            json=data,
+                            headers=self.headers
+                            )
+                result = request.json()
+                if self.is_session_not_found(result):
+                    self.session_pool.discard(session_url)
+                    continue
+            break
+
+        return result
+
+
+    @staticmethod
+    def get_request_operation(request):
+        for suffix, operation in ((':executeSql', 'sql'), (':executeStreamingSql', 'sql'), (':beginTransaction', 'transaction'), (':commit', 'commit'), ('/ddl', 'ddl'), ('/sessions', 'session')):
+            if request.url.endswith(suffix):
+                return operation
+        return request.method.lower()
 
     def exec_sql(self, sql_cmd):
 
         if 'select' in sql_cmd.lower().split():
-            request = requests.post(
-                        url=self.sessioned_url + ':executeSql',
-                        json={"sql": sql_cmd},
-                        headers=self.headers
-                    )
-
-        else:
-            request = requests.patch(
-                    url=os.path.join(self.spanner_database_url, 'ddl'),
-                    json={"statements": [sql_cmd]},
+            result = {}
+            result['rows'] = list(self.iter_rows(sql_cmd, result))
+            return result
+
+        return self.update_ddl([sql_cmd], wait=False)
+
+    def update_ddl(self, statements, wait=True):
+        """Applies DDL statements with a single updateDdl request, Spanner runs
+        them in order as one long running operation. If wait is True, operation
+        is polled until it is done. Returns operation, it has error key if a
+        statement failed, statements before it were applied (see
+        applied_ddl_count())"""
+
+        request = self.session.patch(
+                url=os.path.join(self.spanner_database_url, 'ddl'),
+                json={'statements': statements},
+                headers=self.headers
+                )
+        operation = request.json()
+
+        start_time = time.time()
+        delay = 1
+        while wait and 'name' in operation and not operation.get('done') and not operation.get('error'):
+            if time.time() - start_time > self.ddl_timeout:
+                operation['error'] = {'message': "DDL operation {} did not complete in {} seconds".format(operation['name'], self.ddl_timeout)}
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 10)
+            request = self.session.get(
+                    url=os.path.join(self.spanner_base_url, operation['name']),
                     headers=self.headers
                     )
+            operation = request.json()
 
-        return request.json()
+        return operation
 
+    @staticmethod
+    def applied_ddl_count(operation):
+        # a commit timestamp is set for each applied statement
+        return len(operation.get('metadata', {}).get('commitTimestamps', []))
 
+    def exec_partitioned_dml(self, sql_cmd):
+        """Executes DML statement in a partitioned DML transaction, Spanner
+        applies it to partitions of table independently"""
 
-    def write_data(self, table, columns, values, mutation='insert'):
+        with self.session_pool.use() as session_url:
+            request = self.session.post(
+                        url=session_url + ':beginTransaction',
+                        json={'options': {'partitionedDml': {}}},
+                        headers=self.headers
+                        )
+            transaction = request.json()
+            if 'error' in transaction:
+                return transaction
+
+            request = self.session.post(
+                        url=session_url + ':executeSql',
+                        json={'sql': sql_cmd, 'transaction': {'id': transaction['id']}, 'seqno': '1'},
+                        headers=self.headers
+                        )
+
+            return request.json()
+
+    def get_row_values(self, values):
         values = list(values)
         for i,value in enumerate(values):
             if type(value) is int:
                 values[i] = str(value)
+        return values
 
+    @profiler.trace('db', 'spanner_commit')
+    def commit(self, mutations):
+        profiler.add_args(rows=len(mutations))
         data = {
                 'singleUseTransaction': {'readWrite': {}},
-                "mutations": [
-                            {
+                "mutations": mutations
+                }
+
+        for i in range(self.commit_retries):
+            result = self.post_with_session(':commit', data)
+
+            # single use transactions may be aborted by Spanner, they are safe to retry
+            if result.get('error', {}).get('status') == 'ABORTED':
+                self.logger.debug("Commit was aborted, retrying")
+                time.sleep(0.1 * 2 ** i)
+                continue
+            break
+
+        return result
+
+
+    def write_data(self, table, columns, values, mutation='insert'):
+
+        return self.commit([{
                             mutation: {
                                 'table': table, 
                                 'columns': columns,
-                                'values': [values]
+                                'values': [self.get_row_values(values)]
                                 }
-                            }
-                    ]
-                }
-
-        request = requests.post(
-                    url=self.sessioned_url+':commit',
-                    json=data,
-                    headers=self.headers
-                    )
-
-        return  request.json()
+                            }])
 
 
     def delete_data(self, table, pkey):
@@ -160,56 +371,265 @@ class SpannerClient:
         if isinstance(pkey, int):
             pkey = str(pkey)
 
-        data = {
-                'singleUseTransaction': {'readWrite': {}},
-                "mutations": [
-                            {
+        return self.commit([{
                             'delete': {
                                 'table': table, 
                                 'keySet': {'keys': [[pkey]]},
                                 }
-                            }
-                    ]
-                }
+                            }])
 
-        request = requests.post(
-                    url=self.sessioned_url+':commit',
-                    json=data,
-                    headers=self.headers
-                    )
 
-        return  request.json()
+    def buffer_mutation(self, mutation, table, columns=None, values=None, pkey=None):
+        """Buffers mutation to be sent by flush_mutations(). Consecutive mutations
+        of the same type for the same table and columns are merged into one."""
 
+        with self.mutations_lock:
+            self._buffer_mutation(mutation, table, columns, values, pkey)
 
-    def get_dict_data(self, sql_cmd):
-        result = self.exec_sql(sql_cmd)
-        data = []
-        if result.get('rows'):
-            for row in result['rows']:
-                row_data = {}
-                for i, field in enumerate(result.get('metadata', {}).get('rowType', {}).get('fields', [])):
-                    row_data[field['name']] = int(row[i]) if row[i] and field['type']['code'] == 'INT64' else row[i]
-                data.append(row_data)
+    def _buffer_mutation(self, mutation, table, columns, values, pkey):
+        if mutation == 'delete':
+            if isinstance(pkey, int):
+                pkey = str(pkey)
+            row = [pkey]
+            row_mutations = 1
+        else:
+            row = self.get_row_values(values)
+            row_mutations = len(columns)
 
-        return data
+        row_size = len(json.dumps(row))
 
-    def get_table_columns(self, table):
+        if self.mutations_count + row_mutations > self.max_commit_mutations or self.mutations_size + row_size > self.max_commit_bytes:
+            self.flush_mutations()
+
+        last_mutation = self.mutations[-1] if self.mutations else {}
+        last_data = last_mutation.get(mutation)
+
+        if last_data and last_data['table'] == table and last_data.get('columns') == columns:
+            if mutation == 'delete':
+                last_data['keySet']['keys'].append(row)
+            else:
+                last_data['values'].append(row)
+        else:
+            data = {'table': table}
+            if mutation == 'delete':
+                data['keySet'] = {'keys': [row]}
+            else:
+                data['columns'] = columns
+                data['values'] = [row]
+            self.mutations.append({mutation: data})
+
+        self.mutations_count += row_mutations
+        self.mutations_size += row_size
+
+
+    def flush_mutations(self):
+        """Commits buffered mutations at once. If the commit fails, for example
+        a row already exists, mutations are committed row by row so that only
+        failing rows are lost. Failing rows are kept in failed_rows. Returns
+        result of commit, with error if any row could not be written."""
+
+        with self.mutations_lock:
+            if not self.mutations:
+                return
+
+            mutations = self.mutations
+            self.mutations = []
+            self.mutations_count = 0
+            self.mutations_size = 0
+
+            result = self.commit(mutations)
+            if result.get('error'):
+                self.logger.error("Commit of {} mutations failed: {}, committing row by row".format(len(mutations), result['error']))
+                result = self.commit_row_by_row(mutations)
+
+        return result
+
+    def commit_row_by_row(self, mutations):
+        error = None
+        for mutation_data in mutations:
+            for mutation, data in mutation_data.items():
+                rows = data['keySet']['keys'] if mutation == 'delete' else data['values']
+                for row in rows:
+                    row_data = {'table': data['table']}
+                    if mutation == 'delete':
+                        row_data['keySet'] = {'keys': [row]}
+                    else:
+                        row_data['columns'] = data['columns']
+                        row_data['values'] = [row]
+
+                    result = self.commit([{mutation: row_data}])
+                    if result.get('error'):
+                        error = result['error']
+                        self.logger.error("{} of {} in {} failed: {}".format(mutation, row[0], data['table'], error))
+                        self.failed_rows.append((mutation, data['table'], row, error))
+
+        return {'error': error} if error else {}
+
+    def pop_failed_rows(self):
+        """Returns rows failed since last call, as (mutation, table, row, error)"""
+
+        with self.mutations_lock:
+            failed_rows, self.failed_rows = self.failed_rows, []
+
+        return failed_rows
+
+
+    def get_row_decoder(self, fields):
+        """Returns function converting row values to dictionary, built once
+        for each result schema"""
+
+        schema = tuple([(field['name'], field['type']['code']) for field in fields])
+        decoder = self.row_decoders.get(schema)
+
+        if not decoder:
+            names = [name for name, code in schema]
+            int_fields = [(i, name) for i, (name, code) in enumerate(schema) if code == 'INT64']
+
+            if int_fields:
+                def decoder(row):
+                    row_data = dict(zip(names, row))
+                    for i, name in int_fields:
+                        if row[i]:
+                            row_data[name] = int(row[i])
+                    return row_data
+            else:
+                def decoder(row):
+                    return dict(zip(names, row))
+
+            self.row_decoders[schema] = decoder
+
+        return decoder
+
+    def get_dict_data(self, sql_cmd):
+        return list(self.iter_dict_data(sql_cmd))
+
+    @staticmethod
+    def merge_chunked_value(value, chunk):
+        """Merges value split across PartialResultSets. Strings are concatenated,
+        for lists the last element of value is merged with the first element
+        of chunk if they are strings or lists"""
+
+        if isinstance(value, str):
+            return value + chunk
+
+        if value and chunk and isinstance(value[-1], (str, list)) and type(value[-1]) is type(chunk[0]):
+            return value[:-1] + [SpannerClient.merge_chunked_value(value[-1], chunk[0])] + chunk[1:]
+
+        return value + chunk
+
+    def iter_partial_result_sets(self, sql_cmd):
+        """Yields PartialResultSets of executeStreamingSql while response
+        (a JSON array) is being received"""
+
+        for i in range(2):
+            with self.session_pool.use() as session_url:
+                request = self.session.post(
+                            url=session_url + ':executeStreamingSql',
+                            json={"sql": sql_cmd},
+                            headers=self.headers,
+                            stream=True
+                            )
+
+                with request:
+                    if not request.ok:
+                        result = request.json()
+                        if self.is_session_not_found(result) and not i:
+                            self.session_pool.discard(session_url)
+                            continue
+                        yield result
+                        return
+
+                    decoder = json.JSONDecoder()
+                    text_decoder = codecs.getincrementaldecoder('utf-8')()
+                    buf = ''
+
+                    for chunk in request.iter_content(self.stream_chunk_size):
+                        buf += text_decoder.decode(chunk)
+                        pos = 0
+                        while True:
+                            while pos < len(buf) and buf[pos] in '[,] \r\n\t':
+                                pos += 1
+                            if pos == len(buf):
+                                break
+                            try:
+                                result_set, pos_ = decoder.raw_decode(buf, pos)
+                            except ValueError:
+                                # result set is not received completely
+                                break
+                            pos = pos_
+                            yield result_set
+                        buf = buf[pos:]
+
+                    return
+
+    def iter_rows(self, sql_cmd, result=None):
+        """Yields rows of query as lists of values, only values of current
+        PartialResultSet are kept in memory. If result dictionary is given,
+        metadata or error of response is set to it."""
+
+        if result is None:
+            result = {}
+
+        fields = None
+        values = []
+        chunked_value = None
+
+        for result_set in self.iter_partial_result_sets(sql_cmd):
+            if 'error' in result_set:
+                self.logger.error("Query failed: {}".format(result_set['error']))
+                result['error'] = result_set['error']
+                return
+
+            if fields is None:
+                result['metadata'] = result_set.get('metadata', {})
+                fields = result['metadata'].get('rowType', {}).get('fields', [])
+                if not fields:
+                    return
+
+            result_values = result_set.get('values', [])
+
+            if chunked_value is not None and result_values:
+                result_values[0] = self.merge_chunked_value(chunked_value, result_values[0])
+                chunked_value = None
+
+            if result_set.get('chunkedValue') and result_values:
+                chunked_value = result_values.pop()
+
+            values.extend(result_values)
+            n_fields = len(fields)
+            n_rows = len(values) // n_fields
+
+            for i in range(n_rows):
+                yield values[i * n_fields:(i + 1) * n_fields]
+
+            values = values[n_rows * n_fields:]
+
+    def iter_dict_data(self, sql_cmd):
+        """Yields rows of query as dictionaries"""
+
+        result = {}
+        decoder = None
+
+        for row in self.iter_rows(sql_cmd, result):
+            if not decoder:
+                decoder = self.get_row_decoder(result['metadata']['rowType']['fields'])
+            yield decoder(row)
+
+    def get_table_fields(self, table):
         result = self.exec_sql('SELECT * FROM {} LIMIT 0'.format(table))
-        col_list = [col['name'] for col in result.get('metadata', {}).get('rowType', {}).get('fields', [])]
-        return col_list
+        return result.get('metadata', {}).get('rowType', {}).get('fields', [])
+
+    def get_table_columns(self, table):
+        return [field['name'] for field in self.get_table_fields(table)]
 
     def get_tables(self):
-        result = self.exec_sql("SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE SPANNER_STATE = 'COMMITTED'")
-        if not result.get('rows'):
-            return []
-        tables = [rowl[0] for rowl in result['rows']]
-        return tables
+        sql_cmd = "SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE SPANNER_STATE = 'COMMITTED'"
+        return [row[0] for row in self.iter_rows(sql_cmd)]
 
 
     def __del__(self):
-        if self.sessioned_url:
-            try:
-                requests.delete(self.sessioned_url, headers=self.headers)
-            except Exception:
-                pass
+        try:
+            self.session_pool.close()
+        except Exception:
+            pass
 
@@ -0,0 +1,123 @@
+import os
+import re
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from setup_app.config import Config
+from setup_app.utils.profiler import profiler
+
+
+class CompiledTemplate:
+    """Template text prepared for % formatting with placeholders extracted"""
+
+    def __init__(self, path, escape, stamp):
+        self.path = path
+        self.stamp = stamp
+
+        with open(path) as f:
+            text = f.read()
+
+        if escape:
+            # escape % signs which are not placeholders
+            text = re.sub(r"%([^\(])", r"%%\1", text)
+            text = re.sub(r"%$", r"%%", text)
+
+        self.text = text
+        self.placeholders = set(re.findall(r'%\(([^\)]*)\)', text))
+
+    def render(self, context):
+        try:
+            return self.text % context
+        except KeyError:
+            missing = sorted(self.placeholders.difference(context))
+            raise KeyError("Template {} has undefined variable(s): {}".format(self.path, ', '.join(missing)))
+
+
+class TemplateEngine:
+    """Caches compiled templates by path and modification time, and Config
+    attributes of rendering context until one of them is set"""
+
+    max_workers = 8
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.templates = {}
+        self.contexts = {}
+
+    def get_template(self, path, escape=True):
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            template = self.templates.get((path, escape))
+
+        if not template or template.stamp != stamp:
+            template = CompiledTemplate(path, escape, stamp)
+            with self.lock:
+                self.templates[(path, escape)] = template
+
+        return template
+
+    def lower_bools(self, dictionary):
+        return {key: str(value).lower() if isinstance(value, bool) else value for key, value in dictionary.items()}
+
+    def get_config_context(self, lower_bools):
+        # attributes of Config are cached until one of them is set
+        stamp = type(Config).changes
+
+        with self.lock:
+            if lower_bools in self.contexts and self.contexts[lower_bools][0] == stamp:
+                return self.contexts[lower_bools][1]
+
+        context = dict(Config.__dict__)
+        if lower_bools:
+            context = self.lower_bools(context)
+
+        with self.lock:
+            self.contexts[lower_bools] = (stamp, context)
+
+        return context
+
+    def get_context(self, config_first=True, lower_bools=True):
+        """Returns merged dictionary of Config and Config.templateRenderingDict.
+        If config_first is True, values of templateRenderingDict override Config"""
+
+        # these dictionaries are modified in place, they are merged on each call
+        rendering_dict = Config.templateRenderingDict
+        non_setup_properties = Config.get('non_setup_properties', {})
+        if lower_bools:
+            rendering_dict = self.lower_bools(rendering_dict)
+            non_setup_properties = self.lower_bools(non_setup_properties)
+
+        config_context = self.get_config_context(lower_bools)
+
+        if config_first:
+            context = dict(config_context)
+            context.update(non_setup_properties)
+            context.update(rendering_dict)
+        else:
+            context = dict(rendering_dict)
+            context.update(config_context)
+            context.update(non_setup_properties)
+
+        return context
+
+    def render(self, path, escape=True, config_first=True, lower_bools=True):
+        with profiler.span(os.path.basename(path), 'template', path=path):
+            template = self.get_template(path, escape)
+            return template.render(self.get_context(config_first, lower_bools))
+
+    def map(self, func, items):
+        """Calls func for each item concurrently, templates are rendered to
+        independent output files"""
+
+        items = list(items)
+        if len(items) < 2:
+            return [func(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(func, items))
+
+
+templateEngine = TemplateEngine()
@@ -0,0 +1,148 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+from setup_app.utils.download_manager import DownloadManager
+
+
+content = os.urandom(3 * 1024 * 1024 + 123)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('Range')))
+        body = content
+        if self.path.endswith('.sha1'):
+            self.send_error(404)
+            return
+
+        range_header = self.headers.get('Range')
+        # range is ignored if resource changed since validator
+        if range_header and self.headers.get('If-Range') not in (None, '"v1"'):
+            range_header = None
+
+        if range_header:
+            start = int(range_header.split('=')[1].split('-')[0])
+            body = content[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(content) - 1, len(content)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTest:
+
+    def __init__(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        paths.LOG_FILE = os.path.join(self.tmp_dir, 'setup.log')
+        paths.LOG_ERROR_FILE = os.path.join(self.tmp_dir, 'setup_error.log')
+        RangeHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), RangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/oxauth.war'.format(self.server.server_port)
+        self.manager = DownloadManager(os.path.join(self.tmp_dir, 'cache'))
+        self.dst = os.path.join(self.tmp_dir, 'dist', 'oxauth.war')
+
+    def write_partial(self, data, etag=None):
+        # partial file left by an interrupted download
+        partial_fn = self.manager.partial_path(self.url)
+        os.makedirs(os.path.dirname(partial_fn), exist_ok=True)
+        with open(partial_fn, 'wb') as w:
+            w.write(data)
+        if etag:
+            with open(partial_fn + '.json', 'w') as w:
+                json.dump({'etag': etag, 'last_modified': None}, w)
+        return partial_fn
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+
+def test_range_resume():
+    t = DownloadTest()
+    try:
+        partial_fn = t.write_partial(content[:1024 * 1024], '"v1"')
+
+        assert t.manager.download(t.url, t.dst, 'sha256:' + hashlib.sha256(content).hexdigest())
+        assert ('/oxauth.war', 'bytes=1048576-') in RangeHandler.requests
+        with open(t.dst, 'rb') as f:
+            assert f.read() == content
+        assert not os.path.exists(partial_fn)
+        assert not os.path.exists(partial_fn + '.json')
+    finally:
+        t.close()
+
+
+def test_range_resume_changed_resource():
+    t = DownloadTest()
+    try:
+        # partial file was started when resource was an older version
+        t.write_partial(os.urandom(1024 * 1024), '"v0"')
+
+        assert t.manager.download(t.url, t.dst)
+        with open(t.dst, 'rb') as f:
+            assert f.read() == content
+    finally:
+        t.close()
+
+
+def test_partial_without_validator():
+    t = DownloadTest()
+    try:
+        t.write_partial(os.urandom(1024 * 1024))
+
+        assert t.manager.download(t.url, t.dst)
+        assert RangeHandler.requests[0] == ('/oxauth.war', None)
+        with open(t.dst, 'rb') as f:
+            assert f.read() == content
+    finally:
+        t.close()
+
+
+def test_checksum_mismatch():
+    t = DownloadTest()
+    try:
+        assert not t.manager.download(t.url, t.dst, 'sha256:' + '0' * 64)
+        assert not os.path.exists(t.dst)
+        assert not os.path.exists(t.manager.partial_path(t.url))
+        assert t.manager.get_index_entry(t.url) is None
+    finally:
+        t.close()
+
+
+def test_prune_least_recently_used():
+    t = DownloadTest()
+    download_cache_size = Config.get('download_cache_size', 2048)
+    Config.download_cache_size = 0
+    try:
+        assert t.manager.download(t.url, t.dst)
+        url2 = t.url + '?v=2'
+        assert t.manager.download(url2, t.dst + '.2')
+
+        # both urls have the same content, blob is kept for the newest one
+        assert t.manager.get_index_entry(t.url) is None
+        assert t.manager.get_index_entry(url2)
+        blobs = [fn for dirpath, dirnames, filenames in os.walk(os.path.join(t.manager.cache_dir, 'sha256')) for fn in filenames]
+        assert blobs == [hashlib.sha256(content).hexdigest()]
+    finally:
+        Config.download_cache_size = download_cache_size
+        t.close()
@@ -0,0 +1,40 @@
+import os
+
+from setup_app.utils.package_utils import PackageInventory
+
+
+dpkg_status_fn = os.path.join(os.path.dirname(__file__), 'dpkg_status')
+
+
+def test_dpkg_status():
+    inventory = PackageInventory(clone_type='deb', dpkg_status_fn=dpkg_status_fn)
+
+    installed = inventory.is_installed(['apache2', 'rsyslog', 'libc6', 'libc6:amd64', 'libc6:i386', 'libssl3', 'python3-ldap3', 'unzip'])
+
+    assert installed == {
+            'apache2': True,
+            # removed, only configuration files are left
+            'rsyslog': False,
+            # Multi-Arch package is installed for one of its architectures
+            'libc6': True,
+            'libc6:amd64': True,
+            'libc6:i386': False,
+            'libssl3': False,
+            # Status field after Architecture
+            'python3-ldap3': True,
+            'unzip': False,
+            }
+
+
+def test_dpkg_status_read_once():
+    inventory = PackageInventory(clone_type='deb', dpkg_status_fn=dpkg_status_fn)
+    assert inventory.is_installed(['apache2']) == {'apache2': True}
+
+    read_dpkg_status = inventory.read_dpkg_status
+    inventory.read_dpkg_status = lambda: 1 / 0
+    assert inventory.is_installed(['apache2', 'libc6']) == {'apache2': True, 'libc6': True}
+
+    # installed packages are read again after they are forgotten
+    inventory.forget(['apache2'])
+    inventory.read_dpkg_status = read_dpkg_status
+    assert inventory.is_installed(['apache2']) == {'apache2': True}
@@ -1,25 +1,55 @@
 #!/usr/bin/python3
+"""Deletes expired (del=true and exp in the past) entries of Gluu Server
+cache bases. Backends and credentials are read from /etc/gluu/conf/gluu-*.properties,
+so every persistence type (ldap, couchbase, sql, spanner, hybrid) is supported.
+Sessions referenced by ssnId of deleted entries are deleted with them."""
+
+import warnings
+warnings.filterwarnings("ignore")
 
 import os
 import sys
+import json
 import time
+import signal
 import datetime
 import argparse
-import ldap3
+import threading
 import logging
 from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor
 
 cur_dir = os.path.dirname(os.path.realpath(__file__))
+setup_dir = os.path.dirname(os.path.dirname(cur_dir))
 
-parser = argparse.ArgumentParser(description="Gluu Server couchbase cache cleanup script")
-parser.add_argument('-ldap_host', help="LDAP hostname or IP address", default='localhost')
-parser.add_argument('-ldap_bind_dn', help="LDAP bind dn", default='cn=Directory Manager')
-parser.add_argument('-ldap_bind_pw', help="Password for LDAP bind dn")
-parser.add_argument('-log_dir', help="Password for LDAP bind dn", default=cur_dir)
+default_bases = (
+        'ou=tokens,o=gluu',
+        'ou=uma,o=gluu',
+        'ou=clients,o=gluu',
+        'ou=authorizations,o=gluu',
+        'ou=scopes,o=gluu',
+        'ou=metric,o=gluu',
+        'ou=sessions,o=gluu',
+        )
 
-argsp = parser.parse_args()
+parser = argparse.ArgumentParser(description="Gluu Server expired cache entries cleanup script")
+parser.add_argument('-bases', help="Comma seperated base DNs to clean", default=','.join(default_bases))
+parser.add_argument('-batch_size', help="Number of entries deleted per batch", type=int, default=1000)
+parser.add_argument('-ldap_workers', help="Number of LDAP connections deleting entries in parallel", type=int, default=8)
+parser.add_argument('-max_rate', help="Maximum number of deleted entries per second, 0 for unlimited", type=float, default=0)
+parser.add_argument('-offset', help="Delete entries expired at least this many seconds ago", type=int, default=0)
+parser.add_argument('-daemon', help="Keep running and clean periodically", action='store_true')
+parser.add_argument('-interval', help="Seconds between cleanup cycles in daemon mode", type=int, default=300)
+parser.add_argument('-metrics_file', help="Write throughput metrics of last cycle as json to this file")
+parser.add_argument('-log_dir', help="Directory for log files", default=cur_dir)
 
-offset = 0
+# options of former ldap only script, connection parameters are now read from gluu properties
+deprecated_options = ('ldap_host', 'ldap_bind_dn', 'ldap_bind_pw')
+for option in deprecated_options:
+    parser.add_argument('-' + option, help="Deprecated and ignored, read from /etc/gluu/conf/gluu-ldap.properties")
+
+argsp = parser.parse_args()
+sys.argv = [sys.argv[0]]
 
 if not os.path.exists(argsp.log_dir):
     os.makedirs(argsp.log_dir)
@@ -36,80 +66,433 @@ logging.basicConfig(
   format='%(asctime)s %(levelname)s - %(message)s'
 )
 
+for option in deprecated_options:
+    if getattr(argsp, option) is not None:
+        print("Option -{} is deprecated and ignored".format(option))
+        logging.warning("Option -%s is deprecated and ignored", option)
+
+sys.path.insert(0, setup_dir)
+
+import ldap3
+
+from setup_app.utils.arg_parser import arg_parser
+from setup_app import paths
+from setup_app.utils import base
+base.argsp = arg_parser()
+
+from setup_app.static import BackendTypes
+from setup_app.config import Config
+from setup_app.utils.setup_utils import SetupUtils
+from setup_app.utils.collect_properties import CollectProperties
+from setup_app.utils.db_utils import dbUtils
+from setup_app.utils.db_metrics import dbMetrics
+from setup_app.utils.attributes import attribDataTypes
+from setup_app.utils import ldif_utils
+
+import sqlalchemy
+
+Config.init(paths.INSTALL_DIR)
+SetupUtils.init()
+
+session_base = 'ou=sessions,o=gluu'
+session_table = 'oxAuthSessionId'
+
 
 def get_ldap_time_format(dt):
-    return  '{}{:02d}{:02d}{:02d}{:02d}{:02d}.{}Z'.format(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, str(dt.microsecond)[:3])
+    return  '{}{:02d}{:02d}{:02d}{:02d}{:02d}.{}Z'.format(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, str(dt.microsecond).zfill(6)[:3])
 
 
-ldap_host =  argsp.ldap_host
-ldap_bind_dn = argsp.ldap_bind_dn
-ldap_bind_pw = argsp.ldap_bind_pw
-paged_size = 1000
+class RateLimiter:
+    """Limits average number of deleted entries per second, one second of
+    unused capacity can be consumed as a burst"""
 
-ldap_server = ldap3.Server('ldaps://{}:1636'.format(ldap_host), use_ssl=True)
-ldap_conn = ldap3.Connection(ldap_server, user=ldap_bind_dn, password=ldap_bind_pw)
-ldap_conn.bind()
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_time = time.time()
 
+    def throttle(self, count):
+        if not self.rate or not count:
+            return
 
-utc_now = datetime.datetime.utcnow()
-cur_time = get_ldap_time_format(utc_now + datetime.timedelta(seconds=offset))
+        with self.lock:
+            self.next_time = max(self.next_time, time.time() - 1) + count / self.rate
+            delay = self.next_time - time.time()
 
-search_filter = '(&(exp<={0})(del=true))'.format(cur_time)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CleanupStats:
+
+    def __init__(self, base_dn, backend):
+        self.base_dn = base_dn
+        self.backend = backend
+        self.deleted = 0
+        self.sessions = 0
+        self.batches = 0
+        self.errors = 0
+        self.start_time = time.time()
+        self.end_time = None
+
+    def add(self, deleted, sessions=0, errors=0):
+        self.deleted += deleted
+        self.sessions += sessions
+        self.errors += errors
+        self.batches += 1
+
+    def as_dict(self):
+        duration = (self.end_time or time.time()) - self.start_time
+        return {
+                'base': self.base_dn,
+                'backend': self.backend,
+                'deleted': self.deleted,
+                'sessions_deleted': self.sessions,
+                'batches': self.batches,
+                'errors': self.errors,
+                'seconds': round(duration, 3),
+                'entries_per_second': round((self.deleted + self.sessions) / duration, 1) if duration else 0,
+                }
+
+
+class ExpiredEntryCleaner:
+
+    def __init__(self, batch_size, ldap_workers, rate_limiter, stop_event):
+        self.batch_size = batch_size
+        self.ldap_workers = ldap_workers
+        self.rate_limiter = rate_limiter
+        self.stop_event = stop_event
+        self.local = threading.local()
+        self.ldap_pool = None
+        self.spanner_columns = {}
+
+    def clean(self, base_dn, offset=0):
+        """Deletes expired entries under base_dn, returns CleanupStats"""
+
+        expire_time = get_ldap_time_format(datetime.datetime.utcnow() - datetime.timedelta(seconds=offset))
+        backend_location = dbUtils.get_backend_location_for_dn(base_dn)
+        stats = CleanupStats(base_dn, {
+                    BackendTypes.LDAP: 'ldap',
+                    BackendTypes.COUCHBASE: 'couchbase',
+                    BackendTypes.MYSQL: 'mysql',
+                    BackendTypes.PGSQL: 'pgsql',
+                    BackendTypes.SPANNER: 'spanner',
+                    }.get(backend_location, 'unknown'))
+
+        logging.info("Deleting entries of %s expired before %s from %s", base_dn, expire_time, stats.backend)
+
+        try:
+            if backend_location == BackendTypes.LDAP:
+                self.clean_ldap(base_dn, expire_time, stats)
+            elif backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
+                self.clean_rdbm(base_dn, expire_time, stats)
+            elif backend_location == BackendTypes.SPANNER:
+                self.clean_spanner(base_dn, expire_time, stats)
+            elif backend_location == BackendTypes.COUCHBASE:
+                self.clean_couchbase(base_dn, expire_time, stats)
+        except Exception:
+            stats.errors += 1
+            logging.exception("Cleaning %s failed", base_dn)
+
+        stats.end_time = time.time()
+
+        return stats
+
+    # LDAP
+
+    def get_ldap_conn(self):
+        """Returns LDAP connection of current thread"""
+
+        conn = getattr(self.local, 'ldap_conn', None)
+        if conn is None:
+            ldap_server = ldap3.Server(Config.ldap_hostname, port=int(Config.ldaps_port), use_ssl=True)
+            conn = ldap3.Connection(ldap_server, user=Config.ldap_binddn, password=Config.ldapPass, collect_usage=True)
+            dbMetrics.instrument_ldap_connection(conn)
+            conn.bind()
+            self.local.ldap_conn = conn
+
+        return conn
+
+    def delete_ldap_entry(self, dn):
+        conn = self.get_ldap_conn()
+        conn.delete(dn)
+        if conn.result['description'] == 'success':
+            return 1, 0
+        if conn.result['description'] == 'noSuchObject':
+            return 0, 0
+        logging.error("Deleting %s failed: %s", dn, conn.result)
+        return 0, 1
+
+    def delete_ldap_batch(self, entries, stats):
+        session_dns = []
+        for entry in entries:
+            ssn_id = entry['attributes'].get('ssnId')
+            if isinstance(ssn_id, list):
+                ssn_id = ssn_id[0] if ssn_id else None
+            if ssn_id:
+                session_dns.append(ssn_id)
+        session_dns = list(dict.fromkeys(session_dns))
+
+        dns = [entry['dn'] for entry in entries]
+        results = list(self.ldap_pool.map(self.delete_ldap_entry, dns + session_dns))
+
+        deleted = sum([result[0] for result in results[:len(dns)]])
+        sessions = sum([result[0] for result in results[len(dns):]])
+        errors = sum([result[1] for result in results])
+        stats.add(deleted, sessions, errors)
+        logging.info("Deleted %d entries and %d sessions of %s", deleted, sessions, stats.base_dn)
+        self.rate_limiter.throttle(deleted + sessions)
+
+    def clean_ldap(self, base_dn, expire_time, stats):
+        if not self.ldap_pool:
+            self.ldap_pool = ThreadPoolExecutor(max_workers=self.ldap_workers)
+
+        entries = dbUtils.ldap_conn.extend.standard.paged_search(
+                            search_base=base_dn,
+                            search_filter='(&(exp<={})(del=true))'.format(expire_time),
+                            search_scope=ldap3.SUBTREE,
+                            attributes=['ssnId'],
+                            paged_size=self.batch_size,
+                            generator=True
+                            )
+
+        batch = []
+        for entry in entries:
+            if entry.get('type') != 'searchResEntry':
+                continue
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                self.delete_ldap_batch(batch, stats)
+                batch = []
+                if self.stop_event.is_set():
+                    return
+
+        if batch:
+            self.delete_ldap_batch(batch, stats)
+
+    # MySQL, PostgreSQL
+
+    def get_rdbm_tables(self):
+        if dbUtils.Base is None:
+            dbUtils.rdm_automapper()
+
+        tables = []
+        for table in dbUtils.Base.classes.keys():
+            columns = dbUtils.Base.classes[table].__table__.columns
+            if 'exp' in columns and 'del' in columns:
+                tables.append((table, 'ssnId' in columns))
+
+        return tables
+
+    def clean_rdbm(self, base_dn, expire_time, stats):
+        q = '`' if Config.rdbm_type == 'mysql' else '"'
+        params = {
+                'del': dbUtils.get_rdbm_val('del', 'true'),
+                'exp': dbUtils.get_rdbm_val('exp', expire_time),
+                'suffix': '%,' + base_dn,
+                }
+        where_clause = '{0}del{0} = :del AND {0}exp{0} < :exp AND {0}dn{0} LIKE :suffix'.format(q)
+        tables = self.get_rdbm_tables()
+        has_session_table = session_table in dbUtils.Base.classes.keys()
+
+        for table, with_sessions in tables:
+            while not self.stop_event.is_set():
+                session_dns = []
+                with dbUtils.engine.begin() as conn:
+                    if with_sessions:
+                        rows = conn.execute(
+                                    sqlalchemy.text('SELECT {0}doc_id{0}, {0}ssnId{0} FROM {0}{1}{0} WHERE {2} LIMIT {3}'.format(q, table, where_clause, self.batch_size)),
+                                    params
+                                    ).fetchall()
+                        doc_ids = [row[0] for row in rows]
+                        session_dns = list(dict.fromkeys([row[1] for row in rows if row[1]]))
+                        if doc_ids:
+                            conn.execute(
+                                    sqlalchemy.text('DELETE FROM {0}{1}{0} WHERE {0}doc_id{0} IN :doc_ids'.format(q, table)).bindparams(sqlalchemy.bindparam('doc_ids', expanding=True)),
+                                    {'doc_ids': doc_ids}
+                                    )
+                        deleted = len(doc_ids)
+
+                    elif Config.rdbm_type == 'mysql':
+                        result = conn.execute(sqlalchemy.text('DELETE FROM `{}` WHERE {} LIMIT {}'.format(table, where_clause, self.batch_size)), params)
+                        deleted = result.rowcount
+
+                    else:
+                        # PostgreSQL has no DELETE ... LIMIT
+                        result = conn.execute(
+                                    sqlalchemy.text('DELETE FROM "{0}" WHERE "doc_id" IN (SELECT "doc_id" FROM "{0}" WHERE {1} LIMIT {2})'.format(table, where_clause, self.batch_size)),
+                                    params
+                                    )
+                        deleted = result.rowcount
+
+                    sessions = 0
+                    if session_dns and has_session_table:
+                        result = conn.execute(
+                                    sqlalchemy.text('DELETE FROM {0}{1}{0} WHERE {0}dn{0} IN :dns'.format(q, session_table)).bindparams(sqlalchemy.bindparam('dns', expanding=True)),
+                                    {'dns': session_dns}
+                                    )
+                        sessions = result.rowcount
+
+                if deleted:
+                    stats.add(deleted, sessions)
+                    logging.info("Deleted %d entries from %s and %d sessions of %s", deleted, table, sessions, base_dn)
+                    self.rate_limiter.throttle(deleted + sessions)
+
+                if deleted < self.batch_size:
+                    break
+
+    # Spanner
+
+    def clean_spanner(self, base_dn, expire_time, stats):
+        spanner_client = dbUtils.spanner_client
+        tables = spanner_client.get_tables()
+        where_clause = '`del` = true AND `exp` < TIMESTAMP "{}" AND `dn` LIKE "%,{}"'.format(
+                            dbUtils.get_rdbm_val('exp', expire_time, rdbm_type='spanner'),
+                            base_dn
+                            )
+
+        for table in tables:
+            if self.stop_event.is_set():
+                return
+
+            if table not in self.spanner_columns:
+                self.spanner_columns[table] = spanner_client.get_table_columns(table)
+            columns = self.spanner_columns[table]
+            if not ('exp' in columns and 'del' in columns):
+                continue
+
+            # linked sessions are deleted first, so that they are not lost if token deletion fails
+            sessions = 0
+            failed_sessions = 0
+            if 'ssnId' in columns and session_table in tables:
+                session_doc_ids = set()
+                for row in spanner_client.iter_dict_data('SELECT `ssnId` FROM `{}` WHERE {} AND `ssnId` IS NOT NULL'.format(table, where_clause)):
+                    session_doc_ids.add(dbUtils.get_doc_id_from_dn(row['ssnId']))
+                    if len(session_doc_ids) >= self.batch_size:
+                        deleted_sessions, failed = self.delete_spanner_sessions(session_doc_ids)
+                        sessions += deleted_sessions
+                        failed_sessions += failed
+                        session_doc_ids = set()
+                deleted_sessions, failed = self.delete_spanner_sessions(session_doc_ids)
+                sessions += deleted_sessions
+                failed_sessions += failed
+
+            if failed_sessions:
+                # entries are kept, their sessions are deleted in next cycle
+                stats.add(0, sessions, 1)
+                logging.error("Deleting %d sessions linked to expired entries of %s failed, skipping %s", failed_sessions, base_dn, table)
+                continue
+
+            # partitioned DML deletes all matching rows without transaction size limits
+            result = spanner_client.exec_partitioned_dml('DELETE FROM `{}` WHERE {}'.format(table, where_clause))
+            if 'error' in result:
+                stats.add(0, sessions, 1)
+                logging.error("Deleting expired entries from %s failed: %s", table, result['error'])
+                continue
+
+            deleted = int(result.get('stats', {}).get('rowCountLowerBound', 0))
+            stats.add(deleted, sessions)
+            logging.info("Deleted at least %d entries from %s and %d sessions of %s", deleted, table, sessions, base_dn)
+            self.rate_limiter.throttle(deleted + sessions)
+
+    def delete_spanner_sessions(self, doc_ids):
+        """Returns number of deleted and failed sessions"""
+
+        if not doc_ids:
+            return 0, 0
+
+        spanner_client = dbUtils.spanner_client
+        for doc_id in doc_ids:
+            spanner_client.buffer_mutation('delete', table=session_table, pkey=doc_id)
+        result = spanner_client.flush_mutations() or {}
+
+        # buffer_mutation() may flush too, failed rows are collected in both cases
+        failed = len(spanner_client.pop_failed_rows())
+        if result.get('error') and not failed:
+            failed = len(doc_ids)
+        if failed:
+            logging.error("Deleting sessions from %s failed: %s", session_table, result.get('error'))
+
+        return len(doc_ids) - failed, failed
+
+    # Couchbase
+
+    def clean_couchbase(self, base_dn, expire_time, stats):
+        bucket = dbUtils.get_bucket_for_dn(base_dn)
+        session_bucket = dbUtils.get_bucket_for_dn(session_base)
+        key_prefix = ldif_utils.get_key_from(base_dn)
+        n1ql = 'DELETE FROM `{0}` b WHERE META(b).id LIKE "{1}\\\\_%" AND b.del = true AND b.exp < "{2}" LIMIT {3} RETURNING b.ssnId'.format(
+                    bucket,
+                    key_prefix,
+                    attribDataTypes.getTypedValue('datetime', expire_time),
+                    self.batch_size
+                    )
+
+        while not self.stop_event.is_set():
+            result = dbUtils.cbm.exec_query(n1ql)
+            if not result.ok:
+                stats.add(0, 0, 1)
+                logging.error("Deleting expired entries from %s failed: %s", bucket, result.text)
+                return
+
+            results = result.json().get('results', [])
+            session_keys = list(dict.fromkeys([ldif_utils.get_key_from(item['ssnId']) for item in results if item.get('ssnId')]))
+
+            sessions = 0
+            if session_keys:
+                result = dbUtils.cbm.exec_query('DELETE FROM `{}` USE KEYS {} RETURNING META().id'.format(session_bucket, json.dumps(session_keys)))
+                if result.ok:
+                    sessions = len(result.json().get('results', []))
+
+            if results:
+                stats.add(len(results), sessions)
+                logging.info("Deleted %d entries and %d sessions of %s", len(results), sessions, base_dn)
+                self.rate_limiter.throttle(len(results) + sessions)
+
+            if len(results) < self.batch_size:
+                return
+
+
+def main():
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        logging.info("Received signal %d, stopping", signum)
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    CollectProperties().collect_persistence_properties()
+    dbUtils.bind()
+
+    cleaner = ExpiredEntryCleaner(argsp.batch_size, argsp.ldap_workers, RateLimiter(argsp.max_rate), stop_event)
+    bases = [base_dn.strip() for base_dn in argsp.bases.split(',') if base_dn.strip()]
+
+    while not stop_event.is_set():
+        cycle_start_time = time.time()
+        results = []
+
+        for base_dn in bases:
+            if stop_event.is_set():
+                break
+            stats = cleaner.clean(base_dn, argsp.offset)
+            result = stats.as_dict()
+            results.append(result)
+            logging.info("Cleaned %(base)s on %(backend)s: %(deleted)d entries, %(sessions_deleted)d sessions, %(errors)d errors in %(seconds)s seconds (%(entries_per_second)s entries/sec)", result)
+
+        if argsp.metrics_file:
+            with open(argsp.metrics_file, 'w') as w:
+                json.dump({'time': datetime.datetime.utcnow().isoformat(), 'bases': results, 'operations': dbMetrics.get_stats()}, w, indent=2)
+
+        if not argsp.daemon:
+            break
+
+        stop_event.wait(max(0, argsp.interval - (time.time() - cycle_start_time)))
+
+    if cleaner.ldap_pool:
+        cleaner.ldap_pool.shutdown()
 
-base_dn = [
-        'ou=tokens,o=gluu',
-        'ou=uma,o=gluu',
-        'ou=clients,o=gluu',
-        'ou=authorizations,o=gluu',
-        'ou=scopes,o=gluu',
-        'ou=metric,o=gluu',
-        'ou=sessions,o=gluu',
-        ]
-
-def delete_cache(i, dn):
-    logging.info("#%d Deleting DN %s", i, dn)
-    ldap_conn.delete(dn)
-
-for base in base_dn:
-
-    logging.info("Searching expired cache entries for base %s", base)
-
-    retreive_attributes = ['exp']
-    if base == 'ou=tokens,o=gluu':
-        retreive_attributes.append('ssnId')
-
-    ldap_conn.search(search_base = base,
-             search_filter = search_filter,
-             search_scope = ldap3.SUBTREE,
-             attributes = retreive_attributes,
-             paged_size = paged_size)
-
-    print ("ldap_conn.result is of type {} and has value {}".format(type(ldap_conn.result),ldap_conn.result))
-    cookie = ldap_conn.result['controls']['1.2.840.113556.1.4.319']['value']['cookie']
-
-    entry_count = len(ldap_conn.response)
-    total_entries = entry_count
-    logging.info("Reteived %d entries for base %s", entry_count, base)
-    for i, entry in enumerate(ldap_conn.response):
-        delete_cache(i, entry['dn'])
-        if (base == 'ou=tokens,o=gluu' and entry['attributes']['ssnId']):
-            delete_cache(i, entry['attributes']['ssnId'][0])
-
-    while cookie:
-        ldap_conn.search(search_base = base,
-                 search_filter = search_filter,
-                 search_scope = ldap3.SUBTREE,
-                 attributes = retreive_attributes,
-                 paged_size = paged_size,
-                 paged_cookie = cookie)
-        entry_count = len(ldap_conn.response)
-        total_entries += entry_count
-        logging.info("Reteived %d entries for base %s", entry_count, base)
-        cookie = ldap_conn.result['controls']['1.2.840.113556.1.4.319']['value']['cookie']
-        for i, entry in enumerate(ldap_conn.response):
-            delete_cache(i, entry['dn'])
-            if (base == 'ou=tokens,o=gluu' and entry['attributes']['ssnId']):
-                delete_cache(i, entry['attributes']['ssnId'][0])
-
-    logging.info("Deleted %d entries for base %s", total_entries, base)
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+#!/usr/bin/python3
+"""Measures how fast DBUtils.import_ldif loads synthetic data into each
+backend. Backends are replaced by local stand-ins: ldap3 mock connections,
+SQLAlchemy engine (in-memory SQLite by default), in-process fake Couchbase N1QL
+and fake Spanner REST endpoints."""
+
+import warnings
+warnings.filterwarnings("ignore")
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote_plus
+
+cur_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(cur_dir)))
+
+parser = argparse.ArgumentParser(description="Gluu CE ldif import benchmark")
+parser.add_argument('-backends', help="Comma seperated backends to benchmark", default='ldap,sql,couchbase,spanner')
+parser.add_argument('-people', help="Number of people entries", type=int, default=10000)
+parser.add_argument('-clients', help="Number of client entries", type=int, default=1000)
+parser.add_argument('-tokens', help="Number of token entries", type=int, default=10000)
+parser.add_argument('-scripts', help="Number of script entries", type=int, default=100)
+parser.add_argument('-sqlalchemy-uri', help="SQLAlchemy database uri for sql backend", default='sqlite://')
+parser.add_argument('-ldif-dir', help="Directory to write synthetic ldif files, temporary directory is used if not given")
+parser.add_argument('-trace-memory', help="Measure peak memory with tracemalloc (slows down import)", action='store_true')
+parser.add_argument('-output', help="Write results as json to this file")
+argsp = parser.parse_args()
+sys.argv = [sys.argv[0]]
+
+import ldap3
+import sqlalchemy
+import sqlalchemy.orm
+
+from ldap3.utils import dn as dnutils
+
+from setup_app.utils.arg_parser import arg_parser
+from setup_app import paths
+from setup_app import static
+from setup_app.utils import base
+base.argsp = arg_parser()
+
+from setup_app.config import Config
+from setup_app.utils.setup_utils import SetupUtils
+from setup_app.utils.ldif_utils import myLdifParser
+from setup_app.utils.template_engine import CompiledTemplate
+from setup_app.utils.db_utils import DBUtils
+from setup_app.utils.db_metrics import dbMetrics
+from setup_app.utils.ldap_writer import LDAPWriter
+from setup_app.utils.cbm import CBM
+from setup_app.utils.spanner_rest_client import SpannerClient
+from setup_app.pylib.ldif4.ldif import LDIFWriter
+
+Config.init(paths.INSTALL_DIR)
+Config.loadData = True
+SetupUtils.init()
+
+
+class PlaceholderDict(dict):
+    # values of undefined template variables, valid for base64 encoded attributes too
+    def __missing__(self, key):
+        return 'YmVuY2g='
+
+
+# prototype entries: (template, rdn attribute, container)
+prototypes = {
+    'people': (os.path.join(Config.templateFolder, 'oxtrust/people.ldif'), 'inum', 'ou=people,o=gluu'),
+    'clients': (os.path.join(Config.templateFolder, 'scim/clients.ldif'), 'inum', 'ou=clients,o=gluu'),
+    'scripts': (os.path.join(Config.templateFolder, 'scripts.ldif'), 'inum', 'ou=scripts,o=gluu'),
+}
+
+token_prototype = {
+    'objectClass': ['top', 'token'],
+    'authnTime': ['20220101000000.000Z'],
+    'iat': ['20220101000000.000Z'],
+    'exp': ['20220101010000.000Z'],
+    'del': ['true'],
+    'grtId': ['bench-grant'],
+    'grtTyp': ['authorization_code'],
+    'tknTyp': ['access_token'],
+    'usrId': ['admin'],
+    'clnId': ['bench-client'],
+    'scp': ['openid'],
+}
+
+
+def get_prototype_entry(template_fn):
+    template = CompiledTemplate(template_fn, True, None)
+    rendered_fn = os.path.join(tempfile.gettempdir(), 'bench_' + os.path.basename(template_fn))
+    with open(rendered_fn, 'w') as w:
+        w.write(template.render(PlaceholderDict()))
+
+    for dn, entry in myLdifParser(rendered_fn).iter_entries():
+        os.remove(rendered_fn)
+        return entry
+
+
+def generate_ldif(ldif_dir):
+    """Writes one ldif file for each entry type, returns list of file paths"""
+
+    counts = {'people': argsp.people, 'clients': argsp.clients, 'scripts': argsp.scripts, 'tokens': argsp.tokens}
+    ldif_files = []
+
+    for entry_type, count in counts.items():
+        if not count:
+            continue
+
+        if entry_type == 'tokens':
+            prototype, rdn_attr, container = token_prototype, 'tknCde', 'ou=tokens,o=gluu'
+        else:
+            template_fn, rdn_attr, container = prototypes[entry_type]
+            prototype = get_prototype_entry(template_fn)
+
+        ldif_fn = os.path.join(ldif_dir, entry_type + '.ldif')
+        with open(ldif_fn, 'wb') as w:
+            ldif_writer = LDIFWriter(w, cols=1000)
+            for i in range(count):
+                rdn_val = 'BENCH-{}-{:08d}'.format(entry_type.upper(), i)
+                entry = {attr: list(prototype[attr]) for attr in prototype}
+                entry[rdn_attr] = [rdn_val]
+                if entry_type == 'people':
+                    entry['uid'] = ['user{}'.format(i)]
+                    entry['mail'] = ['user{}@bench.gluu.org'.format(i)]
+                elif entry_type == 'scripts':
+                    entry['displayName'] = ['script{}'.format(i)]
+                ldif_writer.unparse('{}={},{}'.format(rdn_attr, rdn_val, container), entry)
+
+        ldif_files.append(ldif_fn)
+        print("Generated {} {} entries to {}".format(count, entry_type, ldif_fn))
+
+    return ldif_files
+
+
+class FakeBackendHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+
+class FakeCouchbaseHandler(FakeBackendHandler):
+    """Accepts N1QL statements, keeps document keys only"""
+
+    documents = set()
+
+    def do_POST(self):
+        body = self.read_body().decode()
+        statement = ''
+        for param in body.split('&'):
+            if param.startswith('statement='):
+                statement = unquote_plus(param[10:])
+
+        results = []
+        if statement.startswith('UPSERT'):
+            for key in re.findall(r'VALUES \("((?:[^"\\]|\\.)*)",', statement):
+                self.documents.add(key)
+        elif statement.startswith('SELECT'):
+            keys = re.findall(r'USE KEYS "([^"]*)"', statement)
+            results = [{} for key in keys if key in self.documents]
+
+        self.send_json({'status': 'success', 'results': results, 'metrics': {'resultCount': len(results)}})
+
+
+class FakeSpannerHandler(FakeBackendHandler):
+    """Implements sessions, executeSql, executeStreamingSql, commit and ddl calls of SpannerClient.
+    Keeps dn of inserted rows to answer dn lookups"""
+
+    rows = {}
+    tables = set()
+
+    def do_POST(self):
+        data = json.loads(self.read_body() or b'{}')
+
+        if self.path.endswith('/sessions'):
+            self.send_json({'name': self.path.split('/v1/', 1)[1] + '/bench'})
+
+        elif self.path.endswith(':commit'):
+            for mutation in data.get('mutations', []):
+                for mutation_type, mutation_data in mutation.items():
+                    self.tables.add(mutation_data['table'])
+                    if mutation_type == 'insert' and 'dn' in mutation_data['columns']:
+                        dn_index = mutation_data['columns'].index('dn')
+                        for values in mutation_data['values']:
+                            self.rows[values[dn_index]] = (mutation_data['table'], values[0])
+            self.send_json({'commitTimestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ')})
+
+        elif self.path.endswith((':executeSql', ':executeStreamingSql')):
+            sql = data.get('sql', '')
+            result = {'metadata': {'rowType': {'fields': []}}}
+            if 'INFORMATION_SCHEMA.TABLES' in sql:
+                result['metadata']['rowType']['fields'] = [{'name': 'TABLE_NAME', 'type': {'code': 'STRING'}}]
+                result['rows'] = [[table] for table in sorted(self.tables)]
+            else:
+                dn_match = re.search(r'WHERE dn="([^"]*)"', sql)
+                table_match = re.search(r'FROM (\S+)', sql)
+                if dn_match and table_match and self.rows.get(dn_match.group(1), (None,))[0] == table_match.group(1):
+                    result['metadata']['rowType']['fields'] = [{'name': 'doc_id', 'type': {'code': 'STRING'}}]
+                    result['rows'] = [[self.rows[dn_match.group(1)][1]]]
+
+            if self.path.endswith(':executeStreamingSql'):
+                # a single PartialResultSet holding values of all rows
+                result = [{'metadata': result['metadata'], 'values': [value for row in result.get('rows', []) for value in row]}]
+            self.send_json(result)
+
+        else:
+            self.send_json({})
+
+    def do_PATCH(self):
+        self.read_body()
+        self.send_json({})
+
+    def do_DELETE(self):
+        self.send_json({})
+
+
+def start_fake_server(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def set_mapping(location):
+    for group in Config.mappingLocations:
+        Config.mappingLocations[group] = location
+
+
+def prepare_ldap(dbUtils):
+    set_mapping('ldap')
+    server = ldap3.Server('bench-ldap')
+    conn = ldap3.Connection(server, user='cn=directory manager', password='bench', client_strategy=ldap3.MOCK_SYNC, collect_usage=True)
+    conn.strategy.add_entry('cn=directory manager', {'userPassword': 'bench', 'sn': 'bench'})
+    conn.bind()
+    dbMetrics.instrument_ldap_connection(conn)
+    dbUtils.ldap_conn = conn
+    dbUtils.moddb = static.BackendTypes.LDAP
+
+    # mock connections of the same server share DIT
+    def make_writer_connection():
+        writer_conn = ldap3.Connection(server, user='cn=directory manager', password='bench', client_strategy=ldap3.MOCK_ASYNC)
+        writer_conn.bind()
+        return writer_conn
+
+    dbUtils.ldap_writer = LDAPWriter(make_writer_connection, Config.ldap_import_connections, Config.ldap_import_in_flight)
+    return 'ldap'
+
+
+def create_sql_tables(dbUtils, ldif_files):
+    """Creates a table for each object class found in ldif files having
+    columns of all attributes of its entries"""
+
+    tables = {}
+    for ldif_fn in ldif_files:
+        for dn, entry in myLdifParser(ldif_fn).iter_entries():
+            table = dbUtils.get_clean_objcet_class(entry)
+            tables.setdefault(table, set()).update([attr for attr in entry if attr.lower() != 'objectclass'])
+
+    if Config.rdbm_type == 'pgsql':
+        from sqlalchemy.dialects.postgresql import JSONB as json_type
+    else:
+        json_type = sqlalchemy.JSON
+
+    metadata = sqlalchemy.MetaData()
+    for table, attributes in tables.items():
+        columns = [
+            sqlalchemy.Column('doc_id', sqlalchemy.String(128), primary_key=True),
+            sqlalchemy.Column('objectClass', sqlalchemy.String(48)),
+            sqlalchemy.Column('dn', sqlalchemy.String(128), index=True),
+            ]
+        for attr in sorted(attributes):
+            sql_type = dbUtils.get_attr_sql_data_type(attr)
+            columns.append(sqlalchemy.Column(attr, json_type if sql_type in ('JSON', 'JSONB') else sqlalchemy.Text))
+        sqlalchemy.Table(table, metadata, *columns)
+
+    metadata.drop_all(dbUtils.engine)
+    metadata.create_all(dbUtils.engine)
+
+
+def prepare_sql(dbUtils, ldif_files):
+    set_mapping('rdbm')
+    backend = argsp.sqlalchemy_uri.split(':', 1)[0].split('+', 1)[0]
+    Config.rdbm_type = 'pgsql' if backend.startswith('postgres') else 'mysql'
+    dbUtils.moddb = static.BackendTypes.PGSQL if Config.rdbm_type == 'pgsql' else static.BackendTypes.MYSQL
+    dbUtils.read_gluu_schema()
+    dbUtils.engine = sqlalchemy.create_engine(argsp.sqlalchemy_uri)
+    dbMetrics.instrument_sqlalchemy_engine(dbUtils.engine, backend)
+    dbUtils.session = sqlalchemy.orm.sessionmaker(bind=dbUtils.engine)()
+    dbUtils.metadata = sqlalchemy.MetaData()
+    dbUtils.Base = None
+    create_sql_tables(dbUtils, ldif_files)
+    return backend
+
+
+def prepare_couchbase(dbUtils):
+    set_mapping('couchbase')
+    server = start_fake_server(FakeCouchbaseHandler)
+    dbUtils.cbm = CBM('127.0.0.1', 'admin', 'bench')
+    dbUtils.cbm.n1ql_api = 'http://127.0.0.1:{}/query/service'.format(server.server_port)
+    dbUtils.moddb = static.BackendTypes.COUCHBASE
+    return 'couchbase'
+
+
+def prepare_spanner(dbUtils, log_dir):
+    set_mapping('rdbm')
+    Config.rdbm_type = 'spanner'
+    server = start_fake_server(FakeSpannerHandler)
+    dbUtils.read_gluu_schema()
+    dbUtils.spanner_client = SpannerClient(
+                project_id='bench',
+                instance_id='bench',
+                database_id='bench',
+                emulator_host='127.0.0.1',
+                emulator_port=server.server_port,
+                log_dir=log_dir,
+                )
+    dbUtils.moddb = static.BackendTypes.SPANNER
+    return 'spanner'
+
+
+def count_entries(ldif_files):
+    return sum([1 for ldif_fn in ldif_files for dn, entry in myLdifParser(ldif_fn).iter_entries()])
+
+
+def run_benchmark(backend_type, ldif_files, log_dir):
+    dbUtils = DBUtils()
+    dbMetrics.reset()
+
+    if backend_type == 'ldap':
+        backend = prepare_ldap(dbUtils)
+    elif backend_type == 'sql':
+        backend = prepare_sql(dbUtils, ldif_files)
+    elif backend_type == 'couchbase':
+        backend = prepare_couchbase(dbUtils)
+    elif backend_type == 'spanner':
+        backend = prepare_spanner(dbUtils, log_dir)
+
+    # round trips of preparation are not counted
+    dbMetrics.reset()
+
+    if argsp.trace_memory:
+        tracemalloc.start()
+
+    start_time = time.time()
+    dbUtils.import_ldif(ldif_files)
+    duration = time.time() - start_time
+
+    peak_memory = None
+    if argsp.trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    entries = count_entries(ldif_files)
+    stats = dbMetrics.get_stats().get(backend, {})
+    round_trips = sum([stats[operation]['count'] for operation in stats if operation != 'dn_exists'])
+
+    return {
+        'backend': backend_type,
+        'entries': entries,
+        'seconds': round(duration, 3),
+        'entries_per_second': round(entries / duration, 1) if duration else None,
+        'round_trips': round_trips,
+        'round_trips_per_entry': round(round_trips / entries, 3) if entries else None,
+        'peak_memory_mb': round(peak_memory / 1024 / 1024, 1) if peak_memory is not None else None,
+        'operations': stats,
+        }
+
+
+def main():
+    ldif_dir = argsp.ldif_dir or tempfile.mkdtemp(prefix='gluu_import_bench_')
+    if not os.path.exists(ldif_dir):
+        os.makedirs(ldif_dir)
+
+    ldif_files = generate_ldif(ldif_dir)
+    results = []
+
+    for backend_type in argsp.backends.split(','):
+        backend_type = backend_type.strip()
+        if backend_type not in ('ldap', 'sql', 'couchbase', 'spanner'):
+            print("Unknown backend {}, skipping".format(backend_type))
+            continue
+        print("Importing to {} ...".format(backend_type))
+        results.append(run_benchmark(backend_type, ldif_files, ldif_dir))
+
+    print()
+    print('{:<10} {:>9} {:>9} {:>12} {:>14} {:>10}'.format('backend', 'entries', 'seconds', 'entries/sec', 'trips/entry', 'peak MB'))
+    for result in results:
+        print('{:<10} {:>9} {:>9} {:>12} {:>14} {:>10}'.format(
+                result['backend'],
+                result['entries'],
+                result['seconds'],
+                result['entries_per_second'],
+                result['round_trips_per_entry'],
+                result['peak_memory_mb'] if result['peak_memory_mb'] is not None else '-'
+                ))
+
+    if argsp.output:
+        with open(argsp.output, 'w') as w:
+            json.dump(results, w, indent=2)
+        print("Results were written to", argsp.output)
+
+    if not argsp.ldif_dir:
+        shutil.rmtree(ldif_dir)
+
+
+if __name__ == '__main__':
+    main()
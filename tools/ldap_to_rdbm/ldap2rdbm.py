@@ -4,6 +4,7 @@ warnings.filterwarnings("ignore")
 import os
 import sys
 import json
+import copy
 import argparse
 
 from collections import OrderedDict
@@ -49,6 +50,7 @@ from setup_app.installers.gluu import GluuInstaller
 from setup_app.utils.ldif_utils import myLdifParser
 from setup_app.installers.opendj import OpenDjInstaller
 from setup_app.installers.rdbm import RDBMInstaller
+from setup_app.utils.schema_registry import schemaRegistry
 from setup_app.pylib.ldif4.ldif import LDIFWriter
 from ldap3.utils import dn as dnutils
 
@@ -108,13 +110,12 @@ gluuInstaller.deleteLdapPw()
 print("Migrating Statistic Data")
 
 stat_ldif_parser = myLdifParser(static_ldif_fn)
-stat_ldif_parser.parse()
 
 migrated_static_ldif_fn = static_ldif_fn + '.migrated'
 with open(migrated_static_ldif_fn, 'wb') as w:
     stat_ldif_writer = LDIFWriter(w, cols=10000)
 
-    for dn, entry in stat_ldif_parser.entries:
+    for dn, entry in stat_ldif_parser.iter_entries():
         rd_list = dnutils.parse_dn(dn)
         stat_ou = rd_list[1][1]
         if not rd_list[0][1].endswith(f'_{stat_ou}'):
@@ -144,10 +145,13 @@ for obcls_s in parser.entries[0][1]['objectClasses']:
     schema['objectClasses'].append(obcls_dict)
 
 
-current_attributes = gluuInstaller.dbUtils.search("ou=attributes,o=gluu", fetchmany=True)
+multivalued_attributes = set()
+for dn, entry in gluuInstaller.dbUtils.iter_search("ou=attributes,o=gluu"):
+    if entry.get('oxMultivaluedAttribute'):
+        multivalued_attributes.add(entry['gluuAttributeName'])
 
-with open(os.path.join(Config.install_dir, 'schema/custom_schema.json')) as f:
-    gluu_custom_schma = json.load(f)
+# schema registry objects are shared, we modify and write back a copy
+gluu_custom_schma = copy.deepcopy(schemaRegistry.get_schema_file('custom_schema.json'))
 
 
 for custom_ocl in gluu_custom_schma['objectClasses']:
@@ -162,10 +166,8 @@ for cur_ocl in schema['objectClasses']:
             if cur_anme not in gluu_custom_ocl_names:
                 for cur_atr in schema['attributeTypes']:
                     if cur_atr['names'][0] == cur_anme:
-                        for dn, entry in current_attributes:
-                            if entry['gluuAttributeName'] == cur_anme:
-                                    if entry.get('oxMultivaluedAttribute'):
-                                        cur_atr['multivalued'] = True
+                        if cur_anme in multivalued_attributes:
+                            cur_atr['multivalued'] = True
 
                         gluu_custom_schma['attributeTypes'].append(cur_atr)
                         custom_ocl['may'].append(cur_anme)
@@ -203,14 +205,13 @@ rdbmInstaller.create_tables(schmema_files)
 
 print("Re-formatting data. This will take a while...")
 cur_data_parser = myLdifParser(current_ldif_fn)
-cur_data_parser.parse()
 
 current_ldif_tmp_fn = current_ldif_fn + '~'
 
 with open(current_ldif_tmp_fn, 'wb') as w:
     ldif_writer = LDIFWriter(w, cols=10000)
 
-    for dn, entry in cur_data_parser.entries:
+    for dn, entry in cur_data_parser.iter_entries():
         if 'gluuAttribute' in entry['objectClass']:
             entry['description'][0] = entry['description'][0][:768]
         ldif_writer.unparse(dn, entry)
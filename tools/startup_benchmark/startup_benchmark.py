@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+"""Measures import time of setup modules and setup.py commands with
+python3 -X importtime and fails if it exceeds a budget."""
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+cur_dir = os.path.dirname(os.path.realpath(__file__))
+setup_dir = os.path.dirname(os.path.dirname(cur_dir))
+
+default_modules = 'setup_app.config,setup_app.utils.properties_utils,setup_app.utils.db_utils,setup_app.utils.collect_properties,setup_app.installers.gluu'
+
+# setup.py imports paths and base before other modules, so do we
+module_prelude = 'from setup_app import paths; from setup_app.utils import base; '
+
+# maintenance commands (--help, -csx, --plan-only, -x, --shell) are expected
+# to start within this budget, they must not import drivers and installers
+default_budget_ms = 500
+
+parser = argparse.ArgumentParser(description="Gluu CE setup startup benchmark")
+parser.add_argument('-modules', help="Comma seperated modules to import", default=default_modules)
+parser.add_argument('-command', help="setup.py arguments to measure instead of modules, can be given more than once", action='append')
+parser.add_argument('-runs', help="Number of runs, fastest run is reported", type=int, default=5)
+parser.add_argument('-top', help="Number of slowest imports to show", type=int, default=15)
+parser.add_argument('-budget-ms', help="Exit with error if import time exceeds this budget (milliseconds), 0 disables", type=float, default=default_budget_ms)
+parser.add_argument('-output', help="Write results as json to this file")
+argsp = parser.parse_args()
+
+importtime_re = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)')
+
+
+def parse_importtime(stderr):
+    """Returns total import time and cumulative time of each module in microseconds"""
+    total = 0
+    modules = {}
+    for l in stderr.splitlines():
+        m = importtime_re.match(l)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4)
+        modules[name] = max(modules.get(name, 0), cumulative)
+        # nested imports are indented, top level ones have single space
+        if indent == 1:
+            total += cumulative
+
+    return total, modules
+
+
+def measure(name, cmd):
+    best = None
+    for _ in range(max(1, argsp.runs)):
+        result = subprocess.run(cmd, cwd=setup_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        total, modules = parse_importtime(result.stderr)
+        if best is None or total < best['total_us']:
+            best = {'name': name, 'returncode': result.returncode, 'total_us': total, 'modules': modules}
+
+    return best
+
+
+targets = []
+if argsp.command:
+    for command in argsp.command:
+        targets.append(('setup.py ' + command, [sys.executable, '-X', 'importtime', 'setup.py'] + command.split()))
+else:
+    for module in argsp.modules.split(','):
+        targets.append((module, [sys.executable, '-X', 'importtime', '-c', module_prelude + 'import ' + module]))
+
+results = []
+over_budget = False
+
+for name, cmd in targets:
+    result = measure(name, cmd)
+    results.append(result)
+    total_ms = result['total_us'] / 1000
+
+    print(name)
+    print("  Import time (ms)".ljust(40) + '{:.1f}'.format(total_ms).rjust(12))
+    if result['returncode']:
+        print("  Exit code".ljust(40) + str(result['returncode']).rjust(12))
+        # a module which can't be imported is not measured
+        if not argsp.command:
+            over_budget = True
+    for module, cumulative in sorted(result['modules'].items(), key=lambda item: item[1], reverse=True)[:argsp.top]:
+        print('    ' + module.ljust(36) + '{:.1f}'.format(cumulative / 1000).rjust(12))
+
+    if argsp.budget_ms and total_ms > argsp.budget_ms:
+        print("  Exceeds budget of {} ms".format(argsp.budget_ms))
+        over_budget = True
+    print()
+
+if argsp.output:
+    with open(argsp.output, 'w') as w:
+        json.dump(results, w, indent=2)
+
+sys.exit(1 if over_budget else 0)